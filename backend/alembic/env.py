@@ -49,22 +49,32 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
+def do_run_migrations(connection) -> None:
+    # One transaction per migration, and managed by alembic rather than the
+    # connection, so migrations can use op.get_context().autocommit_block()
+    # for batched data copies and CREATE INDEX CONCURRENTLY
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        transaction_per_migration=True,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
 async def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
+    # Tests pass the database to migrate in config.attributes["url"]
     connectable = create_async_engine(
-        get_url(),
+        config.attributes.get("url") or get_url(),
         poolclass=pool.NullPool,
     )
 
     async with connectable.connect() as connection:
-        await connection.run_sync(
-            lambda sync_conn: context.configure(
-                connection=sync_conn, target_metadata=target_metadata
-            )
-        )
-
-        async with connection.begin():
-            await connection.run_sync(lambda sync_conn: context.run_migrations())
+        await connection.run_sync(do_run_migrations)
+
+    await connectable.dispose()
 
 
 if context.is_offline_mode():
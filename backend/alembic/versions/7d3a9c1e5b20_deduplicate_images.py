@@ -0,0 +1,133 @@
+"""deduplicate images
+
+Moves image_link into a content-addressed image table keyed by the sha256 of the
+url, with one narrow link table per owner. Rows are copied in batches of
+image_link ids outside of a long-running transaction, and every statement is
+idempotent so an interrupted copy can be resumed by running the upgrade again.
+
+Revision ID: 7d3a9c1e5b20
+Revises: 2b702867c8af
+Create Date: 2025-02-16 14:02:11.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3a9c1e5b20'
+down_revision: Union[str, None] = '2b702867c8af'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10000
+
+URL_HASH = "encode(sha256(convert_to({}.url, 'UTF8')), 'hex')"
+
+# (link table, owner column, owner table)
+OWNER_LINKS = [
+    ('recipe_image', 'recipe_id', 'recipe'),
+    ('instruction_step_image', 'instruction_step_id', 'instruction_step'),
+    ('ingredient_image', 'ingredient_id', 'ingredient'),
+]
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image (
+            width INTEGER NOT NULL,
+            url VARCHAR NOT NULL,
+            id SERIAL PRIMARY KEY,
+            url_hash VARCHAR(64) NOT NULL UNIQUE
+        )
+        """
+    )
+    for link_table, owner_column, owner_table in OWNER_LINKS:
+        op.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {link_table} (
+                {owner_column} INTEGER NOT NULL
+                    REFERENCES {owner_table} (id) ON DELETE CASCADE,
+                image_id INTEGER NOT NULL REFERENCES image (id) ON DELETE CASCADE,
+                PRIMARY KEY ({owner_column}, image_id)
+            )
+            """
+        )
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{link_table}_image_id "
+            f"ON {link_table} (image_id)"
+        )
+
+    # Each statement commits on its own, so no batch holds locks for long
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        max_id = bind.execute(sa.text("SELECT max(id) FROM image_link")).scalar()
+
+        for start in range(0, (max_id or 0) + 1, BATCH_SIZE):
+            params = {"start": start, "end": start + BATCH_SIZE}
+            bind.execute(
+                sa.text(
+                    f"""
+                    INSERT INTO image (url, width, url_hash)
+                    SELECT DISTINCT ON (url_hash) url, width, url_hash
+                    FROM (
+                        SELECT id, url, width, {URL_HASH.format('image_link')} AS url_hash
+                        FROM image_link
+                        WHERE id >= :start AND id < :end
+                    ) AS batch
+                    ORDER BY url_hash, id
+                    ON CONFLICT (url_hash) DO NOTHING
+                    """
+                ),
+                params,
+            )
+            for link_table, owner_column, _ in OWNER_LINKS:
+                bind.execute(
+                    sa.text(
+                        f"""
+                        INSERT INTO {link_table} ({owner_column}, image_id)
+                        SELECT DISTINCT image_link.{owner_column}, image.id
+                        FROM image_link
+                        JOIN image
+                            ON image.url_hash = {URL_HASH.format('image_link')}
+                        WHERE image_link.id >= :start AND image_link.id < :end
+                            AND image_link.{owner_column} IS NOT NULL
+                        ON CONFLICT DO NOTHING
+                        """
+                    ),
+                    params,
+                )
+
+    op.drop_table('image_link')
+
+
+def downgrade() -> None:
+    op.create_table('image_link',
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('url', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ingredient_id', sa.Integer(), nullable=True),
+    sa.Column('instruction_step_id', sa.Integer(), nullable=True),
+    sa.Column('recipe_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['ingredient_id'], ['ingredient.id'], ),
+    sa.ForeignKeyConstraint(['instruction_step_id'], ['instruction_step.id'], ),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipe.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Each owner gets its own copy of the row again
+    for link_table, owner_column, _ in OWNER_LINKS:
+        op.execute(
+            f"""
+            INSERT INTO image_link (url, width, {owner_column})
+            SELECT image.url, image.width, {link_table}.{owner_column}
+            FROM {link_table}
+            JOIN image ON image.id = {link_table}.image_id
+            """
+        )
+    for link_table, _, _ in OWNER_LINKS:
+        op.drop_table(link_table)
+    op.drop_table('image')
@@ -0,0 +1,218 @@
+"""canonical ingredients
+
+Adds ingredient.canonical_id and merges ingredients stored under different
+names for the same canonical name. Names are merged in batches outside of a
+long-running transaction, and every statement is idempotent so an interrupted
+merge can be resumed by running the upgrade again.
+
+The naming rules and merge statements are copied from
+src/gousto_fetcher/canonical.py and src/maintenance.py as they were when this
+revision was written, so later changes to those don't change what it does.
+Rerun scripts.canonicalize_ingredients to apply newer rules.
+
+Revision ID: 9b6e1f4d2c78
+Revises: e2b4c7d91f58
+Create Date: 2025-03-02 11:36:54.208719
+
+"""
+import re
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b6e1f4d2c78'
+down_revision: Union[str, None] = 'e2b4c7d91f58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+# src.changes.CHANGE_LOG_LOCK_KEY, taken while adding to the change log
+CHANGE_LOG_LOCK_KEY = 0x63686C67
+
+DESCRIPTORS = {"fresh", "british", "free range", "organic"}
+IRREGULAR_PLURALS = {
+    "leaves": "leaf",
+    "loaves": "loaf",
+    "halves": "half",
+    "cookies": "cookie",
+    "brownies": "brownie",
+    "molasses": "molasses",
+}
+ALIASES = {
+    "cilantro": "coriander",
+    "coriander leaf": "coriander",
+    "scallion": "spring onion",
+    "green onion": "spring onion",
+    "eggplant": "aubergine",
+    "zucchini": "courgette",
+    "garlic": "garlic clove",
+    "chick pea": "chickpea",
+}
+
+# Each statement takes arrays of (alias id, kept id) or (kept id, canonical name)
+MERGE_CHANGES = sa.text(
+    """
+    INSERT INTO change_log (entity, entity_id, op, data)
+    SELECT 'ingredient', id, 'delete', json_build_object('name', name)
+    FROM ingredient
+    WHERE id = ANY(CAST(:alias_ids AS INTEGER[]))
+    UNION ALL
+    SELECT 'ingredient', id, 'upsert', json_build_object('name', name)
+    FROM unnest(CAST(:keep_ids AS INTEGER[]), CAST(:names AS TEXT[])) AS kept (id, name)
+    UNION ALL
+    SELECT 'recipe', id, 'upsert', json_build_object('slug', slug, 'title', title)
+    FROM recipe
+    WHERE id IN (
+        SELECT recipe_id FROM recipe_ingredient_link
+        WHERE ingredient_id = ANY(CAST(:alias_ids AS INTEGER[]))
+    )
+    ON CONFLICT (entity, entity_id) DO UPDATE SET
+        version = DEFAULT, op = EXCLUDED.op, data = EXCLUDED.data, changed_at = now()
+    """
+)
+TOUCH_RECIPES = sa.text(
+    """
+    UPDATE recipe SET updated_at = now()
+    WHERE id IN (
+        SELECT recipe_id FROM recipe_ingredient_link
+        WHERE ingredient_id = ANY(CAST(:alias_ids AS INTEGER[]))
+    )
+    """
+)
+MERGE_LINKS = sa.text(
+    """
+    WITH moved AS (
+        DELETE FROM recipe_ingredient_link AS link
+        USING unnest(
+            CAST(:alias_ids AS INTEGER[]), CAST(:alias_keep_ids AS INTEGER[])
+        ) AS merge (alias_id, keep_id)
+        WHERE link.ingredient_id = merge.alias_id
+        RETURNING link.recipe_id, merge.keep_id, link.ingredient_id, link.amount
+    )
+    INSERT INTO recipe_ingredient_link (recipe_id, ingredient_id, amount)
+    SELECT recipe_id, keep_id, string_agg(amount, ' + ' ORDER BY ingredient_id)
+    FROM moved
+    GROUP BY recipe_id, keep_id
+    ON CONFLICT (recipe_id, ingredient_id) DO UPDATE SET
+        amount = recipe_ingredient_link.amount || ' + ' || EXCLUDED.amount
+    """
+)
+RENAME_KEPT = sa.text(
+    """
+    UPDATE ingredient SET name = kept.name, canonical_id = NULL
+    FROM unnest(CAST(:keep_ids AS INTEGER[]), CAST(:names AS TEXT[])) AS kept (id, name)
+    WHERE ingredient.id = kept.id
+    """
+)
+REDIRECT_ALIASES = sa.text(
+    """
+    UPDATE ingredient SET canonical_id = merge.keep_id
+    FROM unnest(
+        CAST(:alias_ids AS INTEGER[]), CAST(:alias_keep_ids AS INTEGER[])
+    ) AS merge (alias_id, keep_id)
+    WHERE ingredient.id = merge.alias_id
+    """
+)
+
+
+def canonical_name(name: str) -> str:
+    name = unicodedata.normalize("NFKD", name.casefold())
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    name = name.replace("&", " and ")
+    name = " ".join(re.findall(r"[^\W_]+", name))
+    stripped = True
+    while stripped:
+        stripped = False
+        for descriptor in DESCRIPTORS:
+            if name.startswith(descriptor + " "):
+                name = name[len(descriptor) + 1 :]
+                stripped = True
+
+    words = name.split(" ")
+    word = words[-1]
+    if word in IRREGULAR_PLURALS:
+        word = IRREGULAR_PLURALS[word]
+    elif word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    words[-1] = word
+    name = " ".join(words)
+    return ALIASES.get(name, name)
+
+
+def merge_duplicates(connection) -> None:
+    rows = connection.execute(
+        sa.text("SELECT id, name, canonical_id FROM ingredient ORDER BY id")
+    ).all()
+    groups: dict[str, list] = {}
+    for row in rows:
+        groups.setdefault(canonical_name(row.name), []).append(row)
+
+    merges = []
+    for name, group in groups.items():
+        keep = next((row for row in group if row.name == name), group[0])
+        aliases = [
+            row for row in group if row is not keep and row.canonical_id != keep.id
+        ]
+        if keep.name == name and keep.canonical_id is None and not aliases:
+            continue
+        merges.append((keep.id, name, [row.id for row in aliases]))
+
+    for start in range(0, len(merges), BATCH_SIZE):
+        batch = merges[start : start + BATCH_SIZE]
+        params = {
+            "keep_ids": [keep_id for keep_id, _, _ in batch],
+            "names": [name for _, name, _ in batch],
+            "alias_ids": [
+                alias_id for _, _, alias_ids in batch for alias_id in alias_ids
+            ],
+            "alias_keep_ids": [
+                keep_id for keep_id, _, alias_ids in batch for _ in alias_ids
+            ],
+        }
+        connection.execute(
+            sa.text("SELECT pg_advisory_lock(:key)"), {"key": CHANGE_LOG_LOCK_KEY}
+        )
+        try:
+            connection.execute(MERGE_CHANGES, params)
+        finally:
+            connection.execute(
+                sa.text("SELECT pg_advisory_unlock(:key)"),
+                {"key": CHANGE_LOG_LOCK_KEY},
+            )
+        connection.execute(TOUCH_RECIPES, params)
+        connection.execute(MERGE_LINKS, params)
+        connection.execute(RENAME_KEPT, params)
+        # Set last, which marks a name as done
+        connection.execute(REDIRECT_ALIASES, params)
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE ingredient ADD COLUMN IF NOT EXISTS canonical_id INTEGER
+            REFERENCES ingredient (id) ON DELETE CASCADE
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_ingredient_canonical_id "
+        "ON ingredient (canonical_id)"
+    )
+
+    # Each statement commits on its own, so no batch holds locks for long
+    with op.get_context().autocommit_block():
+        merge_duplicates(op.get_bind())
+
+
+def downgrade() -> None:
+    # Merged ingredients stay merged, their rows just stop pointing at it
+    op.drop_index('ix_ingredient_canonical_id', table_name='ingredient')
+    op.drop_column('ingredient', 'canonical_id')
@@ -0,0 +1,90 @@
+"""index audit
+
+Adds the indexes the endpoints' queries rely on and makes the slug and username
+indexes unique. Every index is built with CREATE INDEX CONCURRENTLY so writes
+are never blocked; an interrupted build leaves an invalid index behind, which
+is dropped and rebuilt when the upgrade is run again.
+
+Revision ID: a41f6e2c9d83
+Revises: 7d3a9c1e5b20
+Create Date: 2025-02-18 19:27:45.106351
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41f6e2c9d83'
+down_revision: Union[str, None] = '7d3a9c1e5b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, column)
+NEW_INDEXES = [
+    ('ix_recipe_ingredient_link_ingredient_id', 'recipe_ingredient_link', 'ingredient_id'),
+    ('ix_instruction_step_recipe_id', 'instruction_step', 'recipe_id'),
+]
+
+# Existing non-unique indexes that become unique: (index name, table, column)
+UNIQUE_INDEXES = [
+    ('ix_recipe_slug', 'recipe', 'slug'),
+    ('ix_bad_recipe_slug_slug', 'bad_recipe_slug', 'slug'),
+]
+
+
+def _remove_duplicates() -> None:
+    # Concurrent adds of the same slug could have inserted it twice. Keep the
+    # oldest row; everything hanging off a recipe is removed by ON DELETE CASCADE.
+    # Duplicate usernames are not resolved automatically, the index build fails instead
+    for table in ('recipe', 'bad_recipe_slug'):
+        op.execute(
+            f"""
+            DELETE FROM {table} AS duplicate
+            USING {table} AS original
+            WHERE duplicate.slug = original.slug AND duplicate.id > original.id
+            """
+        )
+
+
+def upgrade() -> None:
+    _remove_duplicates()
+
+    with op.get_context().autocommit_block():
+        for index_name, table, column in NEW_INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY {index_name} ON {table} ({column})'
+            )
+
+        # Build the unique index next to the old one, then swap them
+        for index_name, table, column in UNIQUE_INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}_unique')
+            op.execute(
+                f'CREATE UNIQUE INDEX CONCURRENTLY {index_name}_unique '
+                f'ON {table} ({column})'
+            )
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+            op.execute(f'ALTER INDEX {index_name}_unique RENAME TO {index_name}')
+
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_user_username')
+        op.execute(
+            'CREATE UNIQUE INDEX CONCURRENTLY ix_user_username ON "user" (username)'
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_user_username')
+
+        for index_name, table, column in UNIQUE_INDEXES:
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY {index_name}_non_unique '
+                f'ON {table} ({column})'
+            )
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+            op.execute(f'ALTER INDEX {index_name}_non_unique RENAME TO {index_name}')
+
+        for index_name, _, _ in NEW_INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
@@ -0,0 +1,44 @@
+"""recipe updated_at
+
+Adds recipe.updated_at for incremental exports (?since=). Existing recipes get
+the time of the migration, as their real creation time was never recorded.
+
+Revision ID: c5e08b7f2a16
+Revises: a41f6e2c9d83
+Create Date: 2025-02-21 10:12:37.640219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e08b7f2a16'
+down_revision: Union[str, None] = 'a41f6e2c9d83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # now() is evaluated once, so this doesn't rewrite the table
+    op.add_column(
+        'recipe',
+        sa.Column(
+            'updated_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_recipe_updated_at')
+        op.execute(
+            'CREATE INDEX CONCURRENTLY ix_recipe_updated_at ON recipe (updated_at)'
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipe_updated_at', table_name='recipe')
+    op.drop_column('recipe', 'updated_at')
@@ -0,0 +1,64 @@
+"""change log
+
+Adds the change log behind /changes, seeded with an upsert for every existing
+recipe and ingredient so a client starting from version 0 gets the whole
+catalogue.
+
+Revision ID: e2b4c7d91f58
+Revises: c5e08b7f2a16
+Create Date: 2025-02-23 16:48:02.917364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b4c7d91f58'
+down_revision: Union[str, None] = 'c5e08b7f2a16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('change_log',
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('entity', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=True),
+    sa.Column('changed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('version')
+    )
+    op.create_index('ix_change_log_entity', 'change_log', ['entity', 'entity_id'], unique=True)
+    op.create_table('change_log_horizon',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    op.execute(
+        """
+        INSERT INTO change_log (entity, entity_id, op, data)
+        SELECT 'ingredient', id, 'upsert', json_build_object('name', name)
+        FROM ingredient
+        ORDER BY id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO change_log (entity, entity_id, op, data)
+        SELECT 'recipe', id, 'upsert', json_build_object('slug', slug, 'title', title)
+        FROM recipe
+        ORDER BY id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('change_log_horizon')
+    op.drop_index('ix_change_log_entity', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,104 @@
+"""
+Benchmark the authentication hot path before and after offloading bcrypt and caching principals
+
+Measures:
+- how long the event loop is stalled while concurrent logins verify passwords
+- how many authenticated requests per second get_current_user can resolve
+"""
+
+# run with uv run -m scripts.bench_auth --username admin --password password
+
+import argparse
+import asyncio
+import time
+
+from dotenv import load_dotenv
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+load_dotenv()
+
+from src import auth  # noqa: E402
+from src.database import engine  # noqa: E402
+from src.models import UserInDB  # noqa: E402
+
+
+async def measure_loop_stall(coroutine_factory, concurrency: int) -> tuple[float, float]:
+    """
+    Runs concurrency coroutines and a 1ms ticker alongside them.
+    Returns (elapsed seconds, worst ticker delay in ms)
+    """
+    worst_delay = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal worst_delay
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            worst_delay = max(worst_delay, time.perf_counter() - start - 0.001)
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(coroutine_factory() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker_task
+    return elapsed, worst_delay * 1000
+
+
+async def bench_login(hashed_password: str, password: str, concurrency: int):
+    async def inline():
+        auth.verify_password(password, hashed_password)
+
+    async def offloaded():
+        await auth.verify_password_async(password, hashed_password)
+
+    for name, factory in (("inline bcrypt", inline), ("offloaded bcrypt", offloaded)):
+        elapsed, worst_delay = await measure_loop_stall(factory, concurrency)
+        print(
+            f"{name:<20} {concurrency / elapsed:>8.1f} logins/s"
+            f"  worst event loop stall {worst_delay:>8.1f} ms"
+        )
+
+
+async def bench_current_user(token: str, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        async with semaphore:
+            async with AsyncSession(engine) as session:
+                await auth.get_current_user(token, session)
+
+    for name, ttl in (("no principal cache", 0.0), ("principal cache", 30.0)):
+        auth.principal_cache.clear()
+        auth.principal_cache.ttl = ttl
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20} {requests / elapsed:>8.1f} authenticated requests/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the authentication path")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    async with AsyncSession(engine) as session:
+        statement = select(UserInDB).where(UserInDB.username == args.username)
+        user = (await session.exec(statement)).one()
+
+    await bench_login(user.hashed_password, args.password, args.logins)
+
+    token = auth.create_access_token(data={"sub": user.username})
+    await bench_current_user(token, args.requests, args.concurrency)
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Benchmark read throughput under concurrent load for different engine configurations
+"""
+
+# run with uv run -m scripts.bench_db_pool --concurrency 64 --duration 10
+
+import argparse
+import asyncio
+import random
+import time
+from dataclasses import replace
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+load_dotenv()
+
+from src.database import (DATABASE_URL, EngineSettings,  # noqa: E402
+                          create_engine_from_settings)
+from src.models import (Ingredient, InstructionStep, Recipe,  # noqa: E402
+                        RecipeIngredientLink)
+
+CONFIGURATIONS = {
+    "baseline (echo, default pool)": replace(
+        EngineSettings.for_profile("development"),
+        echo=True,
+        slow_statement_seconds=None,
+        pool_pre_ping=False,
+        pool_recycle=-1,
+    ),
+    "development": EngineSettings.for_profile("development"),
+    "production": EngineSettings.for_profile("production"),
+    "production, no statement cache": replace(
+        EngineSettings.for_profile("production"),
+        statement_cache_size=0,
+        prepared_statement_cache_size=0,
+    ),
+}
+
+
+def detail_statement(slug: str):
+    return (
+        select(Recipe)
+        .where(Recipe.slug == slug)
+        .options(
+            selectinload(Recipe.instruction_steps).selectinload(InstructionStep.images),
+            selectinload(Recipe.images),
+            selectinload(Recipe.ingredients)
+            .selectinload(RecipeIngredientLink.ingredient)
+            .selectinload(Ingredient.images),
+        )
+    )
+
+
+async def run_configuration(
+    name: str, settings: EngineSettings, concurrency: int, duration: float
+):
+    engine = create_engine_from_settings(DATABASE_URL, settings)
+
+    async with AsyncSession(engine) as session:
+        slugs = (await session.exec(select(Recipe.slug))).all()
+    if not slugs:
+        raise RuntimeError("No recipes in the database to benchmark against")
+
+    completed = 0
+    errors = 0
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal completed, errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                async with AsyncSession(engine) as session:
+                    if random.random() < 0.2:
+                        (await session.exec(select(Recipe.slug, Recipe.title))).all()
+                    else:
+                        statement = detail_statement(random.choice(slugs))
+                        (await session.exec(statement)).one_or_none()
+                completed += 1
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+    print(
+        f"{name:<35} {completed / elapsed:>10.1f} req/s"
+        f"  p50 {p50:>7.2f} ms  p99 {p99:>7.2f} ms  errors {errors}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark database engine profiles")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} concurrent clients, {args.duration}s per configuration")
+    for name, settings in CONFIGURATIONS.items():
+        await run_configuration(name, settings, args.concurrency, args.duration)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
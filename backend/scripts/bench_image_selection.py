@@ -0,0 +1,56 @@
+"""
+Compare payload size and latency of recipe detail responses with and without image selection
+"""
+
+# run with uv run -m scripts.bench_image_selection --recipes 50
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+BASE_URL = "http://127.0.0.1:8000"  # Adjust the base URL as needed
+
+VARIANTS = {
+    "all images": {},
+    "image_profile=thumb": {"image_profile": "thumb"},
+    "image_profile=card": {"image_profile": "card"},
+    "image_profile=print": {"image_profile": "print"},
+}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark image selection")
+    parser.add_argument("--recipes", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=20.0) as client:
+        response = await client.get("/recipes/list")
+        response.raise_for_status()
+        slugs = [recipe["slug"] for recipe in response.json()]
+        slugs = random.sample(slugs, min(args.recipes, len(slugs)))
+
+        for name, params in VARIANTS.items():
+            sizes: list[int] = []
+            latencies: list[float] = []
+            for _ in range(args.repeats):
+                for slug in slugs:
+                    start = time.perf_counter()
+                    response = await client.get(f"/recipes/slug/{slug}", params=params)
+                    latencies.append(time.perf_counter() - start)
+                    response.raise_for_status()
+                    sizes.append(len(response.content))
+
+            print(
+                f"{name:<22} mean {statistics.mean(sizes) / 1024:>8.1f} KiB"
+                f"  p50 {statistics.median(latencies) * 1000:>7.2f} ms"
+                f"  mean {statistics.mean(latencies) * 1000:>7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""
+Benchmark request throughput of recipe detail requests with SQLAlchemy's echo
+against statement logging through the logging queue, every statement or only
+slow ones. Log output goes to a temporary file rather than the terminal,
+optionally with every write delayed, like a pipe to a log collector that is
+falling behind. Configurations take turns for several rounds, and the median
+is reported.
+"""
+
+# run with uv run -m scripts.bench_logging --concurrency 16 --write-latency 0.001
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+from dataclasses import replace
+
+import httpx
+from dotenv import load_dotenv
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+load_dotenv()
+# One client sends every request here, which the rate limit would throttle
+os.environ["CLIENT_RATE_LIMIT"] = "0"
+
+from src.database import (DATABASE_URL, EngineSettings,  # noqa: E402
+                          create_engine_from_settings, get_read_session,
+                          get_session)
+from src.logs import configure_logging, stop_logging  # noqa: E402
+from src.main import app  # noqa: E402
+from src.models import Recipe  # noqa: E402
+
+PRODUCTION = EngineSettings.for_profile("production")
+
+class SlowFile(io.TextIOWrapper):
+    def __init__(self, latency: float):
+        super().__init__(tempfile.TemporaryFile())
+        self.latency = latency
+
+    def write(self, text: str) -> int:
+        time.sleep(self.latency)
+        return super().write(text)
+
+
+CONFIGURATIONS = {
+    "echo (before)": replace(PRODUCTION, echo=True, slow_statement_seconds=None),
+    "no SQL logging": replace(PRODUCTION, slow_statement_seconds=None),
+    "queue, every statement": replace(PRODUCTION, slow_statement_seconds=0.0),
+    "queue, slow statements only": PRODUCTION,
+}
+
+
+async def run_configuration(
+    settings: EngineSettings, log_file, concurrency: int, duration: float
+) -> float:
+    # echo has a handler of its own, the queue would write everything twice
+    if settings.echo:
+        stop_logging()
+    else:
+        configure_logging(log_file)
+    # echo writes to whatever stdout is when the engine is created
+    with contextlib.redirect_stdout(log_file):
+        engine = create_engine_from_settings(DATABASE_URL, settings)
+
+    async def session_override():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = session_override
+    app.dependency_overrides[get_read_session] = session_override
+
+    async with AsyncSession(engine) as session:
+        slugs = (await session.exec(select(Recipe.slug))).all()
+    if not slugs:
+        raise RuntimeError("No recipes in the database to benchmark against")
+
+    completed = 0
+    deadline = time.perf_counter() + duration
+    transport = httpx.ASGITransport(app=app)
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal completed
+        while time.perf_counter() < deadline:
+            response = await client.get(f"/recipes/slug/{random.choice(slugs)}")
+            response.raise_for_status()
+            completed += 1
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return completed / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQL logging")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument(
+        "--write-latency", type=float, default=0.0, help="Seconds per log write"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{args.concurrency} concurrent clients, {args.rounds} rounds of"
+        f" {args.duration}s per configuration, {args.write_latency * 1000:g} ms"
+        " per log write"
+    )
+    rates: dict[str, list[float]] = {name: [] for name in CONFIGURATIONS}
+    with SlowFile(args.write_latency) as log_file:
+        # Warm the app's caches and the database's first
+        await run_configuration(PRODUCTION, log_file, args.concurrency, 1.0)
+        for _ in range(args.rounds):
+            for name, settings in CONFIGURATIONS.items():
+                rates[name].append(
+                    await run_configuration(
+                        settings, log_file, args.concurrency, args.duration
+                    )
+                )
+    baseline = statistics.median(rates["echo (before)"])
+    for name, values in rates.items():
+        median = statistics.median(values)
+        print(
+            f"{name:<30} {median:>8.1f} req/s  {median / baseline - 1:>+7.1%}"
+            f"  (min {min(values):.1f}, max {max(values):.1f})"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
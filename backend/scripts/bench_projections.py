@@ -0,0 +1,100 @@
+"""
+Benchmark queries, latency and response size of recipe detail projections
+"""
+
+# run with uv run -m scripts.bench_projections --requests 200
+
+import argparse
+import asyncio
+import random
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+load_dotenv()
+
+from src.database import get_engine  # noqa: E402
+from src.models import Recipe, RecipePublic  # noqa: E402
+from src.queries import (load_best_images, parse_projection,  # noqa: E402
+                         project_recipe, projection_options,
+                         recipe_detail_options)
+
+# ?fields= and ?include= for each projection, as sent to /recipes/slug
+PROJECTIONS = {
+    "full": (None, None),
+    "tile (title, rating, images)": ("title,rating", "images"),
+    "title only": ("title", None),
+    "steps": ("title", "steps"),
+    "steps with images": ("title", "steps.images"),
+    "ingredients": ("title", "ingredients"),
+    "ingredients with images": ("title", "ingredients.images"),
+}
+
+
+async def load(session: AsyncSession, slug: str, projection, width) -> str:
+    options = (
+        recipe_detail_options(width is None)
+        if projection.is_full
+        else projection_options(projection, width is None)
+    )
+    result = await session.exec(
+        select(Recipe).where(Recipe.slug == slug).options(*options)
+    )
+    recipe = result.one()
+    if width is not None and projection.includes_images:
+        await load_best_images(session, [recipe], width)
+    if projection.is_full:
+        return RecipePublic.model_validate(recipe).model_dump_json()
+    return project_recipe(recipe, projection).model_dump_json(exclude_unset=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark recipe projections")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--image-width", type=int, default=None)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+
+    async with AsyncSession(engine) as session:
+        slugs = (await session.exec(select(Recipe.slug))).all()
+    if not slugs:
+        raise RuntimeError("No recipes in the database to benchmark against")
+    chosen = [random.choice(slugs) for _ in range(args.requests)]
+
+    print(f"{args.requests} sequential loads per projection")
+    print(f"{'projection':<30} {'queries':>8} {'p50 ms':>8} {'p99 ms':>8} {'bytes':>8}")
+    for name, (fields, include) in PROJECTIONS.items():
+        projection = parse_projection(fields, include)
+        statements = 0
+        latencies: list[float] = []
+        size = 0
+        for slug in chosen:
+            start = time.perf_counter()
+            async with AsyncSession(engine) as session:
+                size += len(await load(session, slug, projection, args.image_width))
+            latencies.append(time.perf_counter() - start)
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(
+            f"{name:<30} {statements / len(chosen):>8.1f} {p50:>8.2f} {p99:>8.2f}"
+            f" {size // len(chosen):>8}"
+        )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
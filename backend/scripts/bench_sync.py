@@ -0,0 +1,116 @@
+"""
+Benchmark a full crawl, and optionally ingest, against a local mock of the Gousto API
+"""
+
+# run with uv run -m scripts.bench_sync --recipes 10000 --latency-ms 50 --throttle-rate 0.05
+# --ingest N also adds N of the recipes to the DATABASE_URL database
+
+import argparse
+import asyncio
+import os
+import socket
+import time
+
+from aiohttp import ClientSession, web
+from dotenv import load_dotenv
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+load_dotenv()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# The fetcher reads the API url on import
+PORT = free_port()
+os.environ["GOUSTO_API_URL"] = f"http://127.0.0.1:{PORT}"
+
+from fastapi import HTTPException  # noqa: E402
+
+from src.database import get_engine  # noqa: E402
+from src.gousto_fetcher import fetcher, get_all_recipe_slugs  # noqa: E402
+from src.gousto_fetcher.synthetic import (MockFaults,  # noqa: E402
+                                          SyntheticCatalogue, create_mock_app)
+from src.main import add_recipe  # noqa: E402
+
+
+async def ingest(slugs: list[str], concurrency: int) -> None:
+    engine = get_engine()
+    latencies: list[float] = []
+    failures: dict[int, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def add(slug: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with AsyncSession(engine) as session:
+                    await add_recipe(slug, session)
+                latencies.append(time.perf_counter() - start)
+            except HTTPException as e:
+                failures[e.status_code] = failures.get(e.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(add(slug) for slug in slugs))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+    print(
+        f"Ingested {len(latencies)} recipes in {elapsed:.1f}s"
+        f" ({len(latencies) / elapsed:.1f}/s), p50 {p50:.1f} ms, p99 {p99:.1f} ms,"
+        f" failures by status {failures}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark crawl and ingest")
+    parser.add_argument("--recipes", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--max-in-flight", type=int, default=0)
+    parser.add_argument("--ingest", type=int, default=0)
+    parser.add_argument("--ingest-concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    faults = MockFaults(
+        latency_seconds=args.latency_ms / 1000,
+        jitter_seconds=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        max_in_flight=args.max_in_flight,
+    )
+    runner = web.AppRunner(
+        create_mock_app(SyntheticCatalogue(args.recipes, args.seed), faults)
+    )
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    print(f"Mock Gousto with {args.recipes} recipes and {faults}")
+
+    start = time.perf_counter()
+    slugs = await get_all_recipe_slugs()
+    elapsed = time.perf_counter() - start
+    print(
+        f"Crawled {len(slugs)} slugs in {elapsed:.2f}s,"
+        f" concurrency limit ended at {fetcher.limiter.limit:.1f}"
+    )
+
+    if args.ingest:
+        await ingest(slugs[: args.ingest], args.ingest_concurrency)
+
+    async with ClientSession() as session:
+        async with session.get(f"http://127.0.0.1:{PORT}/_stats") as response:
+            print(f"Mock responses by status: {await response.json()}")
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+"""
+Build the SQLite read snapshot at READ_SNAPSHOT_PATH from Postgres
+
+The backend rebuilds it after every write through the API; run this to create
+the first one, or after changing the database some other way.
+"""
+
+# run with uv run -m scripts.build_read_snapshot
+
+import asyncio
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.database import READ_SNAPSHOT_PATH, engine  # noqa: E402
+from src.read_snapshot import build_read_snapshot  # noqa: E402
+
+
+async def main():
+    if READ_SNAPSHOT_PATH is None:
+        raise ValueError("READ_SNAPSHOT_PATH must be set")
+
+    start = time.perf_counter()
+    try:
+        row_counts = await build_read_snapshot(READ_SNAPSHOT_PATH)
+    finally:
+        await engine.dispose()
+
+    for table, rows in row_counts.items():
+        print(f"{table:<25} {rows:>10} rows")
+    print(f"built {READ_SNAPSHOT_PATH} in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
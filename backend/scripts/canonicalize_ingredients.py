@@ -0,0 +1,46 @@
+"""
+Merge ingredients stored under different names for the same canonical name
+
+The migration adding canonical names merges the existing ones; run this again
+after changing the rules or the alias table in src/gousto_fetcher/canonical.py.
+"""
+
+# run with uv run -m scripts.canonicalize_ingredients --batch-size 1000
+
+import argparse
+import asyncio
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.database import READ_SNAPSHOT_PATH, engine  # noqa: E402
+from src.maintenance import (GC_BATCH_SIZE,  # noqa: E402
+                             merge_duplicate_ingredients)
+from src.read_snapshot import build_read_snapshot  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Merge duplicate ingredients")
+    parser.add_argument("--batch-size", type=int, default=GC_BATCH_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        async with engine.connect() as connection:
+            connection = await connection.execution_options(
+                isolation_level="AUTOCOMMIT"
+            )
+            merged = await connection.run_sync(
+                merge_duplicate_ingredients, args.batch_size
+            )
+        if READ_SNAPSHOT_PATH and merged:
+            await build_read_snapshot(READ_SNAPSHOT_PATH)
+    finally:
+        await engine.dispose()
+    print(f"merged {merged} ingredients in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""
+Delete ingredients no recipe uses and images nothing links to, and compact the
+change log
+
+Runs once by default, or every --interval seconds when given (e.g. as a
+long-running job next to the backend).
+"""
+
+# run with uv run -m scripts.collect_garbage --batch-size 1000 --interval 3600
+
+import argparse
+import asyncio
+import time
+
+from dotenv import load_dotenv
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+load_dotenv()
+
+from src.changes import compact_change_log  # noqa: E402
+from src.database import READ_SNAPSHOT_PATH, engine  # noqa: E402
+from src.maintenance import GC_BATCH_SIZE, collect_garbage  # noqa: E402
+from src.read_snapshot import build_read_snapshot  # noqa: E402
+
+
+async def run_once(batch_size: int):
+    start = time.perf_counter()
+    async with AsyncSession(engine) as session:
+        result = await collect_garbage(session, batch_size)
+        compacted = await compact_change_log(session)
+    # Orphaned ingredients are still listed by the read snapshot until it's rebuilt
+    if READ_SNAPSHOT_PATH and (result.ingredients or result.images):
+        await build_read_snapshot(READ_SNAPSHOT_PATH)
+    print(
+        f"deleted {result.ingredients} ingredients and {result.images} images,"
+        f" compacted {compacted} change log entries"
+        f" in {time.perf_counter() - start:.2f} s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Collect orphaned rows")
+    parser.add_argument("--batch-size", type=int, default=GC_BATCH_SIZE)
+    parser.add_argument(
+        "--interval", type=float, default=None, help="Seconds between runs"
+    )
+    args = parser.parse_args()
+
+    try:
+        while True:
+            await run_once(args.batch_size)
+            if args.interval is None:
+                break
+            await asyncio.sleep(args.interval)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
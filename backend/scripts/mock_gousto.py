@@ -0,0 +1,48 @@
+"""
+Serve a synthetic catalogue from a local mock of the Gousto API
+"""
+
+# run with uv run -m scripts.mock_gousto --recipes 50000 --latency-ms 50 --throttle-rate 0.05
+# then start the backend with GOUSTO_API_URL=http://127.0.0.1:8090
+
+import argparse
+
+from aiohttp import web
+
+from src.gousto_fetcher.synthetic import (MockFaults, SyntheticCatalogue,
+                                          create_mock_app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Gousto API")
+    parser.add_argument("--recipes", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=0,
+        help="Concurrent requests beyond this get 429s, 0 for no limit",
+    )
+    args = parser.parse_args()
+
+    catalogue = SyntheticCatalogue(args.recipes, args.seed)
+    faults = MockFaults(
+        latency_seconds=args.latency_ms / 1000,
+        jitter_seconds=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        max_in_flight=args.max_in_flight,
+    )
+    print(f"Serving {args.recipes} synthetic recipes with {faults}")
+    print(f"export GOUSTO_API_URL=http://{args.host}:{args.port}")
+    web.run_app(create_mock_app(catalogue, faults), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Report row counts and on-disk size of the image tables, and recipe detail latency
+
+Run before and after a migration that changes the image tables to compare them.
+Latency is measured through the running backend, so it works with either schema.
+"""
+
+# run with uv run -m scripts.report_image_storage --samples 200
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+load_dotenv()
+
+from src.database import engine  # noqa: E402
+
+BASE_URL = "http://127.0.0.1:8000"  # Adjust the base URL as needed
+
+IMAGE_TABLES = [
+    "image_link",
+    "image",
+    "recipe_image",
+    "instruction_step_image",
+    "ingredient_image",
+]
+
+
+async def scalar(session: AsyncSession, sql: str, **params):
+    result = await session.exec(text(sql), params=params)
+    return result.scalar()
+
+
+async def report_tables():
+    async with AsyncSession(engine) as session:
+        print(f"{'table':<25} {'rows':>10} {'total size':>12}")
+        for table in IMAGE_TABLES:
+            if await scalar(session, "SELECT to_regclass(:table)", table=table) is None:
+                continue
+            rows = await scalar(session, f"SELECT count(*) FROM {table}")
+            size = await scalar(
+                session,
+                "SELECT pg_size_pretty(pg_total_relation_size(:table))",
+                table=table,
+            )
+            print(f"{table:<25} {rows:>10} {size:>12}")
+    await engine.dispose()
+
+
+async def report_latency(samples: int):
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=20.0) as client:
+        response = await client.get("/recipes/list")
+        response.raise_for_status()
+        slugs = [recipe["slug"] for recipe in response.json()]
+
+        latencies = []
+        for slug in random.sample(slugs, min(samples, len(slugs))):
+            start = time.perf_counter()
+            response = await client.get(f"/recipes/slug/{slug}")
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    if latencies:
+        latencies.sort()
+        print(
+            f"\nrecipe detail over {len(latencies)} recipes:"
+            f" p50 {statistics.median(latencies) * 1000:.2f} ms"
+            f"  p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Report image storage")
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    await report_tables()
+    await report_latency(args.samples)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+"""
+Export the recipe catalogue to a snapshot file, or load one into an empty database
+
+Import into a freshly migrated database (uv run alembic upgrade head) at the
+same revision the snapshot was taken from.
+"""
+
+# run with uv run -m scripts.snapshot export catalogue.snapshot
+#       or uv run -m scripts.snapshot import catalogue.snapshot
+
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.database import engine  # noqa: E402
+from src.snapshot import export_snapshot, import_snapshot  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Export or import a snapshot")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        if args.command == "export":
+            manifest = await export_snapshot(engine, args.path)
+        else:
+            manifest = await import_snapshot(engine, args.path)
+    finally:
+        await engine.dispose()
+    elapsed = time.perf_counter() - start
+
+    for table in manifest["tables"]:
+        print(f"{table['name']:<25} {table['rows']:>10} rows")
+    print(
+        f"{args.command}ed {args.path} ({args.path.stat().st_size / 1024:.0f} KiB,"
+        f" revision {manifest['alembic_revision']}) in {elapsed:.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,208 @@
+# Admission control for DB-heavy endpoints: per-client rate limits, then a
+# concurrency limit per group of routes with a short bounded queue, so a spike
+# gets fast 429s and 503s instead of piling up on the connection pool
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import AsyncGenerator
+
+from fastapi import HTTPException, Request
+from jwt.exceptions import InvalidTokenError
+
+from .auth import decode_access_token
+from .models import AdmissionStats
+from .recipe_cards import PDF_RENDER_WORKERS
+
+# Requests each group runs at once. Together they should fit in the DB pool
+# (pool_size + max_overflow, 30 with DB_PROFILE=production). Card requests
+# keep the render processes busy rather than the pool, one each
+ADMISSION_LIMITS = {
+    "detail": int(os.getenv("ADMISSION_DETAIL_LIMIT", "16")),
+    "list": int(os.getenv("ADMISSION_LIST_LIMIT", "8")),
+    "cards": int(os.getenv("ADMISSION_CARDS_LIMIT", str(PDF_RENDER_WORKERS))),
+}
+# Requests waiting per group beyond the limit, and for how long, before a 503
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(
+    os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2")
+)
+
+# Sustained requests per second and burst allowed per client (user of a valid
+# bearer token, or IP address when there isn't one) across these endpoints, 0 disables
+CLIENT_RATE_LIMIT = float(os.getenv("CLIENT_RATE_LIMIT", "20"))
+CLIENT_RATE_BURST = float(os.getenv("CLIENT_RATE_BURST", "40"))
+# Least recently seen clients are forgotten beyond this, which only resets
+# their bucket to full
+CLIENT_RATE_MAX_CLIENTS = 10_000
+
+
+class AdmissionRejected(Exception):
+    """Exception raised when a request can't be admitted in time."""
+
+
+class AdmissionController:
+    """
+    Runs up to limit requests at once, queueing up to queue_size more for at
+    most timeout seconds each. A finished request hands its slot straight to
+    the oldest waiter.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        """
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out.
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise AdmissionRejected(f"{self.name} queue is full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            self.rejected += 1
+            raise AdmissionRejected(f"{self.name} queue timed out") from None
+        except asyncio.CancelledError:
+            self._forget(waiter)
+            raise
+        self.admitted += 1
+
+    def _forget(self, waiter: asyncio.Future) -> None:
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        elif waiter.done() and not waiter.cancelled():
+            # Handed a slot just as it gave up, so pass it on
+            self.release()
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> AdmissionStats:
+        return AdmissionStats(
+            name=self.name,
+            limit=self.limit,
+            active=self.active,
+            queued=len(self._waiters),
+            admitted=self.admitted,
+            rejected=self.rejected,
+        )
+
+
+class ClientRateLimiter:
+    """
+    A token bucket per client, refilled at rate per second up to burst
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.rejected = 0
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, client: str) -> float:
+        """
+        Take a token for client, returning 0 if there was one, or else the
+        seconds until there will be
+        """
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+            self.rejected += 1
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+def client_key(request: Request) -> str:
+    """
+    The user a valid bearer token is for, or the IP address otherwise, so made
+    up tokens can't each get a bucket of their own
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            subject = decode_access_token(token).get("sub")
+        except (InvalidTokenError, ValueError):
+            subject = None
+        if subject is not None:
+            return f"user:{subject}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+client_rate_limiter = ClientRateLimiter(
+    CLIENT_RATE_LIMIT, CLIENT_RATE_BURST, CLIENT_RATE_MAX_CLIENTS
+)
+controllers = {
+    name: AdmissionController(
+        name, limit, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT_SECONDS
+    )
+    for name, limit in ADMISSION_LIMITS.items()
+}
+
+
+def admission(group: str):
+    """
+    A route dependency that rate limits the client, then holds one of the
+    group's slots until the endpoint returns
+    """
+    controller = controllers[group]
+
+    async def admit(request: Request) -> AsyncGenerator[None, None]:
+        wait = client_rate_limiter.take(client_key(request))
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+        try:
+            await controller.acquire()
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server busy: {e}",
+                headers={"Retry-After": str(math.ceil(controller.timeout))},
+            ) from e
+        try:
+            yield
+        finally:
+            controller.release()
+
+    return admit
+
+
+def admission_stats() -> list[AdmissionStats]:
+    return [controller.stats() for controller in controllers.values()]
@@ -1,4 +1,6 @@
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Annotated, Optional
 
@@ -8,11 +10,13 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from passlib.context import CryptContext
+from sqlalchemy import event
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from .cache import TTLCache
 from .database import get_session
-from .models import User, UserInDB
+from .models import UserInDB
 
 load_dotenv()
 
@@ -21,13 +25,31 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Checked on use rather than at import, so the app can still start and report
+# the problem from /readyz
 SECRET_KEY = os.environ.get("SECRET_KEY")
-if not SECRET_KEY:
-    raise ValueError("SECRET_KEY environment variable must be set")
+
+
+def get_secret_key() -> str:
+    if not SECRET_KEY:
+        raise ValueError("SECRET_KEY environment variable must be set")
+    return SECRET_KEY
 
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt takes tens of milliseconds per call, so it runs on a small dedicated pool
+# instead of the event loop. Bounded so a burst of logins can't starve other threads
+BCRYPT_MAX_WORKERS = int(os.environ.get("BCRYPT_MAX_WORKERS", "2"))
+_bcrypt_executor = ThreadPoolExecutor(
+    max_workers=BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt"
+)
+
+# Authenticated users are cached by token subject for a short time, so bulk
+# scripts don't run a user query on every call. Set to 0 to disable
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", "30"))
+principal_cache: TTLCache[UserInDB] = TTLCache(ttl=PRINCIPAL_CACHE_TTL)
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -37,16 +59,36 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _bcrypt_executor, verify_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, get_password_hash, password)
+
+
+@event.listens_for(UserInDB, "after_insert")
+@event.listens_for(UserInDB, "after_update")
+@event.listens_for(UserInDB, "after_delete")
+def _invalidate_principal_cache(_mapper, _connection, _target):
+    # Users change rarely, and a rename would leave the old subject cached, so drop everything
+    principal_cache.clear()
+
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, get_secret_key(), algorithm=ALGORITHM)
     return encoded_jwt
 
 
 def decode_access_token(token: str):
-    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    return jwt.decode(token, get_secret_key(), algorithms=[ALGORITHM])
 
 
 async def get_current_user(
@@ -66,12 +108,19 @@ async def get_current_user(
     except InvalidTokenError:
         raise credentials_exception
 
+    cached_user = principal_cache.get(username)
+    if cached_user is not None:
+        return cached_user
+
     statement = select(UserInDB).where(UserInDB.username == username)
     result = await session.exec(statement)
     user = result.one_or_none()
 
     if user is None:
         raise credentials_exception
+
+    # Cache a detached copy, the session's instance is expired on its next commit
+    principal_cache.set(username, UserInDB.model_validate(user))
     return user
 
 
@@ -84,6 +133,6 @@ async def authenticate_user(
 
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
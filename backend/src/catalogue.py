@@ -0,0 +1,478 @@
+# In-memory columnar copy of the recipe catalogue, for random picks and facet counts
+
+import asyncio
+import math
+import os
+import random
+import re
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass
+from heapq import nlargest
+from typing import Callable, Hashable, Iterable, Optional
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .database import get_engine
+from .models import (Ingredient, IngredientCount, IngredientFacet,
+                     IngredientPair, IngredientPairs, PrepTimeFacet,
+                     RatingFacet, Recipe, RecipeFacets, RecipeIngredientLink,
+                     RecipeSummary)
+
+# Writes through this worker are applied straight away, but writes through other
+# workers are only picked up by a full reload once the catalogue is this old
+CATALOGUE_REFRESH_SECONDS = float(os.getenv("CATALOGUE_REFRESH_SECONDS", "60"))
+
+PREP_TIME_FACETS = [15, 30, 45, 60]
+RATING_FACETS = [4.0, 4.5]
+
+# Filter bitmasks kept between requests, each n_recipes / 8 bytes
+MASK_CACHE_SIZE = 128
+# Ingredient suggestions kept until the next change to the catalogue
+SUGGESTION_CACHE_SIZE = 1024
+
+_word = re.compile(r"\w+")
+
+
+def name_tokens(name: str) -> list[str]:
+    return _word.findall(name.casefold())
+
+
+@dataclass(frozen=True)
+class CatalogueFilter:
+    max_prep_time: Optional[int] = None
+    min_rating: Optional[float] = None
+    max_ingredients: Optional[int] = None
+    ingredient_ids: tuple[int, ...] = ()
+
+
+def _nth_set_bit(mask: int, n: int) -> int:
+    # Binary search on prefix popcounts, each one a single pass in C
+    low, high = 0, mask.bit_length() - 1
+    while low < high:
+        middle = (low + high) // 2
+        if (mask & ((2 << middle) - 1)).bit_count() > n:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def _set_bits(mask: int) -> list[int]:
+    return [position for position, bit in enumerate(bin(mask)[:1:-1]) if bit == "1"]
+
+
+class RecipeCatalogue:
+    """
+    Every recipe gets a position, and its fields are stored in one array per
+    column at that position, with the ingredient ids of all recipes packed
+    into one array (ingredient_offsets[p] to ingredient_offsets[p + 1]).
+    That's around 60 bytes of arrays per recipe, plus its slug, title and an
+    entry in the id to position lookup.
+
+    Sets of recipes are ints used as bitmasks over positions, so filters
+    combine with & and are counted with bit_count, both running in C. Masks
+    for individual filters are cached and kept up to date as recipes are added.
+    Removed recipes keep their position but are cleared from the alive mask.
+
+    Ingredient co-occurrence, the sparse product of the recipe by ingredient
+    matrix with its transpose, is kept as one Counter of ingredient ids per
+    ingredient and updated as recipes are added and removed. Its diagonal
+    is the number of recipes using each ingredient.
+
+    Ingredient names are indexed for suggestions as a sorted list of (token,
+    ingredient id), so the names with a token starting with a prefix are one
+    contiguous slice found by bisection. New names are inserted in place.
+    """
+
+    def __init__(self):
+        self.recipe_ids = array("q")
+        self.prep_times = array("h")  # -1 when unknown
+        self.ratings = array("d")  # nan when unknown
+        self.ingredient_counts = array("H")
+        self.ingredient_offsets = array("I", [0])
+        self.ingredient_ids = array("I")
+        self.slugs: list[str] = []
+        self.titles: list[str] = []
+        self.ingredient_names: dict[int, str] = {}
+        self.positions: dict[int, int] = {}
+        self.cooccurrence: dict[int, Counter[int]] = {}
+        self.name_index: list[tuple[str, int]] = []
+        self.alive = 0
+        self.loaded_at = time.monotonic()
+        self._masks: OrderedDict[Hashable, int] = OrderedDict()
+        self._suggestions: OrderedDict[Hashable, list[IngredientCount]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return self.alive.bit_count()
+
+    def add(
+        self,
+        recipe_id: int,
+        slug: str,
+        title: str,
+        prep_time: Optional[int],
+        rating: Optional[float],
+        ingredients: Iterable[tuple[int, str]],
+    ) -> None:
+        self.remove(recipe_id)
+        position = len(self.recipe_ids)
+
+        self.recipe_ids.append(recipe_id)
+        self.prep_times.append(-1 if prep_time is None else prep_time)
+        self.ratings.append(math.nan if rating is None else rating)
+        self.slugs.append(slug)
+        self.titles.append(title)
+        for ingredient_id, name in ingredients:
+            self.ingredient_ids.append(ingredient_id)
+            self._index_name(ingredient_id, name)
+        self.ingredient_offsets.append(len(self.ingredient_ids))
+        self.ingredient_counts.append(
+            self.ingredient_offsets[-1] - self.ingredient_offsets[-2]
+        )
+
+        ingredient_ids = self._recipe_ingredients(position)
+        for ingredient_id in ingredient_ids:
+            self.cooccurrence.setdefault(ingredient_id, Counter()).update(
+                ingredient_ids
+            )
+
+        self.positions[recipe_id] = position
+        self.alive |= 1 << position
+        self._suggestions.clear()
+        for key in self._masks:
+            if self._matches(key, position):
+                self._masks[key] |= 1 << position
+
+    def remove(self, recipe_id: int) -> None:
+        position = self.positions.pop(recipe_id, None)
+        if position is None:
+            return
+        self.alive &= ~(1 << position)
+        self._suggestions.clear()
+
+        ingredient_ids = self._recipe_ingredients(position)
+        for ingredient_id in ingredient_ids:
+            counts = self.cooccurrence[ingredient_id]
+            counts.subtract(ingredient_ids)
+            for other_id in ingredient_ids:
+                if not counts[other_id]:
+                    del counts[other_id]
+            if not counts:
+                del self.cooccurrence[ingredient_id]
+
+    def _index_name(self, ingredient_id: int, name: str) -> None:
+        old_name = self.ingredient_names.get(ingredient_id)
+        if old_name == name:
+            return
+        if old_name is not None:
+            for token in set(name_tokens(old_name)):
+                index = bisect_left(self.name_index, (token, ingredient_id))
+                del self.name_index[index]
+        for token in set(name_tokens(name)):
+            insort(self.name_index, (token, ingredient_id))
+        self.ingredient_names[ingredient_id] = name
+
+    def _recipe_ingredients(self, position: int) -> array:
+        start, end = self.ingredient_offsets[position : position + 2]
+        return self.ingredient_ids[start:end]
+
+    def _matches(self, key: Hashable, position: int) -> bool:
+        kind, value = key
+        if kind == "max_prep_time":
+            return 0 <= self.prep_times[position] <= value
+        if kind == "min_rating":
+            return self.ratings[position] >= value
+        if kind == "max_ingredients":
+            return self.ingredient_counts[position] <= value
+        if kind == "ingredient":
+            return value in self._recipe_ingredients(position)
+        raise ValueError(f"Unknown filter {kind!r}")
+
+    def _mask(self, kind: str, value) -> int:
+        key = (kind, value)
+        mask = self._masks.get(key)
+        if mask is None:
+            # One pass over a column the first time a filter value is used
+            bits = bytearray(len(self.recipe_ids) // 8 + 1)
+            for position in range(len(self.recipe_ids)):
+                if self._matches(key, position):
+                    bits[position >> 3] |= 1 << (position & 7)
+            mask = int.from_bytes(bits, "little")
+            self._masks[key] = mask
+            while len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        self._masks.move_to_end(key)
+        return mask
+
+    def filter(self, catalogue_filter: CatalogueFilter) -> int:
+        mask = self.alive
+        if catalogue_filter.max_prep_time is not None:
+            mask &= self._mask("max_prep_time", catalogue_filter.max_prep_time)
+        if catalogue_filter.min_rating is not None:
+            mask &= self._mask("min_rating", catalogue_filter.min_rating)
+        if catalogue_filter.max_ingredients is not None:
+            mask &= self._mask("max_ingredients", catalogue_filter.max_ingredients)
+        for ingredient_id in catalogue_filter.ingredient_ids:
+            mask &= self._mask("ingredient", ingredient_id)
+        return mask
+
+    def random(
+        self,
+        catalogue_filter: CatalogueFilter,
+        count: int = 1,
+        rng: Optional[random.Random] = None,
+    ) -> list[RecipeSummary]:
+        """
+        Up to count distinct recipes matching the filter, picked uniformly
+        """
+        randrange = (rng or random).randrange
+        mask = self.filter(catalogue_filter)
+        picks = []
+        for _ in range(min(count, mask.bit_count())):
+            position = _nth_set_bit(mask, randrange(mask.bit_count()))
+            mask &= ~(1 << position)
+            picks.append(
+                RecipeSummary(slug=self.slugs[position], title=self.titles[position])
+            )
+        return picks
+
+    def facets(
+        self, catalogue_filter: CatalogueFilter, ingredient_limit: int = 10
+    ) -> RecipeFacets:
+        """
+        Counts of the recipes matching the filter, overall and per facet value
+        """
+        mask = self.filter(catalogue_filter)
+
+        ingredient_counts: Counter[int] = Counter()
+        for position in _set_bits(mask):
+            ingredient_counts.update(self._recipe_ingredients(position))
+
+        def count_where(kind: str, value) -> int:
+            return (mask & self._mask(kind, value)).bit_count()
+
+        return RecipeFacets(
+            total=mask.bit_count(),
+            prep_time=[
+                PrepTimeFacet(
+                    max_prep_time=max_prep_time,
+                    count=count_where("max_prep_time", max_prep_time),
+                )
+                for max_prep_time in PREP_TIME_FACETS
+            ],
+            rating=[
+                RatingFacet(
+                    min_rating=min_rating, count=count_where("min_rating", min_rating)
+                )
+                for min_rating in RATING_FACETS
+            ],
+            ingredients=[
+                IngredientFacet(
+                    id=ingredient_id,
+                    name=self.ingredient_names[ingredient_id],
+                    count=count,
+                )
+                for ingredient_id, count in ingredient_counts.most_common(
+                    ingredient_limit
+                )
+            ],
+        )
+
+    def counted_ingredients(self) -> list[IngredientCount]:
+        """
+        Every ingredient used by a recipe, most used first
+        """
+        counts = [
+            IngredientCount(
+                id=ingredient_id,
+                name=self.ingredient_names[ingredient_id],
+                recipe_count=counts[ingredient_id],
+            )
+            for ingredient_id, counts in self.cooccurrence.items()
+        ]
+        counts.sort(key=lambda count: (-count.recipe_count, count.name))
+        return counts
+
+    def suggest_ingredients(self, query: str, limit: int = 10) -> list[IngredientCount]:
+        """
+        The most used ingredients with a word starting with each word of the
+        query, e.g. "chi br" for "Chicken breast fillets"
+        """
+        tokens = name_tokens(query)
+        if not tokens:
+            return []
+        key = (tuple(tokens), limit)
+        suggestions = self._suggestions.get(key)
+        if suggestions is not None:
+            self._suggestions.move_to_end(key)
+            return suggestions
+
+        # Look up the longest word, the fewest names start with it
+        prefix = max(tokens, key=len)
+        start = bisect_left(self.name_index, (prefix,))
+        end = bisect_left(self.name_index, (prefix + "\U0010ffff",))
+        candidates = {ingredient_id for _, ingredient_id in self.name_index[start:end]}
+        if len(tokens) > 1:
+            candidates = {
+                ingredient_id
+                for ingredient_id in candidates
+                if all(
+                    any(
+                        name_token.startswith(token)
+                        for name_token in name_tokens(
+                            self.ingredient_names[ingredient_id]
+                        )
+                    )
+                    for token in tokens
+                )
+            }
+
+        # Most used first, then shortest name, skipping those no recipe uses
+        ranked = nlargest(
+            limit,
+            (
+                (
+                    counts[ingredient_id],
+                    -len(self.ingredient_names[ingredient_id]),
+                    ingredient_id,
+                )
+                for ingredient_id in candidates
+                if (counts := self.cooccurrence.get(ingredient_id)) is not None
+            ),
+        )
+        suggestions = [
+            IngredientCount(
+                id=ingredient_id,
+                name=self.ingredient_names[ingredient_id],
+                recipe_count=count,
+            )
+            for count, _, ingredient_id in ranked
+        ]
+        self._suggestions[key] = suggestions
+        while len(self._suggestions) > SUGGESTION_CACHE_SIZE:
+            self._suggestions.popitem(last=False)
+        return suggestions
+
+    def ingredient_pairs(
+        self, ingredient_id: int, limit: int = 10
+    ) -> Optional[IngredientPairs]:
+        """
+        The ingredients most often used in the same recipes as ingredient_id,
+        or None when no recipe uses it
+        """
+        counts = self.cooccurrence.get(ingredient_id)
+        if counts is None:
+            return None
+        pairs = nlargest(
+            limit,
+            (item for item in counts.items() if item[0] != ingredient_id),
+            key=lambda item: item[1],
+        )
+        return IngredientPairs(
+            id=ingredient_id,
+            name=self.ingredient_names[ingredient_id],
+            recipe_count=counts[ingredient_id],
+            pairs=[
+                IngredientPair(
+                    id=other_id, name=self.ingredient_names[other_id], count=count
+                )
+                for other_id, count in pairs
+            ],
+        )
+
+
+async def load_catalogue(session: AsyncSession) -> RecipeCatalogue:
+    recipes = await session.exec(
+        select(
+            Recipe.id, Recipe.slug, Recipe.title, Recipe.prep_time, Recipe.rating
+        ).order_by(Recipe.id)
+    )
+    links = await session.exec(
+        select(RecipeIngredientLink.recipe_id, Ingredient.id, Ingredient.name).join(
+            Ingredient
+        )
+    )
+    ingredients_by_recipe = defaultdict(list)
+    for recipe_id, ingredient_id, name in links:
+        ingredients_by_recipe[recipe_id].append((ingredient_id, name))
+
+    catalogue = RecipeCatalogue()
+    for recipe_id, slug, title, prep_time, rating in recipes:
+        catalogue.add(
+            recipe_id, slug, title, prep_time, rating, ingredients_by_recipe[recipe_id]
+        )
+    return catalogue
+
+
+_catalogue: Optional[RecipeCatalogue] = None
+_load_lock = asyncio.Lock()
+_refresh_task: Optional[asyncio.Task] = None
+# Changes applied while a reload is running, replayed on the reloaded catalogue
+_pending_changes: Optional[list[Callable[[RecipeCatalogue], None]]] = None
+
+
+async def _refresh_catalogue() -> None:
+    global _catalogue, _pending_changes
+    _pending_changes = []
+    try:
+        async with AsyncSession(get_engine(read_only=True)) as session:
+            catalogue = await load_catalogue(session)
+        for change in _pending_changes:
+            change(catalogue)
+        _catalogue = catalogue
+    finally:
+        _pending_changes = None
+
+
+def _apply(change: Callable[[RecipeCatalogue], None]) -> None:
+    if _catalogue is not None:
+        change(_catalogue)
+        if _pending_changes is not None:
+            _pending_changes.append(change)
+
+
+async def get_catalogue(session: AsyncSession) -> RecipeCatalogue:
+    """
+    The catalogue, loaded with session on first use. Once it is older than
+    CATALOGUE_REFRESH_SECONDS it is reloaded in the background, and the
+    current one keeps being served until the reload finishes.
+    """
+    global _catalogue, _refresh_task
+    if _catalogue is None:
+        async with _load_lock:
+            if _catalogue is None:
+                _catalogue = await load_catalogue(session)
+    elif time.monotonic() - _catalogue.loaded_at > CATALOGUE_REFRESH_SECONDS and (
+        _refresh_task is None or _refresh_task.done()
+    ):
+        _refresh_task = asyncio.create_task(_refresh_catalogue())
+    return _catalogue
+
+
+def add_to_catalogue(recipe: Recipe) -> None:
+    """
+    Apply a newly added recipe, with its ingredients loaded, to the catalogue
+    """
+    args = (
+        recipe.id,
+        recipe.slug,
+        recipe.title,
+        recipe.prep_time,
+        recipe.rating,
+        [(link.ingredient.id, link.ingredient.name) for link in recipe.ingredients],
+    )
+    _apply(lambda catalogue: catalogue.add(*args))
+
+
+def remove_from_catalogue(recipe_ids: Iterable[int]) -> None:
+    recipe_ids = list(recipe_ids)
+
+    def remove(catalogue: RecipeCatalogue) -> None:
+        for recipe_id in recipe_ids:
+            catalogue.remove(recipe_id)
+
+    _apply(remove)
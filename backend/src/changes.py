@@ -0,0 +1,146 @@
+# Change log behind /changes, written in the same transaction as the change itself
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, NamedTuple
+
+from sqlalchemy import delete, func, text, tuple_
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models import (Change, ChangeEntity, ChangeLogEntry, ChangeLogHorizon,
+                     ChangeOp, ChangeSet)
+
+# Delete entries are kept this long, after which clients that haven't synced
+# since have to start over
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "30"))
+
+# Held by every transaction that writes to the change log until it commits, so
+# versions become visible in order and a client never skips over one that
+# commits late
+CHANGE_LOG_LOCK_KEY = 0x63686C67
+
+
+class ChangeRecord(NamedTuple):
+    entity: ChangeEntity
+    entity_id: int
+    op: ChangeOp
+    data: dict[str, Any]
+
+
+def recipe_upsert(recipe) -> ChangeRecord:
+    return ChangeRecord(
+        "recipe", recipe.id, "upsert", {"slug": recipe.slug, "title": recipe.title}
+    )
+
+
+def recipe_delete(recipe_id: int, slug: str) -> ChangeRecord:
+    return ChangeRecord("recipe", recipe_id, "delete", {"slug": slug})
+
+
+def ingredient_upsert(ingredient) -> ChangeRecord:
+    return ChangeRecord(
+        "ingredient", ingredient.id, "upsert", {"name": ingredient.name}
+    )
+
+
+def ingredient_delete(ingredient_id: int, name: str) -> ChangeRecord:
+    return ChangeRecord("ingredient", ingredient_id, "delete", {"name": name})
+
+
+async def record_changes(session: AsyncSession, records: Iterable[ChangeRecord]):
+    """
+    Add changes to the session's transaction, replacing any earlier entry for
+    the same entity. Call before committing, after flushing new rows for ids
+    """
+    records = list(records)
+    if not records:
+        return
+
+    await session.exec(
+        text("SELECT pg_advisory_xact_lock(:key)"),
+        params={"key": CHANGE_LOG_LOCK_KEY},
+    )
+    await session.exec(
+        delete(ChangeLogEntry).where(
+            tuple_(col(ChangeLogEntry.entity), col(ChangeLogEntry.entity_id)).in_(
+                [(record.entity, record.entity_id) for record in records]
+            )
+        )
+    )
+    session.add_all(
+        ChangeLogEntry(
+            entity=record.entity,
+            entity_id=record.entity_id,
+            op=record.op,
+            data=record.data,
+        )
+        for record in records
+    )
+    await session.flush()
+
+
+async def get_changes(session: AsyncSession, since: int, limit: int) -> ChangeSet:
+    horizon = (
+        await session.exec(select(func.coalesce(func.max(ChangeLogHorizon.version), 0)))
+    ).one()
+    latest = (
+        await session.exec(select(func.coalesce(func.max(ChangeLogEntry.version), 0)))
+    ).one()
+    # Compaction can remove the newest entries, the horizon is past them
+    latest = max(latest, horizon)
+    if since < horizon or since > latest:
+        return ChangeSet(version=latest, reset=True)
+
+    entries = (
+        await session.exec(
+            select(ChangeLogEntry)
+            .where(col(ChangeLogEntry.version) > since)
+            .order_by(col(ChangeLogEntry.version))
+            .limit(limit + 1)
+        )
+    ).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    return ChangeSet(
+        version=entries[-1].version if entries else since,
+        has_more=has_more,
+        changes=[
+            Change(
+                version=entry.version,
+                entity=entry.entity,
+                op=entry.op,
+                id=entry.entity_id,
+                data=entry.data,
+            )
+            for entry in entries
+        ],
+    )
+
+
+async def compact_change_log(
+    session: AsyncSession, retention_days: int = CHANGE_LOG_RETENTION_DAYS
+) -> int:
+    """
+    Drop delete entries older than the retention, and move the horizon past
+    them. Entries superseded by a later change are already removed on write
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    result = await session.exec(
+        delete(ChangeLogEntry)
+        .where(
+            col(ChangeLogEntry.op) == "delete",
+            col(ChangeLogEntry.changed_at) < cutoff,
+        )
+        .returning(ChangeLogEntry.version)
+    )
+    versions = result.scalars().all()
+    if versions:
+        horizon = await session.get(ChangeLogHorizon, 1)
+        if horizon is None:
+            session.add(ChangeLogHorizon(id=1, version=max(versions)))
+        else:
+            horizon.version = max(horizon.version, *versions)
+    await session.commit()
+    return len(versions)
@@ -1,9 +1,13 @@
 import os
-from typing import AsyncGenerator
+from dataclasses import dataclass
+from typing import AsyncGenerator, Optional
 
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from .logs import log_slow_statements
+
 # Get the DATABASE_URL from environment variable, fallback to localhost if not set
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
@@ -11,11 +15,185 @@ DATABASE_URL = os.getenv(
     f"@localhost:5432/{os.getenv('POSTGRES_DB')}"
 )
 
-# Create an async engine
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Optional read-only replica. When unset, reads go to the primary
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+# Optional local SQLite copy of the catalogue that the GET endpoints read from
+# instead of Postgres once it exists, rebuilt by src.read_snapshot after writes
+READ_SNAPSHOT_PATH = os.getenv("READ_SNAPSHOT_PATH")
+
+# "development" logs every statement with its duration and keeps a small pool,
+# "production" only logs slow statements and sizes the pool for concurrent traffic
+DB_PROFILE = os.getenv("DB_PROFILE", "development")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_seconds(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return None if value.strip().lower() in ("off", "none") else float(value)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class EngineSettings:
+    """
+    Connection pool and driver settings used to build an async engine
+
+    statement_cache_size is asyncpg's own prepared statement cache, and
+    prepared_statement_cache_size is the one SQLAlchemy keeps on top of it.
+    Both must be 0 when running behind pgbouncer in transaction mode.
+
+    echo is SQLAlchemy's own statement logging, which writes synchronously on
+    the event loop. slow_statement_seconds logs statements taking at least that
+    long through the logging queue instead (see src.logs), None for none.
+    """
+
+    echo: bool = False
+    slow_statement_seconds: Optional[float] = 0.1
+    slow_statement_sample_rate: float = 1.0
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: int = 30
+    pool_recycle: int = 1800  # seconds, -1 disables recycling
+    pool_pre_ping: bool = True
+    statement_cache_size: int = 100
+    prepared_statement_cache_size: int = 100
+
+    @classmethod
+    def for_profile(cls, profile: str) -> "EngineSettings":
+        if profile == "production":
+            return cls(
+                echo=False,
+                pool_size=20,
+                max_overflow=10,
+                pool_timeout=10,
+                pool_recycle=1800,
+                statement_cache_size=500,
+                prepared_statement_cache_size=500,
+            )
+        if profile == "development":
+            return cls(slow_statement_seconds=0.0)
+        raise ValueError(f"Unknown DB_PROFILE '{profile}'")
+
+    @classmethod
+    def from_env(cls, prefix: str = "DB_") -> "EngineSettings":
+        """
+        Start from the DB_PROFILE defaults and apply any overrides, e.g. DB_POOL_SIZE=30
+        """
+        base = cls.for_profile(DB_PROFILE)
+        return cls(
+            echo=_env_bool(f"{prefix}ECHO", base.echo),
+            slow_statement_seconds=_env_seconds(
+                f"{prefix}SLOW_STATEMENT_SECONDS", base.slow_statement_seconds
+            ),
+            slow_statement_sample_rate=_env_float(
+                f"{prefix}SLOW_STATEMENT_SAMPLE_RATE", base.slow_statement_sample_rate
+            ),
+            pool_size=_env_int(f"{prefix}POOL_SIZE", base.pool_size),
+            max_overflow=_env_int(f"{prefix}MAX_OVERFLOW", base.max_overflow),
+            pool_timeout=_env_int(f"{prefix}POOL_TIMEOUT", base.pool_timeout),
+            pool_recycle=_env_int(f"{prefix}POOL_RECYCLE", base.pool_recycle),
+            pool_pre_ping=_env_bool(f"{prefix}POOL_PRE_PING", base.pool_pre_ping),
+            statement_cache_size=_env_int(
+                f"{prefix}STATEMENT_CACHE_SIZE", base.statement_cache_size
+            ),
+            prepared_statement_cache_size=_env_int(
+                f"{prefix}PREPARED_STATEMENT_CACHE_SIZE",
+                base.prepared_statement_cache_size,
+            ),
+        )
+
+
+def create_engine_from_settings(url: str, settings: EngineSettings) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        echo=settings.echo,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+        pool_pre_ping=settings.pool_pre_ping,
+        connect_args={
+            "statement_cache_size": settings.statement_cache_size,
+            "prepared_statement_cache_size": settings.prepared_statement_cache_size,
+        },
+    )
+    if settings.slow_statement_seconds is not None:
+        log_slow_statements(
+            engine,
+            settings.slow_statement_seconds,
+            settings.slow_statement_sample_rate,
+        )
+    return engine
+
+
+# Create the async engines. Replica pool settings can be tuned separately with DB_READ_*
+engine = create_engine_from_settings(DATABASE_URL, EngineSettings.from_env())
+
+read_engine: AsyncEngine = (
+    create_engine_from_settings(DATABASE_READ_URL, EngineSettings.from_env("DB_READ_"))
+    if DATABASE_READ_URL
+    else engine
+)
+
+
+# The snapshot file is replaced rather than modified, so connections can open it
+# immutable (no locking), and without a pool every session sees the latest file
+snapshot_engine: AsyncEngine | None = (
+    create_async_engine(
+        f"sqlite+aiosqlite:///file:{os.path.abspath(READ_SNAPSHOT_PATH)}"
+        "?mode=ro&immutable=1&uri=true",
+        poolclass=NullPool,
+    )
+    if READ_SNAPSHOT_PATH
+    else None
+)
+
+
+def get_engine(read_only: bool = False) -> AsyncEngine:
+    return read_engine if read_only else engine
 
 
 # Provide an async session
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSession(engine) as session:
         yield session
+
+
+# Read-only endpoints are served from the read snapshot if there is one, or
+# else routed to the replica if configured
+def get_read_bind() -> AsyncEngine:
+    if snapshot_engine is not None and os.path.exists(READ_SNAPSHOT_PATH):
+        return snapshot_engine
+    return read_engine
+
+
+# Provide an async session for read-only endpoints
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(get_read_bind()) as session:
+        yield session
+
+
+async def dispose_engines() -> None:
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+    if snapshot_engine is not None:
+        await snapshot_engine.dispose()
@@ -1,6 +1,10 @@
+from .canonical import canonical_ingredient_name
+from .errors import UpstreamUnavailableError
 from .fetcher import get_all_recipe_slugs, get_recipe_from_slug
 
 __all__ = [
+    "UpstreamUnavailableError",
+    "canonical_ingredient_name",
     "get_all_recipe_slugs",
     "get_recipe_from_slug",
 ]
@@ -0,0 +1,73 @@
+# Canonical ingredient names, so the same ingredient listed as e.g. "Fresh
+# Coriander", "coriander leaves" and "cilantro" is stored as one ingredient
+
+import re
+import unicodedata
+
+# Leading words that describe where an ingredient comes from rather than what
+# it is. Words that change the ingredient (smoked, dried, chopped...) are kept
+DESCRIPTORS = {"fresh", "british", "free range", "organic"}
+
+# Plurals the suffix rules below get wrong
+IRREGULAR_PLURALS = {
+    "leaves": "leaf",
+    "loaves": "loaf",
+    "halves": "half",
+    "cookies": "cookie",
+    "brownies": "brownie",
+    "molasses": "molasses",
+}
+
+# Names that are a different word for the same ingredient, after the rules
+# above have been applied. Every value has to be a canonical name itself
+ALIASES = {
+    "cilantro": "coriander",
+    "coriander leaf": "coriander",
+    "scallion": "spring onion",
+    "green onion": "spring onion",
+    "eggplant": "aubergine",
+    "zucchini": "courgette",
+    "garlic": "garlic clove",
+    "chick pea": "chickpea",
+}
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase without accents, with punctuation replaced by single spaces"""
+    name = unicodedata.normalize("NFKD", name.casefold())
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    name = name.replace("&", " and ")
+    return " ".join(re.findall(r"[^\W_]+", name))
+
+
+def singular(word: str) -> str:
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def canonical_ingredient_name(name: str) -> str:
+    """
+    The name an ingredient is stored under: normalized, without leading
+    descriptors, with the last word made singular, then looked up in ALIASES.
+    Canonical names map to themselves.
+    """
+    name = normalize_name(name)
+    stripped = True
+    while stripped:
+        stripped = False
+        for descriptor in DESCRIPTORS:
+            if name.startswith(descriptor + " "):
+                name = name[len(descriptor) + 1 :]
+                stripped = True
+
+    words = name.split(" ")
+    words[-1] = singular(words[-1])
+    name = " ".join(words)
+    return ALIASES.get(name, name)
@@ -1,8 +1,35 @@
-GET_RECIPES_ENDPOINT = (
-    "https://production-api.gousto.co.uk/cmsreadbroker/v1/recipes?category=recipes"
-)
-GET_RECIPE_INFO_ENDPOINT = (
-    "https://production-api.gousto.co.uk/cmsreadbroker/v1/recipe/"
-)
+import os
+
+# Point at a mock of the API, e.g. scripts/mock_gousto.py, to crawl offline
+GOUSTO_API_URL = os.getenv(
+    "GOUSTO_API_URL", "https://production-api.gousto.co.uk"
+).rstrip("/")
+
+GET_RECIPES_ENDPOINT = f"{GOUSTO_API_URL}/cmsreadbroker/v1/recipes?category=recipes"
+GET_RECIPE_INFO_ENDPOINT = f"{GOUSTO_API_URL}/cmsreadbroker/v1/recipe/"
 
 GET_RECIPES_PAGE_LIMIT = 16  # Gousto does not allow more than 16 recipes per request
+
+# Requests in flight to Gousto start at the initial limit and adapt between the
+# min and max, backing off on 429s, errors and rising latency
+GOUSTO_MIN_CONCURRENCY = int(os.getenv("GOUSTO_MIN_CONCURRENCY", "1"))
+GOUSTO_INITIAL_CONCURRENCY = int(os.getenv("GOUSTO_INITIAL_CONCURRENCY", "8"))
+GOUSTO_MAX_CONCURRENCY = int(os.getenv("GOUSTO_MAX_CONCURRENCY", "64"))
+
+# Hard cap on requests per second whatever the concurrency, 0 for none
+GOUSTO_RATE_LIMIT = float(os.getenv("GOUSTO_RATE_LIMIT", "50"))
+
+GOUSTO_REQUEST_TIMEOUT_SECONDS = float(
+    os.getenv("GOUSTO_REQUEST_TIMEOUT_SECONDS", "20")
+)
+
+# 429s, 5xx responses, timeouts and connection errors are retried with
+# exponential backoff and full jitter, or after Retry-After if that's longer
+GOUSTO_MAX_ATTEMPTS = int(os.getenv("GOUSTO_MAX_ATTEMPTS", "5"))
+GOUSTO_BACKOFF_SECONDS = float(os.getenv("GOUSTO_BACKOFF_SECONDS", "0.5"))
+GOUSTO_MAX_BACKOFF_SECONDS = float(os.getenv("GOUSTO_MAX_BACKOFF_SECONDS", "60"))
+
+# After this many failed requests in a row all fetches pause for the reset
+# time, after which a single request is let through to test the water
+GOUSTO_BREAKER_THRESHOLD = int(os.getenv("GOUSTO_BREAKER_THRESHOLD", "10"))
+GOUSTO_BREAKER_RESET_SECONDS = float(os.getenv("GOUSTO_BREAKER_RESET_SECONDS", "30"))
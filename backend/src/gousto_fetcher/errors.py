@@ -4,3 +4,12 @@ class NoMoreRecipesError(Exception):
     def __init__(self, message="No more recipes available to scrape."):
         self.message = message
         super().__init__(self.message)
+
+
+class UpstreamUnavailableError(Exception):
+    """Exception raised when Gousto keeps failing after every retry."""
+
+    def __init__(self, url: str, attempts: int):
+        self.url = url
+        self.attempts = attempts
+        super().__init__(f"Gousto unavailable after {attempts} attempts: {url}")
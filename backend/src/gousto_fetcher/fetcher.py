@@ -1,90 +1,190 @@
 import asyncio
 import logging
+import math
+from typing import Any, Optional
 
 import aiohttp
 
 from .constants import (GET_RECIPE_INFO_ENDPOINT, GET_RECIPES_ENDPOINT,
-                        GET_RECIPES_PAGE_LIMIT)
-from .errors import NoMoreRecipesError
+                        GET_RECIPES_PAGE_LIMIT, GOUSTO_BACKOFF_SECONDS,
+                        GOUSTO_BREAKER_RESET_SECONDS, GOUSTO_BREAKER_THRESHOLD,
+                        GOUSTO_INITIAL_CONCURRENCY, GOUSTO_MAX_ATTEMPTS,
+                        GOUSTO_MAX_BACKOFF_SECONDS, GOUSTO_MAX_CONCURRENCY,
+                        GOUSTO_MIN_CONCURRENCY, GOUSTO_RATE_LIMIT,
+                        GOUSTO_REQUEST_TIMEOUT_SECONDS)
+from .errors import NoMoreRecipesError, UpstreamUnavailableError
 from .models import Recipe
 from .parser import parse_recipe
+from .throttle import (AdaptiveLimiter, CircuitBreaker, TokenBucket,
+                       backoff_delay, parse_retry_after)
 from .utils import page_to_offset, strip_recipes_prefix
 
+logger = logging.getLogger(__name__)
 
-async def get_recipe_slugs_from_page(page: int) -> list[str]:
+# Shared by every request to Gousto, so crawling slugs and adding recipes at
+# the same time don't each get the full budget
+limiter = AdaptiveLimiter(
+    GOUSTO_INITIAL_CONCURRENCY, GOUSTO_MIN_CONCURRENCY, GOUSTO_MAX_CONCURRENCY
+)
+rate_limiter = TokenBucket(GOUSTO_RATE_LIMIT)
+breaker = CircuitBreaker(GOUSTO_BREAKER_THRESHOLD, GOUSTO_BREAKER_RESET_SECONDS)
+
+
+def _client_session() -> aiohttp.ClientSession:
+    return aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=GOUSTO_REQUEST_TIMEOUT_SECONDS)
+    )
+
+
+async def _get_once(session: aiohttp.ClientSession, url: str) -> Any:
+    async with session.get(url) as response:
+        if response.status != 200:
+            raise aiohttp.ClientResponseError(
+                request_info=response.request_info,
+                history=response.history,
+                status=response.status,
+                message=f"HTTP error occurred: {response.status}",
+                headers=response.headers,
+            )
+        return await response.json()
+
+
+async def get_json(session: aiohttp.ClientSession, url: str) -> Any:
+    """
+    GET url and decode its JSON, through the shared circuit breaker, rate cap
+    and concurrency limiter. 429s, 5xx responses, timeouts and connection
+    errors are retried with backoff, honouring Retry-After.
+
+    Raises:
+        aiohttp.ClientResponseError: If the response status code is another non-200.
+        UpstreamUnavailableError: If every attempt failed.
+    """
+    for attempt in range(1, GOUSTO_MAX_ATTEMPTS + 1):
+        probe = await breaker.wait()
+        started_at = None
+        try:
+            await rate_limiter.acquire()
+            started_at = await limiter.acquire()
+            data = await _get_once(session, url)
+        except aiohttp.ClientResponseError as error:
+            failure = error
+            retryable = error.status == 429 or error.status >= 500
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            failure = error
+            retryable = True
+        except BaseException:
+            # Cancelled, possibly still waiting for a slot
+            if started_at is not None:
+                limiter.release(None)
+            breaker.abandon(probe)
+            raise
+        else:
+            limiter.release(started_at)
+            breaker.record_success()
+            return data
+
+        limiter.release(started_at, overloaded=retryable)
+        if not retryable:
+            # Upstream is healthy, it just doesn't have this
+            breaker.record_success()
+            raise failure
+        breaker.record_failure()
+        if attempt == GOUSTO_MAX_ATTEMPTS:
+            raise UpstreamUnavailableError(url, attempt) from failure
+
+        headers = getattr(failure, "headers", None) or {}
+        delay = backoff_delay(
+            attempt,
+            GOUSTO_BACKOFF_SECONDS,
+            GOUSTO_MAX_BACKOFF_SECONDS,
+            parse_retry_after(headers.get("Retry-After")),
+        )
+        logger.debug("Retrying %s in %.1fs after %r", url, delay, failure)
+        await asyncio.sleep(delay)
+
+
+async def get_recipe_slugs_from_page(
+    page: int, session: Optional[aiohttp.ClientSession] = None
+) -> list[str]:
     """
     Takes a page number and returns a list of recipe slugs
 
     Raises:
         aiohttp.ClientResponseError: If the response status code is not 200.
+        UpstreamUnavailableError: If Gousto kept failing.
         NoMoreRecipesError: If there are no more recipes to scrape.
     """
-    logging.debug(f"Scraping page {page}")
+    logger.debug("Scraping page %s", page)
 
     offset = page_to_offset(page)
 
     api_url = f"{GET_RECIPES_ENDPOINT}&limit={GET_RECIPES_PAGE_LIMIT}&offset={offset}"
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(api_url) as response:
-            if response.status != 200:
-                raise aiohttp.ClientResponseError(
-                    request_info=response.request_info,
-                    history=response.history,
-                    status=response.status,
-                    message=f"HTTP error occurred: {response.status}",
-                )
+    if session is None:
+        async with _client_session() as session:
+            data = await get_json(session, api_url)
+    else:
+        data = await get_json(session, api_url)
 
-            data = await response.json()
-            entries = data["data"]["entries"]
-            recipe_slug_list: list[str] = []
+    entries = data["data"]["entries"]
+    recipe_slug_list: list[str] = []
 
-            # check if there are any more recipes to scrape
-            if len(entries) == 0:
-                raise NoMoreRecipesError
+    # check if there are any more recipes to scrape
+    if len(entries) == 0:
+        raise NoMoreRecipesError
 
-            for entry in entries:
-                slug = strip_recipes_prefix(entry["url"])
-                recipe_slug_list.append(slug)
+    for entry in entries:
+        slug = strip_recipes_prefix(entry["url"])
+        recipe_slug_list.append(slug)
 
-            return recipe_slug_list
+    return recipe_slug_list
 
 
-async def get_all_recipe_slugs(max_concurrent_requests=5) -> list[str]:
-    page = 0
-    all_recipe_slugs: list[str] = []
+async def get_all_recipe_slugs(
+    max_concurrent_requests: int = GOUSTO_MAX_CONCURRENCY,
+) -> list[str]:
+    """
+    Fetch pages of slugs until the first empty one. Up to
+    max_concurrent_requests workers take pages in order, and how many of them
+    actually have a request in flight is decided by the shared limiter.
 
-    while True:
+    Raises:
+        aiohttp.ClientResponseError: If a page fails with a non-200 response.
+        UpstreamUnavailableError: If a page kept failing, rather than returning
+            a list with its slugs missing.
+    """
+    slugs_by_page: dict[int, list[str]] = {}
+    next_page = 0
+    last_page = math.inf  # the first empty page
+
+    async def worker(session: aiohttp.ClientSession):
+        nonlocal next_page, last_page
+        while next_page < last_page:
+            page = next_page
+            next_page += 1
+            try:
+                slugs_by_page[page] = await get_recipe_slugs_from_page(page, session)
+            except NoMoreRecipesError:
+                last_page = min(last_page, page)
+
+    async with _client_session() as session:
+        workers = [
+            asyncio.create_task(worker(session)) for _ in range(max_concurrent_requests)
+        ]
         try:
-            # Create a set of tasks, respecting the max concurrency limit
-            tasks = [
-                get_recipe_slugs_from_page(page + i)
-                for i in range(max_concurrent_requests)
-            ]
-
-            # Execute tasks concurrently
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
 
-            page_completed = False
-            for result in results:
-                if isinstance(result, NoMoreRecipesError):
-                    # Stop further processing if we encounter a `NoMoreRecipesError`
-                    page_completed = True
-                    continue
-                elif isinstance(result, Exception):
-                    # Handle other exceptions if necessary
-                    logging.error(f"Error occurs: {result}")
-                else:
-                    all_recipe_slugs.extend(result)
-
-            if page_completed:
-                break
-
-            page += max_concurrent_requests
-        except NoMoreRecipesError:
-            break
-
-    return all_recipe_slugs
+    logger.debug("Found %s pages of recipes", last_page)
+    return [
+        slug
+        for page in sorted(slugs_by_page)
+        if page < last_page
+        for slug in slugs_by_page[page]
+    ]
 
 
 async def get_recipe_from_slug(slug: str) -> Recipe:
@@ -96,21 +196,13 @@ async def get_recipe_from_slug(slug: str) -> Recipe:
 
     Raises:
         aiohttp.ClientResponseError: If the response status code is not 200.
+        UpstreamUnavailableError: If Gousto kept failing.
     """
     api_url = f"{GET_RECIPE_INFO_ENDPOINT}{slug}"
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(api_url) as response:
-            if response.status != 200:
-                raise aiohttp.ClientResponseError(
-                    request_info=response.request_info,
-                    history=response.history,
-                    status=response.status,
-                    message=f"HTTP error occurred: {response.status}",
-                )
-
-            data = await response.json()
+    async with _client_session() as session:
+        data = await get_json(session, api_url)
 
-            recipe = parse_recipe(data)
+    recipe = parse_recipe(data)
 
-            return recipe
+    return recipe
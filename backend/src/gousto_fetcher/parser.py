@@ -3,6 +3,7 @@
 from collections import defaultdict
 from typing import List, Optional
 
+from .canonical import canonical_ingredient_name
 from .models import ImageURL, Ingredient, InstructionStep, Recipe
 
 # ===== Recipe Parsing =====
@@ -50,16 +51,25 @@ def parse_all_ingredients(ingredients_data: dict) -> List[Ingredient]:
     """
     Parses all the ingredients from the gousto api into a list of Ingredient objects
 
-    Handles duplicated ingredients
+    Handles duplicated ingredients, including different names for the same
+    ingredient, which are merged under its canonical name
     """
 
     # using a dict to later efficiently check for duplicates. Key is the ingredient name
     ingredient_dict: dict[str, List[Ingredient]] = defaultdict(list)
 
+    # The API sometimes repeats an entry exactly, which isn't more of it.
+    # Entries under different names are all needed, even with the same amount
+    seen: set[tuple[str, str]] = set()
     for ingredient_data in ingredients_data:
         ingredient = parse_ingredient_data(ingredient_data)
-        if ingredient:
-            ingredient_dict[ingredient.name].append(ingredient)
+        if not ingredient:
+            continue
+        entry = (ingredient_data["name"].lower(), ingredient.amount)
+        if entry in seen:
+            continue
+        seen.add(entry)
+        ingredient_dict[ingredient.name].append(ingredient)
 
     # iterate over the dict, check if there are duplicates
     for ingredient_name, ingredient_list in ingredient_dict.items():
@@ -84,6 +94,11 @@ def handle_duplicate_ingredients(ingredient_list: List[Ingredient]) -> List[Ingr
     Current supported rules:
 
     If one has a unit (g/ml) and one is just a number, keep the one with the unit
+    If all are counts (2 or x2), add them up, as x3 if any was written so
+    Otherwise, combine all the amounts
+
+    Exact repeats of an entry have already been dropped by parse_all_ingredients,
+    so equal amounts here are separate entries and are added up too
 
     Args:
         ingredient_list: List of the same ingredients
@@ -93,10 +108,6 @@ def handle_duplicate_ingredients(ingredient_list: List[Ingredient]) -> List[Ingr
     if len(ingredient_list) == 1:
         return ingredient_list
 
-    # If all amounts are the same, return just one ingredient
-    if len(set(ingredient.amount for ingredient in ingredient_list)) == 1:
-        return [ingredient_list[0]]
-
     # Check if one has a unit (g/ml) and one is just a number
     amounts = [ingredient.amount for ingredient in ingredient_list]
 
@@ -106,7 +117,8 @@ def handle_duplicate_ingredients(ingredient_list: List[Ingredient]) -> List[Ingr
         for amt in amounts
         if any(unit in amt for unit in ["g", "ml", "tsp", "tbsp"])
     ]
-    number_amounts = [amt for amt in amounts if amt.strip("1234567890") == ""]
+    # A count, either 2 or x2
+    number_amounts = [amt for amt in amounts if amt.removeprefix("x").isdigit()]
 
     if len(unit_amounts) == 1 and len(number_amounts) == 1:
         # Keep the one with the unit
@@ -114,23 +126,30 @@ def handle_duplicate_ingredients(ingredient_list: List[Ingredient]) -> List[Ingr
             if any(unit in ingredient.amount for unit in ["g", "ml", "tsp", "tbsp"]):
                 return [ingredient]
 
-    # Sometimes it requires multiple ingredients of the same type with different amounts, ie 8ml and 15ml soy sauce
-    if len(number_amounts) == 0:
-        # there are only unit amounts, i think we can assume they are ok, and can combine them as a string
-        combined_amount = " + ".join(unit_amounts)
-        # Return a copy of the first ingredient with the combined amount
+    # e.g. 2 garlic cloves and 1 garlic clove, listed under different names
+    if len(number_amounts) == len(amounts):
+        total = sum(int(amount.removeprefix("x")) for amount in number_amounts)
+        prefix = "x" if any(amount.startswith("x") for amount in amounts) else ""
         return [
             Ingredient(
                 name=ingredient_list[0].name,
-                amount=combined_amount,
+                amount=f"{prefix}{total}",
                 image_urls=ingredient_list[0].image_urls,
             )
         ]
 
-    # If we get here, we don't know how to handle these duplicates
-    raise ValueError(
-        f"Unable to handle duplicate ingredients with amounts: {amounts} for ingredient {ingredient_list[0].name}"
-    )
+    # Sometimes it requires multiple ingredients of the same type with different amounts, ie 8ml and 15ml soy sauce
+    # or the same ingredient listed under different names with different kinds of amounts,
+    # i think we can assume they are all needed, and can combine them as a string
+    combined_amount = " + ".join(amounts)
+    # Return a copy of the first ingredient with the combined amount
+    return [
+        Ingredient(
+            name=ingredient_list[0].name,
+            amount=combined_amount,
+            image_urls=ingredient_list[0].image_urls,
+        )
+    ]
 
 
 def parse_ingredient_data(ingredient_data: dict) -> Optional[Ingredient]:
@@ -144,10 +163,10 @@ def parse_ingredient_data(ingredient_data: dict) -> Optional[Ingredient]:
     if "name" not in ingredient_data or "label" not in ingredient_data:
         return None
 
-    name = ingredient_data["name"].lower()
+    raw_name = ingredient_data["name"].lower()
 
     # get the amount. Janky but it works so far
-    amount = ingredient_data["label"].lower().replace(name, "").strip()
+    amount = ingredient_data["label"].lower().replace(raw_name, "").strip()
 
     # Sometimes amount is wrapped in round brackets...
     if amount.startswith("(") and amount.endswith(")"):
@@ -166,7 +185,9 @@ def parse_ingredient_data(ingredient_data: dict) -> Optional[Ingredient]:
 
     image_urls = parse_image_urls(ingredient_data["media"]["images"])
 
-    return Ingredient(name=name, amount=amount, image_urls=image_urls)
+    return Ingredient(
+        name=canonical_ingredient_name(raw_name), amount=amount, image_urls=image_urls
+    )
 
 
 # --- ImageURL Parsing ---
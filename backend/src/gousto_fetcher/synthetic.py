@@ -0,0 +1,413 @@
+# Synthetic Gousto catalogue, and a mock of the Gousto API serving it, so the
+# crawl and ingest can be tested offline at any catalogue size
+
+import asyncio
+import io
+import random
+import re
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from aiohttp import web
+from PIL import Image
+
+from .constants import GET_RECIPES_PAGE_LIMIT
+
+PROTEINS = [
+    "chicken",
+    "beef",
+    "pork",
+    "lamb",
+    "salmon",
+    "cod",
+    "prawn",
+    "tofu",
+    "halloumi",
+    "paneer",
+    "chickpea",
+    "lentil",
+    "duck",
+    "turkey",
+    "haddock",
+]
+DISHES = [
+    "curry",
+    "stir-fry",
+    "tacos",
+    "risotto",
+    "ramen",
+    "burger",
+    "traybake",
+    "pie",
+    "salad",
+    "noodles",
+    "stew",
+    "katsu",
+    "biryani",
+    "pasta",
+    "bowl",
+]
+STYLES = [
+    "quick",
+    "smoky",
+    "sticky",
+    "creamy",
+    "spicy",
+    "zesty",
+    "crispy",
+    "one-pot",
+    "lighter",
+    "hearty",
+    "thai-style",
+    "korean-style",
+    "cajun",
+]
+# Most recipes use a few of the first, and a long tail of the rest with their
+# qualifiers, so the number of distinct ingredients grows with the catalogue
+INGREDIENTS = [
+    "onion",
+    "garlic clove",
+    "basmati rice",
+    "chicken stock paste",
+    "tomato",
+    "red pepper",
+    "soy sauce",
+    "ginger",
+    "lime",
+    "coriander",
+    "spring onion",
+    "carrot",
+    "potato",
+    "spinach",
+    "courgette",
+    "mushroom",
+    "cheddar cheese",
+    "creme fraiche",
+    "coconut milk",
+    "chilli flakes",
+    "honey",
+    "egg noodles",
+    "penne pasta",
+    "chopped tomatoes",
+    "vegetable stock mix",
+    "parsley",
+    "green beans",
+    "sweet potato",
+    "red onion",
+    "lemon",
+    "butter",
+    "flour",
+    "paprika",
+    "cumin",
+    "garam masala",
+    "tomato puree",
+    "baby leaf salad",
+    "brioche bun",
+    "tortilla",
+    "sesame seeds",
+    "peanuts",
+    "mint",
+    "feta",
+    "mozzarella",
+    "pak choi",
+    "broccoli",
+    "kale",
+    "leek",
+    "celery",
+    "thyme",
+] + PROTEINS
+QUALIFIERS = [
+    "british",
+    "free-range",
+    "smoked",
+    "diced",
+    "sliced",
+    "fresh",
+    "dried",
+    "organic",
+    "baby",
+    "wholewheat",
+    "reduced-fat",
+    "grated",
+    "roasted",
+]
+BASICS = ["salt", "pepper", "olive oil", "vegetable oil", "sugar", "water"]
+
+IMAGE_WIDTHS = [50, 200, 400, 700, 1500]
+
+_image_name = re.compile(r"^(?P<key>[\w-]+)-x(?P<width>\d+)\.jpg$")
+
+
+@dataclass(frozen=True)
+class SyntheticSettings:
+    """
+    Rates of the quirks the parser has to handle, per recipe
+    """
+
+    missing_rating_rate: float = 0.1
+    duplicate_ingredient_rate: float = 0.2
+    zero_quantity_rate: float = 0.1
+    unnamed_ingredient_rate: float = 0.05
+
+
+class SyntheticCatalogue:
+    """
+    recipes recipes, each generated on request from the seed and its index,
+    so the same seed always gives the same catalogue without keeping it all
+    in memory
+    """
+
+    def __init__(
+        self,
+        recipes: int,
+        seed: int = 0,
+        settings: Optional[SyntheticSettings] = None,
+    ):
+        self.seed = seed
+        self.settings = settings or SyntheticSettings()
+        self.slugs = [self._slug(index) for index in range(recipes)]
+        self._indexes = {slug: index for index, slug in enumerate(self.slugs)}
+
+    def _rng(self, *key) -> random.Random:
+        return random.Random(":".join(map(str, (self.seed, *key))))
+
+    def _slug(self, index: int) -> str:
+        rng = self._rng("title", index)
+        return "-".join(
+            [rng.choice(STYLES), rng.choice(PROTEINS), rng.choice(DISHES), str(index)]
+        )
+
+    def listing_page(self, offset: int, limit: int) -> dict:
+        """The body of a page of the recipe listing, empty past the end"""
+        limit = min(limit, GET_RECIPES_PAGE_LIMIT)
+        entries = []
+        for index in range(offset, min(offset + limit, len(self.slugs))):
+            slug = self.slugs[index]
+            # Some recipes are listed under a category instead of /recipes/
+            category = PROTEINS[index % len(PROTEINS)]
+            prefix = "/recipes/" if index % 7 else f"/{category}-recipes/"
+            entries.append({"title": self._title(slug), "url": prefix + slug})
+        return {
+            "status": "ok",
+            "meta": {"skip": offset, "limit": limit, "total": len(self.slugs)},
+            "data": {"entries": entries},
+        }
+
+    @staticmethod
+    def _title(slug: str) -> str:
+        return " ".join(slug.split("-")[:-1]).capitalize()
+
+    def recipe_payload(self, slug: str, image_base_url: str) -> Optional[dict]:
+        """
+        The body Gousto returns for a recipe, or None if the slug isn't in the
+        catalogue. Images are served by the mock server at image_base_url.
+        """
+        index = self._indexes.get(slug)
+        if index is None:
+            return None
+        rng = self._rng("recipe", index)
+        settings = self.settings
+
+        def images(key: str) -> dict:
+            widths = IMAGE_WIDTHS if rng.random() < 0.8 else IMAGE_WIDTHS[1:3]
+            return {
+                "images": [
+                    {
+                        "image": f"{image_base_url}/images/{key}-x{width}.jpg",
+                        "width": width,
+                    }
+                    for width in widths
+                ]
+            }
+
+        ingredient_count = rng.randint(6, 14)
+        names: set[str] = set()
+        while len(names) < ingredient_count:
+            names.add(self._ingredient_name(rng))
+        ingredients = [
+            {
+                "name": name.capitalize(),
+                "label": self._label(rng, name.capitalize(), rng.random()),
+                "media": images(f"ingredient-{name.replace(' ', '-')}"),
+            }
+            for name in sorted(names)
+        ]
+        if rng.random() < settings.duplicate_ingredient_rate:
+            ingredients[-1:] = self._duplicates(rng, ingredients[-1])
+        if rng.random() < settings.zero_quantity_rate:
+            ingredients.append(
+                {**ingredients[-1], "label": f"{ingredients[-1]['name']} x0"}
+            )
+        if rng.random() < settings.unnamed_ingredient_rate:
+            ingredients.append({"label": "Extra", "media": {"images": []}})
+
+        prep_time = rng.choice([10, 15, 20, 25, 30, 35, 45, 60])
+        entry = {
+            "title": self._title(slug),
+            "url": f"/recipes/{slug}",
+            "gousto_uid": f"{rng.getrandbits(128):032x}",
+            "prep_times": {"for_2": prep_time, "for_4": prep_time + 5},
+            "basics": [
+                {"title": title} for title in rng.sample(BASICS, rng.randint(1, 4))
+            ],
+            "ingredients": ingredients,
+            "cooking_instructions": [
+                {
+                    "order": order,
+                    "instruction": f"<p>Step {order}: {rng.choice(STYLES)} "
+                    f"{rng.choice(sorted(names))}.</p>",
+                    "media": images(f"step-{index}-{order}"),
+                }
+                for order in range(1, rng.randint(4, 8) + 1)
+            ],
+            "media": images(f"recipe-{index}"),
+        }
+        if rng.random() >= settings.missing_rating_rate:
+            entry["rating"] = {
+                "average": round(rng.uniform(3.5, 5), 1),
+                "count": rng.randint(1, 5000),
+            }
+        return {"status": "ok", "data": {"entry": entry}}
+
+    @staticmethod
+    def _ingredient_name(rng: random.Random) -> str:
+        # Zipf-like, the first ingredients are the most common
+        rank = min(int(rng.paretovariate(1.2)) - 1, len(INGREDIENTS) - 1)
+        name = INGREDIENTS[rank]
+        if rng.random() < 0.3:
+            name = f"{rng.choice(QUALIFIERS)} {name}"
+        return name
+
+    @staticmethod
+    def _label(rng: random.Random, name: str, kind: float) -> str:
+        if kind < 0.4:
+            return f"{name} x{rng.randint(1, 4)}"
+        if kind < 0.7:
+            return f"{name} ({rng.choice([10, 25, 30, 50, 75, 100, 130, 250])}g)"
+        if kind < 0.85:
+            return f"{name} ({rng.choice([8, 15, 30, 100, 200, 400])}ml)"
+        return name
+
+    @staticmethod
+    def _duplicates(rng: random.Random, ingredient: dict) -> list[dict]:
+        """
+        Entries to replace ingredient with, repeating it in one of the ways
+        parse_all_ingredients knows how to merge
+        """
+        name = ingredient["name"]
+        kind = rng.randrange(3)
+        if kind == 0:
+            return [ingredient, dict(ingredient)]
+        if kind == 1:
+            return [
+                {**ingredient, "label": f"{name} (30g)"},
+                {**ingredient, "label": name},
+            ]
+        return [
+            {**ingredient, "label": f"{name} (8ml)"},
+            {**ingredient, "label": f"{name} (15ml)"},
+        ]
+
+
+@dataclass(frozen=True)
+class MockFaults:
+    """
+    How badly the mock behaves: every API response is delayed by latency plus
+    up to jitter seconds, and a fraction are 429s with Retry-After or 5xxs.
+    Beyond max_in_flight concurrent API requests the rest get 429s, 0 for no
+    limit.
+    """
+
+    latency_seconds: float = 0.0
+    jitter_seconds: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after_seconds: int = 1
+    max_in_flight: int = 0
+
+
+@lru_cache(maxsize=256)
+def synthetic_image(key: str, width: int) -> bytes:
+    colour = zlib.crc32(key.encode()).to_bytes(4, "big")[:3]
+    image = Image.new("RGB", (width, max(1, width * 2 // 3)), tuple(colour))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=70)
+    return buffer.getvalue()
+
+
+def create_mock_app(
+    catalogue: SyntheticCatalogue,
+    faults: Optional[MockFaults] = None,
+    seed: Optional[int] = None,
+) -> web.Application:
+    """
+    The Gousto API endpoints the fetcher uses, serving catalogue, plus its
+    images. Counts of the responses sent by status are served at /_stats.
+    """
+    faults = faults or MockFaults()
+    rng = random.Random(seed)
+    statuses: Counter[int] = Counter()
+    in_flight = 0
+
+    @web.middleware
+    async def misbehave(request: web.Request, handler):
+        nonlocal in_flight
+        if not request.path.startswith("/cmsreadbroker/"):
+            return await handler(request)
+        in_flight += 1
+        try:
+            overloaded = faults.max_in_flight and in_flight > faults.max_in_flight
+            if overloaded or rng.random() < faults.throttle_rate:
+                response = throttled()
+            else:
+                await asyncio.sleep(
+                    faults.latency_seconds + rng.random() * faults.jitter_seconds
+                )
+                if rng.random() < faults.error_rate:
+                    response = web.Response(status=rng.choice([500, 502, 503]))
+                else:
+                    response = await handler(request)
+        finally:
+            in_flight -= 1
+        statuses[response.status] += 1
+        return response
+
+    def throttled() -> web.Response:
+        return web.Response(
+            status=429, headers={"Retry-After": str(faults.retry_after_seconds)}
+        )
+
+    async def list_recipes(request: web.Request) -> web.Response:
+        limit = int(request.query.get("limit", GET_RECIPES_PAGE_LIMIT))
+        offset = int(request.query.get("offset", 0))
+        return web.json_response(catalogue.listing_page(offset, limit))
+
+    async def get_recipe(request: web.Request) -> web.Response:
+        payload = catalogue.recipe_payload(
+            request.match_info["slug"], str(request.url.origin())
+        )
+        if payload is None:
+            return web.json_response({"status": "error"}, status=404)
+        return web.json_response(payload)
+
+    async def get_image(request: web.Request) -> web.Response:
+        match = _image_name.match(request.match_info["name"])
+        if match is None or not 0 < int(match["width"]) <= 4000:
+            raise web.HTTPNotFound()
+        body = synthetic_image(match["key"], int(match["width"]))
+        return web.Response(body=body, content_type="image/jpeg")
+
+    async def get_stats(_request: web.Request) -> web.Response:
+        return web.json_response(
+            {str(status): count for status, count in statuses.items()}
+        )
+
+    app = web.Application(middlewares=[misbehave])
+    app.router.add_get("/cmsreadbroker/v1/recipes", list_recipes)
+    app.router.add_get("/cmsreadbroker/v1/recipe/{slug}", get_recipe)
+    app.router.add_get("/images/{name}", get_image)
+    app.router.add_get("/_stats", get_stats)
+    return app
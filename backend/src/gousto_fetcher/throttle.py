@@ -0,0 +1,210 @@
+# Flow control shared by every request to Gousto
+
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adjusted by AIMD: it grows by one per limit's worth of
+    successful requests, and halves when a request is throttled, fails or
+    takes more than latency_tolerance times the baseline latency. Only
+    requests started after the last decrease can trigger another, so one
+    burst of slow responses halves it once rather than collapsing it.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_tolerance: float = 2.0,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        # Tracks the fastest latencies, drifting up slowly so it doesn't stay
+        # pinned to one unusually fast response
+        self.baseline_latency = math.inf
+        self._last_decrease = -math.inf
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> float:
+        """
+        Wait for a free slot, returning the start time to pass to release
+        """
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # Pass on the slot this waiter was woken for
+                    self._wake()
+                raise
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started_at: Optional[float], overloaded: bool = False) -> None:
+        """
+        Free a slot. started_at is None when the request was abandoned and
+        says nothing about upstream
+        """
+        self.in_flight -= 1
+        if started_at is not None:
+            now = time.monotonic()
+            latency = now - started_at
+            slow = latency > self.baseline_latency * self.latency_tolerance
+            if overloaded or slow:
+                if started_at > self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if not overloaded:
+                if latency < self.baseline_latency:
+                    self.baseline_latency = latency
+                else:
+                    self.baseline_latency += (latency - self.baseline_latency) / 100
+        self._wake()
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+class TokenBucket:
+    """
+    Caps the request rate at rate per second, allowing bursts of up to burst
+    requests. A rate of 0 disables it
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self._updated_at = time.monotonic()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+        # Take the token now and wait for it to be refilled, so callers are
+        # served in the order they arrived
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold failures in a row, pausing every caller of
+    wait for reset_seconds. Then one caller is let through as a probe: if it
+    succeeds the breaker closes, if it fails the breaker opens again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    async def wait(self) -> bool:
+        """
+        Wait until requests are allowed, returning True for the probe
+        """
+        while self.opened_at is not None:
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            elif not self._probing:
+                self._probing = True
+                return True
+            else:
+                await asyncio.sleep(min(1.0, self.reset_seconds))
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Gousto circuit breaker closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or (
+            self.opened_at is None and self.failures >= self.failure_threshold
+        ):
+            logger.warning(
+                "Gousto circuit breaker open for %ss after %s failures",
+                self.reset_seconds,
+                self.failures,
+            )
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def abandon(self, probe: bool) -> None:
+        """
+        Let another caller probe when the probe was cancelled
+        """
+        if probe:
+            self._probing = False
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header, in seconds or as an HTTP date
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(
+    attempt: int,
+    base: float,
+    cap: float,
+    retry_after: Optional[float] = None,
+) -> float:
+    """
+    Full jitter exponential backoff before retry number attempt (from 1),
+    but never sooner than retry_after
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, min(cap, retry_after))
+    return delay
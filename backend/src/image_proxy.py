@@ -0,0 +1,306 @@
+# Fetches Gousto images once, keeps them in a size-bounded on-disk LRU cache,
+# and serves resized variants of them
+
+import asyncio
+import fcntl
+import hashlib
+import io
+import os
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional, TextIO
+
+import aiohttp
+from PIL import Image
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from .single_flight import single_flight
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", ".image_cache")
+# Per process, each keeps its own part of the cache
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024**3)))
+# Upstream images larger than this aren't fetched
+IMAGE_MAX_DOWNLOAD_BYTES = int(
+    os.getenv("IMAGE_MAX_DOWNLOAD_BYTES", str(20 * 1024**2))
+)
+
+# Requested widths are rounded up to a multiple of this, to bound the number of variants
+IMAGE_WIDTH_STEP = 50
+MAX_IMAGE_WIDTH = 2000
+
+IMAGE_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+class ImageFetchError(Exception):
+    """Exception raised when the upstream image could not be fetched."""
+
+    def __init__(self, url: str, status: Optional[int], reason: str = ""):
+        self.url = url
+        self.status = status
+        detail = reason or f"HTTP {status}"
+        super().__init__(f"Could not fetch image {url}: {detail}")
+
+
+class DiskLRUCache:
+    """
+    Files kept in a directory, evicting the least recently used once the total
+    size exceeds max_bytes. The index lives in memory and is rebuilt from the
+    directory (ordered by access time) on startup.
+
+    Each process (e.g. uvicorn worker) keeps its files in a numbered
+    subdirectory it holds a lock on, so max_bytes holds per process. A
+    starting process takes the lowest numbered one nobody holds, so a
+    restarted worker carries on with the files of one that has exited.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory, self._lock_file = self._claim_directory(directory)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._index: OrderedDict[str, int] = OrderedDict()
+        # Keys that are being read, which aren't evicted
+        self._pinned: Counter[str] = Counter()
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith((".tmp", ".lock")):
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def _claim_directory(directory: str) -> tuple[str, TextIO]:
+        """
+        The first numbered subdirectory whose lock file can be locked, and the
+        lock file, which holds the lock until it's closed. Locks are released
+        by the kernel when a process exits, however it exits.
+        """
+        slot = 0
+        while True:
+            path = os.path.join(directory, str(slot))
+            os.makedirs(path, exist_ok=True)
+            lock_file = open(os.path.join(path, "cache.lock"), "w")  # noqa: SIM115
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return path, lock_file
+            except BlockingIOError:
+                lock_file.close()
+                slot += 1
+
+    def close(self) -> None:
+        """Let another process take over the directory"""
+        self._lock_file.close()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the path of the cached file, or None on a miss
+        """
+        if key not in self._index:
+            return None
+        path = self.path(key)
+        if not os.path.isfile(path):
+            # Removed from outside the cache
+            self.total_bytes -= self._index.pop(key)
+            return None
+        self._index.move_to_end(key)
+        return path
+
+    def pin(self, key: str) -> None:
+        """
+        Keeps key from being evicted, until as many calls to unpin
+        """
+        self._pinned[key] += 1
+
+    def unpin(self, key: str) -> None:
+        self._pinned[key] -= 1
+        if not self._pinned[key]:
+            del self._pinned[key]
+
+    @contextmanager
+    def pinned(self, key: str) -> Iterator[None]:
+        """
+        Keeps key from being evicted while its file is read
+        """
+        self.pin(key)
+        try:
+            yield
+        finally:
+            self.unpin(key)
+
+    def _write(self, key: str, data: bytes) -> None:
+        tmp_path = self.path(f"{key}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(key))
+
+    async def put(self, key: str, data: bytes) -> str:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write, key, data)
+
+        self.total_bytes += len(data) - self._index.pop(key, 0)
+        self._index[key] = len(data)
+        self._evict(keep=key)
+        return self.path(key)
+
+    def _evict(self, keep: str) -> None:
+        # Keys that can't be evicted are moved to the recently used end
+        skipped = 0
+        while self.total_bytes > self.max_bytes and skipped < len(self._index):
+            key, size = next(iter(self._index.items()))
+            if key == keep or key in self._pinned:
+                self._index.move_to_end(key)
+                skipped += 1
+                continue
+            del self._index[key]
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+
+_cache: Optional[DiskLRUCache] = None
+
+# Concurrent misses for the same key wait on the same fetch or resize
+_image_builds = single_flight("images")
+
+
+def get_cache() -> DiskLRUCache:
+    global _cache
+    if _cache is None:
+        _cache = DiskLRUCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+    return _cache
+
+
+def normalize_width(width: int) -> int:
+    width = min(width, MAX_IMAGE_WIDTH)
+    return -(-width // IMAGE_WIDTH_STEP) * IMAGE_WIDTH_STEP
+
+
+def cache_key(url: str, width: Optional[int] = None, image_format: str = "") -> str:
+    url_hash = hashlib.sha256(url.encode()).hexdigest()[:32]
+    if width is None:
+        return url_hash
+    return f"{url_hash}_w{width}.{image_format}"
+
+
+async def _read_limited(url: str, response: aiohttp.ClientResponse) -> bytes:
+    """
+    The response body, raising ImageFetchError as soon as it's known to be
+    larger than IMAGE_MAX_DOWNLOAD_BYTES
+    """
+    too_large = f"larger than {IMAGE_MAX_DOWNLOAD_BYTES} bytes"
+    if (response.content_length or 0) > IMAGE_MAX_DOWNLOAD_BYTES:
+        raise ImageFetchError(url, response.status, too_large)
+    data = bytearray()
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        data += chunk
+        if len(data) > IMAGE_MAX_DOWNLOAD_BYTES:
+            raise ImageFetchError(url, response.status, too_large)
+    return bytes(data)
+
+
+async def _fetch_original(url: str, key: str) -> str:
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    raise ImageFetchError(url, response.status)
+                data = await _read_limited(url, response)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise ImageFetchError(url, None, str(e) or type(e).__name__) from e
+    return await get_cache().put(key, data)
+
+
+def resize_image(path: str, width: int, image_format: str) -> bytes:
+    """
+    Resizes the image file to the given width (never upscaling) and re-encodes it
+    """
+    pil_format, _ = IMAGE_FORMATS[image_format]
+
+    with Image.open(path) as image:
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "RGBA") or pil_format == "JPEG":
+            image = image.convert("RGB")
+
+        output = io.BytesIO()
+        image.save(output, format=pil_format, quality=80)
+        return output.getvalue()
+
+
+async def get_original_path(url: str) -> str:
+    key = cache_key(url)
+    path = get_cache().get(key)
+    if path is not None:
+        return path
+    return await _image_builds.run(key, lambda: _fetch_original(url, key))
+
+
+async def get_variant_path(url: str, width: int, image_format: str) -> str:
+    key = cache_key(url, width, image_format)
+    path = get_cache().get(key)
+    if path is not None:
+        return path
+
+    async def build_variant() -> str:
+        # Other puts while it's resized could otherwise evict the original
+        original_key, original_path = await acquire_image(url)
+        try:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(
+                None, resize_image, original_path, width, image_format
+            )
+        finally:
+            get_cache().unpin(original_key)
+        return await get_cache().put(key, data)
+
+    return await _image_builds.run(key, build_variant)
+
+
+async def acquire_image(
+    url: str, width: Optional[int] = None, image_format: str = "jpeg"
+) -> tuple[str, str]:
+    """
+    The cache key and path of the image, or of its variant with a width,
+    pinned in the cache until get_cache().unpin(key)
+    """
+    cache = get_cache()
+    key = cache_key(url, width, image_format)
+    # A file can be evicted between being put and a waiting request resuming
+    for _ in range(3):
+        if width is None:
+            path = await get_original_path(url)
+        else:
+            path = await get_variant_path(url, width, image_format)
+        cache.pin(key)
+        if cache.get(key) is not None:
+            return key, path
+        cache.unpin(key)
+    raise ImageFetchError(url, None, "evicted from the cache before it was used")
+
+
+class CachedFileResponse(FileResponse):
+    """
+    Sends an image pinned by acquire_image, unpinning it once it's been sent
+    """
+
+    def __init__(self, key: str, **kwargs):
+        super().__init__(get_cache().path(key), **kwargs)
+        self.key = key
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            get_cache().unpin(self.key)
@@ -0,0 +1,211 @@
+# Logging for the backend. Records are put on a queue by whichever thread logs
+# them, and formatted and written by a background thread, so logging never
+# blocks the event loop on a slow stderr or pipe
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional, TextIO
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .models import LoggingStats
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Levels for particular loggers, e.g. LOG_LEVELS=src.gousto_fetcher=DEBUG,src.sql=WARNING
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# "json" writes one object per line, "text" one readable line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Records waiting to be written beyond this are dropped rather than waited for
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Slow statements are logged here, see log_slow_statements
+sql_logger = logging.getLogger("src.sql")
+
+# uvicorn's loggers write to stderr directly unless sent through the queue too
+_UVICORN_LOGGERS = ["uvicorn", "uvicorn.access"]
+
+# Attributes every record has, anything else was passed in extra=. uvicorn
+# passes its message again with terminal colours
+_RECORD_ATTRIBUTES = {
+    *vars(logging.makeLogRecord({})),
+    "message",
+    "asctime",
+    "taskName",
+    "color_message",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any extra= fields alongside the message"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value)
+            for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on a bounded queue without waiting, counting the ones dropped
+    when it's full. Only the message is formatted on the logging thread, as
+    its arguments may have changed by the time the record is written.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(levels: str) -> dict[str, int]:
+    """Parse "name=LEVEL,..." into levels by logger name"""
+    parsed = {}
+    for item in levels.split(","):
+        if not item.strip():
+            continue
+        name, _, level = item.partition("=")
+        number = logging.getLevelName(level.strip().upper())
+        if not isinstance(number, int):
+            raise ValueError(f"Unknown log level in LOG_LEVELS: '{item}'")
+        parsed[name.strip()] = number
+    return parsed
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[DroppingQueueHandler] = None
+
+
+def configure_logging(stream: Optional[TextIO] = None) -> DroppingQueueHandler:
+    """
+    Send every record, uvicorn's included, through the queue to stream
+    (stderr by default) at LOG_LEVEL, with LOG_LEVELS for particular loggers.
+    Does nothing until stop_logging if it's already configured.
+    """
+    global _listener, _handler
+    if _handler is not None:
+        return _handler
+
+    levels = parse_levels(LOG_LEVELS)
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(
+        JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    )
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = DroppingQueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    for name in _UVICORN_LOGGERS:
+        logger = logging.getLogger(name)
+        logger.handlers.clear()
+        logger.propagate = True
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+    return _handler
+
+
+def logging_stats() -> LoggingStats:
+    """Records waiting to be written, and dropped since logging was configured"""
+    if _handler is None:
+        return LoggingStats(queued=0, dropped=0)
+    return LoggingStats(queued=_handler.queue.qsize(), dropped=_handler.dropped)
+
+
+def stop_logging() -> None:
+    """
+    Write out the records still queued, with a warning if any were dropped,
+    and go back to no handler
+    """
+    global _listener, _handler
+    if _listener is None or _handler is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    if _handler.dropped:
+        warning = logging.makeLogRecord(
+            {
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": "%d log records were dropped because the queue was full",
+                "args": (_handler.dropped,),
+            }
+        )
+        for output in _listener.handlers:
+            output.handle(warning)
+    _listener = _handler = None
+
+
+# Whatever is still queued is written out before the process exits
+atexit.register(stop_logging)
+
+
+def log_slow_statements(
+    engine: AsyncEngine, threshold_seconds: float, sample_rate: float = 1.0
+) -> None:
+    """
+    Log statements run on engine that take at least threshold_seconds, or a
+    sample_rate fraction of them, to src.sql with how long they took. 0 logs
+    every statement. Parameters aren't logged, they can hold password hashes.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        context.statement_started_at = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def log_if_slow(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context.statement_started_at
+        if (
+            seconds >= threshold_seconds
+            and sql_logger.isEnabledFor(logging.INFO)
+            and (sample_rate >= 1 or random.random() < sample_rate)
+        ):
+            sql_logger.info(
+                "%.1f ms %s",
+                seconds * 1000,
+                statement,
+                extra={"seconds": round(seconds, 6), "rows": cursor.rowcount},
+            )
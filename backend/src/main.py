@@ -1,26 +1,80 @@
-from typing import Annotated, List, Tuple
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Annotated, AsyncIterator, List, Optional, Tuple
+import asyncio
+import mimetypes
 import os
+import zlib
 
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException, Security, status
+from fastapi import (Depends, FastAPI, HTTPException, Path, Query, Request,
+                     Response, Security, status)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import selectinload
-from sqlmodel import select
+from sqlmodel import col, delete, func, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from .auth import authenticate_user, create_access_token, get_current_user
-from .database import get_session
-from .gousto_fetcher import get_all_recipe_slugs, get_recipe_from_slug
-from .models import (BadRecipeSlug, ImageURL, Ingredient, IngredientSummary,
-                     InstructionStep, Recipe, RecipeCheckResult,
-                     RecipeIngredientLink, RecipePublic, RecipeSummary, Token,
-                     UserInDB)
+from .admission import admission, admission_stats
+from .auth import (authenticate_user, create_access_token, get_current_user,
+                   get_password_hash_async, get_secret_key)
+from .catalogue import (CatalogueFilter, add_to_catalogue, get_catalogue,
+                        remove_from_catalogue)
+from .changes import (get_changes, ingredient_upsert, recipe_delete,
+                      recipe_upsert, record_changes)
+from .database import (dispose_engines, get_engine, get_read_bind,
+                       get_read_session, get_session)
+from .gousto_fetcher import (UpstreamUnavailableError, get_all_recipe_slugs,
+                             get_recipe_from_slug)
+from .image_proxy import (IMAGE_FORMATS, CachedFileResponse, ImageFetchError,
+                          acquire_image, cache_key, get_cache, normalize_width)
+from .logs import configure_logging, logging_stats
+from .models import (AdmissionStats, BadRecipeSlug, ChangeSet, Health,
+                     ImageURL, Ingredient, IngredientCount, IngredientPairs,
+                     IngredientSummary, InstructionStep, LoggingStats,
+                     ProfileSummary, Readiness, Recipe, RecipeBatch,
+                     RecipeBatchRequest, RecipeCardsRequest, RecipeCheckResult,
+                     RecipeDeleteResult, RecipeFacets, RecipeIngredientLink,
+                     RecipeProjection, RecipePublic, RecipeSummary,
+                     SingleFlightStats, Token, UserInDB)
+from .profiling import (PROFILING_ENABLED, ProfilingMiddleware, list_profiles,
+                        profile_path)
+from .queries import (ImageProfile, Projection, get_or_create_images,
+                      load_best_images, load_recipe_batch, parse_projection,
+                      project_recipe, projection_options,
+                      recipe_detail_options, resolve_image_width,
+                      stream_recipes)
+from .read_snapshot import schedule_read_snapshot_rebuild
+from .recipe_cards import (MAIN_IMAGE_WIDTH, get_card_pdf, merged_card_pdf,
+                           pdf_chunks, shutdown_executor)
+from .single_flight import single_flight, single_flight_stats
+from .startup import open_pool, readiness, warm_up
 
 load_dotenv()
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    configure_logging()
+    # Warm up in the background, so /healthz and /readyz answer in the meantime
+    warm_up_task = asyncio.create_task(
+        warm_up(
+            [
+                ("auth", warm_auth),
+                ("pool", open_pools),
+                ("queries", warm_queries),
+                ("state", build_state),
+            ]
+        )
+    )
+    yield
+    warm_up_task.cancel()
+    # Waits for cards being rendered, and stops the render worker processes
+    await asyncio.to_thread(shutdown_executor)
+    await dispose_engines()
+
+
+app = FastAPI(lifespan=lifespan)
 
 frontend_urls = os.getenv("FRONTEND_URLS", "http://localhost:5173")
 allowed_origins = [url.strip() for url in frontend_urls.split(",")]
@@ -31,8 +85,84 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id"],
 )
 
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Health
+
+
+@app.get("/healthz", response_model=Health)
+async def get_health():
+    """
+    Liveness: the worker is up and serving requests.
+    """
+    return Health()
+
+
+@app.get(
+    "/readyz",
+    response_model=Readiness,
+    responses={503: {"model": Readiness, "description": "Not ready"}},
+)
+async def get_readiness():
+    """
+    Readiness: the warm-up has finished, with the time each phase took, or the
+    error it failed with.
+    """
+    report = readiness()
+    if not report.ready:
+        return JSONResponse(status_code=503, content=report.model_dump())
+    return report
+
+
+async def warm_auth():
+    get_secret_key()
+    # Loads the bcrypt backend and starts its worker thread
+    await get_password_hash_async("warm-up")
+
+
+async def open_pools():
+    await open_pool(get_engine())
+    if get_engine(read_only=True) is not get_engine():
+        await open_pool(get_engine(read_only=True))
+
+
+async def warm_queries():
+    """
+    Run the hot read queries on as many connections at once as the read pool
+    keeps open, so each has them in its statement cache
+    """
+    read_bind = get_read_bind()
+    size_of = getattr(read_bind.sync_engine.pool, "size", None)
+    async with AsyncSession(read_bind) as session:
+        result = await session.exec(
+            select(Recipe.slug).limit(size_of() if size_of is not None else 1)
+        )
+        slugs = result.all()
+
+    async def warm_read(slug: str):
+        async with AsyncSession(read_bind) as session:
+            # Different slugs, so the loads aren't coalesced onto one connection
+            await get_recipe_by_slug(slug, None, None, session=session)
+            await get_recipe_by_slug(slug, None, "card", session=session)
+            await list_recipes(session=session)
+            await list_ingredients(session=session)
+
+    await asyncio.gather(*(warm_read(slug) for slug in slugs))
+
+    async with AsyncSession(get_engine()) as session:
+        await session.exec(select(UserInDB).where(UserInDB.username == ""))
+
+
+async def build_state():
+    async with AsyncSession(get_read_bind()) as session:
+        await get_catalogue(session)
+    get_cache()
+
+
 # Auth
 
 
@@ -54,19 +184,19 @@ async def login_for_access_token(
 
 # Recipes
 
+# Concurrent identical requests share one run, see single_flight.py
+_recipe_adds = single_flight("recipe_adds")
+_recipe_reads = single_flight("recipe_reads")
 
-@app.post(
-    "/recipes/add/{slug}",
-    response_model=RecipePublic,
-    responses={401: {"description": "Unauthorized"}},
-)
-async def add_recipe_to_db(
-    slug: str,
-    session: AsyncSession = Depends(get_session),
-    _current_user: UserInDB = Security(get_current_user, scopes=["user"]),
-):
+# Rate limits per client and caps concurrent requests, see admission.py
+admit_detail = admission("detail")
+admit_list = admission("list")
+admit_cards = admission("cards")
+
+
+async def add_recipe(slug: str, session: AsyncSession) -> RecipePublic:
     """
-    Add a recipe to the database using its Gousto slug.
+    Fetch a recipe from Gousto and add it to the database.
     """
     try:
         # Check if recipe already exists
@@ -87,6 +217,11 @@ async def add_recipe_to_db(
         # Attempt to fetch recipe data
         try:
             recipe_data = await get_recipe_from_slug(slug)
+        except UpstreamUnavailableError as fetch_error:
+            # Not the slug's fault, so don't mark it as bad
+            raise HTTPException(
+                status_code=503, detail=f"Could not fetch recipe: {fetch_error}"
+            )
         except Exception as fetch_error:
             if not bad_slug:
                 # Add to BadRecipeSlug if not already present
@@ -102,12 +237,40 @@ async def add_recipe_to_db(
             await session.delete(bad_slug)
             await session.commit()
 
+        # Images are shared between owners, so insert any new urls once up front
+        images_by_url = await get_or_create_images(
+            session,
+            [
+                *recipe_data.images,
+                *(
+                    image_data
+                    for ingredient_data in recipe_data.ingredients
+                    for image_data in ingredient_data.image_urls
+                ),
+                *(
+                    image_data
+                    for instruction_step_data in recipe_data.instruction_steps
+                    for image_data in instruction_step_data.image_urls
+                ),
+            ],
+        )
+
+        def linked_images(image_data_list) -> List[ImageURL]:
+            # The same url can't be linked to one owner twice
+            urls = dict.fromkeys(image_data.url for image_data in image_data_list)
+            return [images_by_url[url] for url in urls]
+
         # Ingredients
         ingredient_obj_amount_list: List[Tuple[Ingredient, str]] = []
+        new_ingredient_objs: List[Ingredient] = []
 
         for ingredient_data in recipe_data.ingredients:
-            statement = select(Ingredient).where(
-                Ingredient.name == ingredient_data.name
+            # FOR SHARE keeps garbage collection from deleting it until the
+            # recipe is linked to it
+            statement = (
+                select(Ingredient)
+                .where(Ingredient.name == ingredient_data.name)
+                .with_for_update(read=True)
             )
             result = await session.exec(statement)
             existing_ingredient = result.one_or_none()
@@ -115,17 +278,13 @@ async def add_recipe_to_db(
             if existing_ingredient:
                 ingredient_obj = existing_ingredient
             else:
-                ingredient_obj = Ingredient(name=ingredient_data.name)
+                ingredient_obj = Ingredient(
+                    name=ingredient_data.name,
+                    images=linked_images(ingredient_data.image_urls),
+                )
 
                 session.add(ingredient_obj)
-
-                for image_data in ingredient_data.image_urls:
-                    image_obj = ImageURL(
-                        url=image_data.url,
-                        width=image_data.width,
-                        ingredient=ingredient_obj,
-                    )
-                    session.add(image_obj)
+                new_ingredient_objs.append(ingredient_obj)
 
             # Needed for link objects
             ingredient_obj_amount_list.append((ingredient_obj, ingredient_data.amount))
@@ -137,17 +296,13 @@ async def add_recipe_to_db(
             instruction_text = instruction_step_data.description
             order = instruction_step_data.step_number
 
-            instruction_step_obj = InstructionStep(text=instruction_text, order=order)
+            instruction_step_obj = InstructionStep(
+                text=instruction_text,
+                order=order,
+                images=linked_images(instruction_step_data.image_urls),
+            )
             session.add(instruction_step_obj)
 
-            for image_data in instruction_step_data.image_urls:
-                image_obj = ImageURL(
-                    url=image_data.url,
-                    width=image_data.width,
-                    instruction_step=instruction_step_obj,
-                )
-                session.add(image_obj)
-
             instruction_step_obj_list.append(instruction_step_obj)
 
         recipe_obj = Recipe(
@@ -158,16 +313,9 @@ async def add_recipe_to_db(
             prep_time=recipe_data.prep_time,
             basic_ingredients=recipe_data.basic_ingredients,
             instruction_steps=instruction_step_obj_list,
+            images=linked_images(recipe_data.images),
         )
 
-        for recipe_image_data in recipe_data.images:
-            image_obj = ImageURL(
-                url=recipe_image_data.url,
-                width=recipe_image_data.width,
-                recipe=recipe_obj,
-            )
-            session.add(image_obj)
-
         # update link objects
         for ingredient_obj, ingredient_amount in ingredient_obj_amount_list:
             link_obj = RecipeIngredientLink(
@@ -175,35 +323,64 @@ async def add_recipe_to_db(
             )
             session.add(link_obj)
 
+        # Flushed first so the change log entries have ids
+        await session.flush()
+        await record_changes(
+            session,
+            [
+                *(ingredient_upsert(obj) for obj in new_ingredient_objs),
+                recipe_upsert(recipe_obj),
+            ],
+        )
         await session.commit()
         await session.refresh(recipe_obj)
+        schedule_read_snapshot_rebuild()
 
         # Re-query the newly created recipe with eager loading:
         stmt = (
             select(Recipe)
-            .options(
-                selectinload(Recipe.instruction_steps).options(
-                    selectinload(InstructionStep.images)
-                ),
-                selectinload(Recipe.ingredients).options(
-                    selectinload(RecipeIngredientLink.ingredient).options(
-                        selectinload(Ingredient.images)
-                    )
-                ),
-                selectinload(Recipe.images),
-            )
+            .options(*recipe_detail_options())
             .where(Recipe.id == recipe_obj.id)
         )
         result = await session.exec(stmt)
         fresh_recipe_obj = result.one()
-        return fresh_recipe_obj
+        add_to_catalogue(fresh_recipe_obj)
+        return RecipePublic.model_validate(fresh_recipe_obj)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Could not add recipe: {e}") from e
 
 
-@app.get("/recipes/list", response_model=List[RecipeSummary])
-async def list_recipes(session: AsyncSession = Depends(get_session)):
+@app.post(
+    "/recipes/add/{slug}",
+    response_model=RecipePublic,
+    responses={401: {"description": "Unauthorized"}},
+)
+async def add_recipe_to_db(
+    slug: str,
+    session: AsyncSession = Depends(get_session),
+    _current_user: UserInDB = Security(get_current_user, scopes=["user"]),
+):
+    """
+    Add a recipe to the database using its Gousto slug. Concurrent adds of the
+    same slug share one fetch from Gousto and one write.
+    """
+
+    async def add() -> RecipePublic:
+        async with AsyncSession(session.bind) as add_session:
+            return await add_recipe(slug, add_session)
+
+    return await _recipe_adds.run(slug, add)
+
+
+@app.get(
+    "/recipes/list",
+    response_model=List[RecipeSummary],
+    dependencies=[Depends(admit_list)],
+)
+async def list_recipes(session: AsyncSession = Depends(get_read_session)):
     """
     Get a list of all recipe slugs and names.
     """
@@ -213,6 +390,71 @@ async def list_recipes(session: AsyncSession = Depends(get_session)):
     return recipes
 
 
+async def recipe_export_chunks(
+    since: Optional[datetime], compress: bool
+) -> AsyncIterator[bytes]:
+    # The request's session is closed before a streaming response is sent,
+    # so the export holds its own for as long as it runs
+    compressor = zlib.compressobj(wbits=31) if compress else None  # gzip
+    async with AsyncSession(get_engine(read_only=True)) as session:
+        async for recipes in stream_recipes(session, since):
+            chunk = "".join(
+                RecipePublic.model_validate(recipe).model_dump_json() + "\n"
+                for recipe in recipes
+            ).encode()
+            if compressor:
+                # Sync flush, so the client can decode each chunk as it arrives
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header allows gzip, named or through *, with a
+    q-value above 0
+    """
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, *params = (part.strip() for part in coding.split(";"))
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.lower()] = quality
+    for name in ("gzip", "x-gzip", "*"):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+@app.get(
+    "/recipes/export.ndjson",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+    dependencies=[Depends(admit_list)],
+)
+async def export_recipes(request: Request, since: Optional[datetime] = None):
+    """
+    Stream every recipe as one RecipePublic JSON object per line, or only those
+    updated after since. Gzipped when the client accepts it.
+    """
+    compress = accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept-Encoding"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        recipe_export_chunks(since, compress),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
 @app.delete("/recipes/delete/{slug}", responses={401: {"description": "Unauthorized"}})
 async def delete_recipe_by_slug(
     slug: str,
@@ -222,44 +464,199 @@ async def delete_recipe_by_slug(
     """
     Delete a recipe by its slug.
     """
-    # Find the recipe by slug
-    statement = select(Recipe).where(Recipe.slug == slug)
+    # Steps, ingredient links and image links are removed by ON DELETE CASCADE
+    statement = delete(Recipe).where(Recipe.slug == slug).returning(Recipe.id)
     result = await session.exec(statement)
-    recipe = result.one_or_none()
+    deleted_id = result.scalar_one_or_none()
 
-    if recipe is None:
+    if deleted_id is None:
         raise HTTPException(
             status_code=404, detail=f"Recipe with slug '{slug}' not found."
         )
 
-    # If found, delete it
-    await session.delete(recipe)
+    await record_changes(session, [recipe_delete(deleted_id, slug)])
     await session.commit()
 
+    remove_from_catalogue([deleted_id])
+    schedule_read_snapshot_rebuild()
+
     return {"ok": True, "message": f"Recipe '{slug}' has been deleted."}
 
 
-@app.get("/recipes/slug/{slug}", response_model=RecipePublic)
-async def get_recipe_by_slug(slug: str, session: AsyncSession = Depends(get_session)):
+@app.delete(
+    "/recipes",
+    response_model=RecipeDeleteResult,
+    responses={401: {"description": "Unauthorized"}},
+)
+async def delete_recipes(
+    slugs: List[str] = Query(min_length=1, max_length=1000, alias="slug"),
+    session: AsyncSession = Depends(get_session),
+    _current_user: UserInDB = Security(get_current_user, scopes=["user"]),
+):
     """
-    Get a recipe by its slug.
+    Delete every recipe with one of the given slugs (?slug=a&slug=b) in a single statement.
     """
     statement = (
-        select(Recipe)
-        .where(Recipe.slug == slug)
-        .options(
-            # Eager-load instruction steps + their images
-            selectinload(Recipe.instruction_steps).selectinload(InstructionStep.images),
-            # Eager-load recipe images
-            selectinload(Recipe.images),
-            # Eager-load ingredient links and their associated ingredient objects & images
-            selectinload(Recipe.ingredients)
-            .selectinload(RecipeIngredientLink.ingredient)
-            .selectinload(Ingredient.images),
-        )
+        delete(Recipe)
+        .where(col(Recipe.slug).in_(slugs))
+        .returning(Recipe.id, Recipe.slug)
     )
     result = await session.exec(statement)
-    recipe = result.one_or_none()
+    deleted = dict(result.all())
+    await record_changes(
+        session,
+        [recipe_delete(recipe_id, slug) for recipe_id, slug in deleted.items()],
+    )
+    await session.commit()
+
+    if deleted:
+        remove_from_catalogue(deleted.keys())
+        schedule_read_snapshot_rebuild()
+
+    deleted_slugs = set(deleted.values())
+    requested_slugs = list(dict.fromkeys(slugs))
+    return RecipeDeleteResult(
+        deleted_slugs=[slug for slug in requested_slugs if slug in deleted_slugs],
+        missing_slugs=[slug for slug in requested_slugs if slug not in deleted_slugs],
+    )
+
+
+def catalogue_filter(
+    max_prep_time: Optional[int] = Query(default=None, ge=0),
+    min_rating: Optional[float] = Query(default=None, ge=0, le=5),
+    max_ingredients: Optional[int] = Query(default=None, ge=0),
+    ingredient_id: List[int] = Query(default=[]),
+) -> CatalogueFilter:
+    return CatalogueFilter(
+        max_prep_time=max_prep_time,
+        min_rating=min_rating,
+        max_ingredients=max_ingredients,
+        ingredient_ids=tuple(sorted(set(ingredient_id))),
+    )
+
+
+@app.get("/recipes/random", response_model=List[RecipeSummary])
+async def get_random_recipes(
+    count: int = Query(default=1, ge=1, le=50),
+    recipe_filter: CatalogueFilter = Depends(catalogue_filter),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Pick up to count distinct random recipes, optionally only those with at most
+    max_prep_time minutes, at least min_rating, at most max_ingredients and every
+    ingredient_id (?ingredient_id=1&ingredient_id=2).
+    """
+    catalogue = await get_catalogue(session)
+    recipes = catalogue.random(recipe_filter, count)
+    if not recipes:
+        raise HTTPException(status_code=404, detail="No recipes match the filters")
+    return recipes
+
+
+@app.get("/recipes/facets", response_model=RecipeFacets)
+async def get_recipe_facets(
+    ingredient_limit: int = Query(default=10, ge=0, le=100),
+    recipe_filter: CatalogueFilter = Depends(catalogue_filter),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Count the recipes matching the same filters as /recipes/random, in total,
+    by prep time and rating thresholds, and for the most common ingredients.
+    """
+    catalogue = await get_catalogue(session)
+    return catalogue.facets(recipe_filter, ingredient_limit)
+
+
+async def load_recipe(
+    session: AsyncSession,
+    key: tuple,
+    condition,
+    width: Optional[int],
+    projection: Projection,
+) -> Optional[RecipePublic | RecipeProjection]:
+    """
+    Load the recipe matching condition, with only the best images for width if
+    given, and only the projection's columns and relationships unless it's the
+    full one. Concurrent loads with the same key share one set of queries, run
+    in a session of their own on the same database as session.
+    """
+
+    async def load() -> Optional[RecipePublic | RecipeProjection]:
+        async with AsyncSession(session.bind) as load_session:
+            include_images = width is None
+            options = (
+                recipe_detail_options(include_images)
+                if projection.is_full
+                else projection_options(projection, include_images)
+            )
+            result = await load_session.exec(
+                select(Recipe).where(condition).options(*options)
+            )
+            recipe = result.one_or_none()
+            if recipe is None:
+                return None
+            if width is not None and projection.includes_images:
+                await load_best_images(load_session, [recipe], width)
+            if projection.is_full:
+                return RecipePublic.model_validate(recipe)
+            return project_recipe(recipe, projection)
+
+    return await _recipe_reads.run(key, load)
+
+
+def recipe_projection(fields: Optional[str], include: Optional[str]) -> Projection:
+    try:
+        return parse_projection(fields, include)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+
+FieldsQuery = Annotated[
+    Optional[str],
+    Query(description="Comma-separated recipe fields to return, e.g. title,rating"),
+]
+IncludeQuery = Annotated[
+    Optional[str],
+    Query(
+        description="Comma-separated relationships to return: images, steps, "
+        "steps.images, ingredients, ingredients.images"
+    ),
+]
+
+
+@app.get(
+    "/recipes/slug/{slug}",
+    response_model=RecipeProjection,
+    response_model_exclude_unset=True,
+    dependencies=[Depends(admit_detail)],
+)
+async def get_recipe_by_slug(
+    slug: str,
+    image_width: Optional[int] = Query(default=None, ge=1),
+    image_profile: Optional[ImageProfile] = None,
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Get a recipe by its slug.
+
+    With image_width or image_profile, only the best matching image is returned
+    for the recipe and each of its steps and ingredients.
+
+    With fields or include, only those fields and relationships are loaded and
+    returned, along with the id. Fields default to all of them and include to
+    none, e.g. ?fields=title,rating&include=images for a recipe tile.
+    """
+    width = resolve_image_width(image_width, image_profile)
+    projection = recipe_projection(fields, include)
+    recipe = await load_recipe(
+        session,
+        ("slug", slug, width, projection),
+        Recipe.slug == slug,
+        width,
+        projection,
+    )
 
     if recipe is None:
         raise HTTPException(
@@ -269,29 +666,38 @@ async def get_recipe_by_slug(slug: str, session: AsyncSession = Depends(get_sess
     return recipe
 
 
-@app.get("/recipes/id/{recipe_id}", response_model=RecipePublic)
+@app.get(
+    "/recipes/id/{recipe_id}",
+    response_model=RecipeProjection,
+    response_model_exclude_unset=True,
+    dependencies=[Depends(admit_detail)],
+)
 async def get_recipe_by_id(
-    recipe_id: int, session: AsyncSession = Depends(get_session)
+    recipe_id: int,
+    image_width: Optional[int] = Query(default=None, ge=1),
+    image_profile: Optional[ImageProfile] = None,
+    fields: FieldsQuery = None,
+    include: IncludeQuery = None,
+    session: AsyncSession = Depends(get_read_session),
 ):
     """
     Get a recipe by its ID.
+
+    With image_width or image_profile, only the best matching image is returned
+    for the recipe and each of its steps and ingredients.
+
+    With fields or include, only those fields and relationships are loaded and
+    returned, along with the id, as for /recipes/slug.
     """
-    statement = (
-        select(Recipe)
-        .where(Recipe.id == recipe_id)
-        .options(
-            # Eager-load instruction steps + their images
-            selectinload(Recipe.instruction_steps).selectinload(InstructionStep.images),
-            # Eager-load recipe images
-            selectinload(Recipe.images),
-            # Eager-load ingredient links and their associated ingredient objects & images
-            selectinload(Recipe.ingredients)
-            .selectinload(RecipeIngredientLink.ingredient)
-            .selectinload(Ingredient.images),
-        )
+    width = resolve_image_width(image_width, image_profile)
+    projection = recipe_projection(fields, include)
+    recipe = await load_recipe(
+        session,
+        ("id", recipe_id, width, projection),
+        Recipe.id == recipe_id,
+        width,
+        projection,
     )
-    result = await session.exec(statement)
-    recipe = result.one_or_none()
 
     if recipe is None:
         raise HTTPException(
@@ -301,29 +707,111 @@ async def get_recipe_by_id(
     return recipe
 
 
-@app.get("/ingredients/list", response_model=List[IngredientSummary])
-async def list_ingredients(session: AsyncSession = Depends(get_session)):
+@app.post(
+    "/recipes/batch",
+    response_model=RecipeBatch,
+    dependencies=[Depends(admit_detail)],
+)
+async def get_recipe_batch(
+    batch_request: RecipeBatchRequest,
+    image_width: Optional[int] = Query(default=None, ge=1),
+    image_profile: Optional[ImageProfile] = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Get many recipes by slug and/or id in one request, in the order given.
+
+    Ingredients and images are listed once in the response and referenced by
+    id from the recipes. Slugs and ids that weren't found are listed as missing.
+    """
+    width = resolve_image_width(image_width, image_profile)
+    return await load_recipe_batch(
+        session, batch_request.slugs, batch_request.ids, width
+    )
+
+
+@app.get(
+    "/ingredients/list",
+    response_model=List[IngredientSummary],
+    dependencies=[Depends(admit_list)],
+)
+async def list_ingredients(session: AsyncSession = Depends(get_read_session)):
     """
     Get a list of all ingredient names and ids.
     """
-    statement = select(Ingredient.name, Ingredient.id)
+    statement = select(Ingredient.name, Ingredient.id).where(
+        col(Ingredient.canonical_id).is_(None)
+    )
     result = await session.exec(statement)
     ingredients = result.all()
     return ingredients
 
 
-@app.get("/recipes/by-ingredient/{ingredient_id}", response_model=List[RecipeSummary])
+@app.get("/ingredients/counts", response_model=List[IngredientCount])
+async def list_ingredient_counts(session: AsyncSession = Depends(get_read_session)):
+    """
+    Get every ingredient used by a recipe with its number of recipes, most
+    used first.
+    """
+    catalogue = await get_catalogue(session)
+    return catalogue.counted_ingredients()
+
+
+@app.get("/ingredients/suggest", response_model=List[IngredientCount])
+async def suggest_ingredients(
+    q: str = Query(min_length=1, max_length=100),
+    limit: int = Query(default=10, ge=1, le=50),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Suggest ingredients as a name is typed, most used first. Every word of q
+    has to start a word of the name.
+    """
+    catalogue = await get_catalogue(session)
+    return catalogue.suggest_ingredients(q, limit)
+
+
+@app.get("/ingredients/{ingredient_id}/pairs", response_model=IngredientPairs)
+async def get_ingredient_pairs(
+    ingredient_id: int,
+    limit: int = Query(default=10, ge=1, le=100),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Get the ingredients most often used together with an ingredient, with the
+    number of recipes using both.
+    """
+    catalogue = await get_catalogue(session)
+    pairs = catalogue.ingredient_pairs(ingredient_id, limit)
+    if pairs is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No recipes found with ingredient ID '{ingredient_id}'",
+        )
+    return pairs
+
+
+@app.get(
+    "/recipes/by-ingredient/{ingredient_id}",
+    response_model=List[RecipeSummary],
+    dependencies=[Depends(admit_list)],
+)
 async def get_recipes_by_ingredient_id(
-    ingredient_id: int, session: AsyncSession = Depends(get_session)
+    ingredient_id: int, session: AsyncSession = Depends(get_read_session)
 ):
     """
-    Get all recipes that include a specific ingredient by its ID.
+    Get all recipes that include a specific ingredient by its ID. The ID of an
+    ingredient merged into another one finds the other one's recipes.
     """
-    # Query to find all recipe links with the given ingredient ID
+    canonical_id = (
+        select(func.coalesce(Ingredient.canonical_id, Ingredient.id))
+        .where(Ingredient.id == ingredient_id)
+        .scalar_subquery()
+    )
     statement = (
         select(Recipe)
         .join(RecipeIngredientLink)
-        .where(RecipeIngredientLink.ingredient_id == ingredient_id)
+        .where(RecipeIngredientLink.ingredient_id == canonical_id)
     )
     result = await session.exec(statement)
     recipes = result.all()
@@ -351,7 +839,7 @@ async def check_new_recipes(
     """
     try:
         # Fetch all recipe stubs from Gousto
-        gousto_recipes = await get_all_recipe_slugs(max_concurrent_requests=50)
+        gousto_recipes = await get_all_recipe_slugs()
 
         # Fetch all existing recipes from the database
         statement = select(Recipe.slug)
@@ -376,7 +864,230 @@ async def check_new_recipes(
             previously_bad_recipe_slugs=list(previously_bad_recipe_slugs),
         )
 
+    except UpstreamUnavailableError as e:
+        raise HTTPException(
+            status_code=503, detail=f"Error syncing recipes: {e}"
+        ) from e
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error syncing recipes: {e}"
         ) from e
+
+
+@app.get("/stats/single-flight", response_model=List[SingleFlightStats])
+async def get_single_flight_stats():
+    """
+    Get how many calls each single-flight group has had, and how many of them
+    were coalesced into a call already in flight.
+    """
+    return single_flight_stats()
+
+
+@app.get("/stats/logging", response_model=LoggingStats)
+async def get_logging_stats(
+    _current_user: UserInDB = Security(get_current_user, scopes=["user"]),
+):
+    """
+    Get how many log records are waiting to be written, and how many were
+    dropped because too many were waiting.
+    """
+    return logging_stats()
+
+
+@app.get("/stats/admission", response_model=List[AdmissionStats])
+async def get_admission_stats(
+    _current_user: UserInDB = Security(get_current_user, scopes=["user"]),
+):
+    """
+    Get the current and total admitted and rejected requests of each group of
+    rate limited endpoints.
+    """
+    return admission_stats()
+
+
+# Profiles
+
+
+@app.get("/profiles", response_model=List[ProfileSummary])
+async def get_profiles(
+    _current_user: UserInDB = Security(get_current_user, scopes=["user"]),
+):
+    """
+    List the saved request profiles, newest first. Requests are profiled when
+    PROFILING_ENABLED is set, for authenticated clients sending an X-Profile
+    header, and a PROFILE_SAMPLE_RATE fraction of other requests.
+    """
+    return await asyncio.to_thread(list_profiles)
+
+
+@app.get("/profiles/{profile_id}", response_class=FileResponse)
+async def get_profile(
+    profile_id: str = Path(pattern=r"^[0-9a-f]{32}$"),
+    _current_user: UserInDB = Security(get_current_user, scopes=["user"]),
+):
+    """
+    Get a profile's samples as folded stacks, one "outer;...;inner count" line
+    per stack, for flamegraph.pl, speedscope or inferno. Samples taken while
+    the request was awaiting start with [waiting], and those of other requests
+    running meanwhile with [other tasks].
+    """
+    path = profile_path(profile_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"Profile '{profile_id}' not found")
+    return FileResponse(path, media_type="text/plain")
+
+
+# Changes
+
+
+@app.get("/changes", response_model=ChangeSet, dependencies=[Depends(admit_list)])
+async def list_changes(
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(default=1000, ge=1, le=10000),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Recipes and ingredients added or deleted after version since, oldest first.
+    Pass the returned version as since next time; start from 0.
+    """
+    # From the primary: the read snapshot doesn't carry the change log
+    return await get_changes(session, since, limit)
+
+
+# Images
+
+
+@app.get(
+    "/images/{image_id}",
+    response_class=FileResponse,
+    responses={404: {"description": "Not found"}, 502: {"description": "Bad gateway"}},
+)
+async def get_image(
+    image_id: int,
+    request: Request,
+    width: Optional[int] = Query(default=None, ge=1),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Serve an image through the backend's cache, optionally resized to the given width.
+    """
+    image = await session.get(ImageURL, image_id)
+    if image is None:
+        raise HTTPException(
+            status_code=404, detail=f"Image with ID '{image_id}' not found"
+        )
+    url = image.url
+    # Don't hold a pooled connection while waiting on the upstream fetch
+    await session.close()
+
+    if width is None:
+        key = cache_key(url)
+        media_type = mimetypes.guess_type(url)[0] or "application/octet-stream"
+    else:
+        width = normalize_width(width)
+        accepts_webp = "image/webp" in request.headers.get("accept", "")
+        image_format = "webp" if accepts_webp else "jpeg"
+        key = cache_key(url, width, image_format)
+        media_type = IMAGE_FORMATS[image_format][1]
+
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{key}"',
+        "Vary": "Accept",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        if width is None:
+            await acquire_image(url)
+        else:
+            await acquire_image(url, width, image_format)
+    except ImageFetchError as e:
+        raise HTTPException(status_code=502, detail=str(e)) from e
+
+    # Kept from being evicted until it's been sent
+    return CachedFileResponse(key, media_type=media_type, headers=headers)
+
+
+# Recipe cards
+
+
+async def load_recipes_for_cards(
+    session: AsyncSession, slugs: List[str]
+) -> List[RecipePublic]:
+    """
+    Loads the recipes in the order of the given slugs, with one image per owner
+    """
+    statement = (
+        select(Recipe)
+        .where(col(Recipe.slug).in_(slugs))
+        .options(*recipe_detail_options(include_images=False))
+    )
+    result = await session.exec(statement)
+    recipes_by_slug = {recipe.slug: recipe for recipe in result.all()}
+
+    missing_slugs = [slug for slug in slugs if slug not in recipes_by_slug]
+    if missing_slugs:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Recipes with slugs {missing_slugs} not found",
+        )
+
+    await load_best_images(session, list(recipes_by_slug.values()), MAIN_IMAGE_WIDTH)
+    return [RecipePublic.model_validate(recipes_by_slug[slug]) for slug in slugs]
+
+
+@app.get(
+    "/recipes/{slug}/card.pdf",
+    response_class=Response,
+    responses={
+        200: {"content": {"application/pdf": {}}},
+        404: {"description": "Not found"},
+    },
+    dependencies=[Depends(admit_cards)],
+)
+async def get_recipe_card_pdf(
+    slug: str, session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get a printable A4 recipe card as a PDF.
+    """
+    (recipe,) = await load_recipes_for_cards(session, [slug])
+    # Rendering can take a while, don't hold a pooled connection during it
+    await session.close()
+
+    pdf = await get_card_pdf(recipe)
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'inline; filename="{slug}.pdf"'},
+    )
+
+
+@app.post(
+    "/cards.pdf",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {"application/pdf": {}}},
+        404: {"description": "Not found"},
+    },
+    dependencies=[Depends(admit_cards)],
+)
+async def get_recipe_cards_pdf(
+    cards_request: RecipeCardsRequest,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Get the cards of many recipes merged into one A4 PDF, in the order given.
+    """
+    recipes = await load_recipes_for_cards(session, cards_request.slugs)
+    await session.close()
+
+    # Rendered before returning, so it holds the admission slot while it runs
+    pdf = await merged_card_pdf(recipes)
+    return StreamingResponse(
+        pdf_chunks(pdf),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'inline; filename="recipe-cards.pdf"'},
+    )
@@ -0,0 +1,241 @@
+# Garbage collection of rows no recipe refers to any more, and merging of
+# ingredients stored under different names for the same canonical name
+
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import Connection, delete, exists, text
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .changes import (CHANGE_LOG_LOCK_KEY, ChangeRecord, ingredient_delete,
+                      record_changes)
+from .gousto_fetcher import canonical_ingredient_name
+from .models import (ImageURL, Ingredient, IngredientImageLink,
+                     InstructionStepImageLink, RecipeImageLink,
+                     RecipeIngredientLink)
+
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", "1000"))
+
+
+@dataclass
+class GarbageCollectionResult:
+    ingredients: int = 0
+    images: int = 0
+
+
+def _orphaned_ingredients() -> list:
+    return [
+        col(Ingredient.canonical_id).is_(None),
+        ~exists().where(RecipeIngredientLink.ingredient_id == Ingredient.id),
+    ]
+
+
+def _orphaned_images() -> list:
+    return [
+        ~exists().where(RecipeImageLink.image_id == ImageURL.id),
+        ~exists().where(InstructionStepImageLink.image_id == ImageURL.id),
+        ~exists().where(IngredientImageLink.image_id == ImageURL.id),
+    ]
+
+
+async def _delete_in_batches(
+    session: AsyncSession,
+    model,
+    orphaned: list,
+    batch_size: int,
+    change_record: Optional[Callable[..., ChangeRecord]] = None,
+) -> int:
+    """
+    Delete the rows matching orphaned until none are left, committing after
+    every batch so no transaction holds locks on more than one batch. With
+    change_record, each deleted row (id and name) is also added to the change
+    log in the same transaction.
+
+    Each batch is locked with FOR UPDATE SKIP LOCKED before it is deleted, and
+    add_recipe takes FOR SHARE on the rows it reuses, so a row a recipe is being
+    linked to is skipped. The delete checks orphaned again once the batch is
+    locked, for rows a recipe was linked to after the batch was selected.
+    """
+    deleted = 0
+    while True:
+        ids = (
+            await session.exec(
+                select(model.id)
+                .where(*orphaned)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+        ).all()
+        if not ids:
+            await session.commit()
+            return deleted
+        statement = (
+            delete(model)
+            .where(col(model.id).in_(ids), *orphaned)
+            .execution_options(synchronize_session=False)
+        )
+        if change_record:
+            statement = statement.returning(model.id, model.name)
+        result = await session.exec(statement)
+        if change_record:
+            rows = result.all()
+            await record_changes(session, [change_record(*row) for row in rows])
+            rowcount = len(rows)
+        else:
+            rowcount = result.rowcount
+        await session.commit()
+        deleted += rowcount
+        # Let other work on the event loop run between batches
+        await asyncio.sleep(0)
+
+
+async def collect_garbage(
+    session: AsyncSession, batch_size: int = GC_BATCH_SIZE
+) -> GarbageCollectionResult:
+    """
+    Delete ingredients no recipe uses, then images nothing links to.
+
+    Ingredients go first: deleting one cascades to its image links, which can
+    leave its images orphaned in turn.
+    """
+    ingredients = await _delete_in_batches(
+        session, Ingredient, _orphaned_ingredients(), batch_size, ingredient_delete
+    )
+    images = await _delete_in_batches(
+        session, ImageURL, _orphaned_images(), batch_size
+    )
+    return GarbageCollectionResult(ingredients=ingredients, images=images)
+
+
+# Each statement takes arrays of (alias id, kept id) or (kept id, canonical name)
+_MERGE_CHANGES = text(
+    """
+    INSERT INTO change_log (entity, entity_id, op, data)
+    SELECT 'ingredient', id, 'delete', json_build_object('name', name)
+    FROM ingredient
+    WHERE id = ANY(CAST(:alias_ids AS INTEGER[]))
+    UNION ALL
+    SELECT 'ingredient', id, 'upsert', json_build_object('name', name)
+    FROM unnest(CAST(:keep_ids AS INTEGER[]), CAST(:names AS TEXT[])) AS kept (id, name)
+    UNION ALL
+    SELECT 'recipe', id, 'upsert', json_build_object('slug', slug, 'title', title)
+    FROM recipe
+    WHERE id IN (
+        SELECT recipe_id FROM recipe_ingredient_link
+        WHERE ingredient_id = ANY(CAST(:alias_ids AS INTEGER[]))
+    )
+    ON CONFLICT (entity, entity_id) DO UPDATE SET
+        version = DEFAULT, op = EXCLUDED.op, data = EXCLUDED.data, changed_at = now()
+    """
+)
+# Recipes whose ingredients change count as updated, for clients syncing on it
+_TOUCH_RECIPES = text(
+    """
+    UPDATE recipe SET updated_at = now()
+    WHERE id IN (
+        SELECT recipe_id FROM recipe_ingredient_link
+        WHERE ingredient_id = ANY(CAST(:alias_ids AS INTEGER[]))
+    )
+    """
+)
+# A recipe linking several of the merged ingredients keeps one link, with
+# their amounts joined with ' + '
+_MERGE_LINKS = text(
+    """
+    WITH moved AS (
+        DELETE FROM recipe_ingredient_link AS link
+        USING unnest(
+            CAST(:alias_ids AS INTEGER[]), CAST(:alias_keep_ids AS INTEGER[])
+        ) AS merge (alias_id, keep_id)
+        WHERE link.ingredient_id = merge.alias_id
+        RETURNING link.recipe_id, merge.keep_id, link.ingredient_id, link.amount
+    )
+    INSERT INTO recipe_ingredient_link (recipe_id, ingredient_id, amount)
+    SELECT recipe_id, keep_id, string_agg(amount, ' + ' ORDER BY ingredient_id)
+    FROM moved
+    GROUP BY recipe_id, keep_id
+    ON CONFLICT (recipe_id, ingredient_id) DO UPDATE SET
+        amount = recipe_ingredient_link.amount || ' + ' || EXCLUDED.amount
+    """
+)
+_RENAME_KEPT = text(
+    """
+    UPDATE ingredient SET name = kept.name, canonical_id = NULL
+    FROM unnest(CAST(:keep_ids AS INTEGER[]), CAST(:names AS TEXT[])) AS kept (id, name)
+    WHERE ingredient.id = kept.id
+    """
+)
+_REDIRECT_ALIASES = text(
+    """
+    UPDATE ingredient SET canonical_id = merge.keep_id
+    FROM unnest(
+        CAST(:alias_ids AS INTEGER[]), CAST(:alias_keep_ids AS INTEGER[])
+    ) AS merge (alias_id, keep_id)
+    WHERE ingredient.id = merge.alias_id
+    """
+)
+
+
+def merge_duplicate_ingredients(
+    connection: Connection, batch_size: int = GC_BATCH_SIZE
+) -> int:
+    """
+    Merge ingredients whose names have the same canonical name into one, named
+    canonically: the one already named so, or else the oldest. Recipe links
+    move to it, and the others are kept with canonical_id pointing at it.
+    Returns how many ingredients were merged into another.
+
+    Meant for a connection in autocommit mode, from a migration or through
+    run_sync. Statements run per batch of names, each commits on its own and
+    is safe to run again, so an interrupted merge is finished by rerunning it.
+    The redirects are set last, which marks a name as done.
+    """
+    rows = connection.execute(
+        text("SELECT id, name, canonical_id FROM ingredient ORDER BY id")
+    ).all()
+    groups: dict[str, list] = {}
+    for row in rows:
+        groups.setdefault(canonical_ingredient_name(row.name), []).append(row)
+
+    merges = []
+    for name, group in groups.items():
+        keep = next((row for row in group if row.name == name), group[0])
+        aliases = [
+            row for row in group if row is not keep and row.canonical_id != keep.id
+        ]
+        if keep.name == name and keep.canonical_id is None and not aliases:
+            continue
+        merges.append((keep.id, name, [row.id for row in aliases]))
+
+    merged = 0
+    for start in range(0, len(merges), batch_size):
+        batch = merges[start : start + batch_size]
+        params = {
+            "keep_ids": [keep_id for keep_id, _, _ in batch],
+            "names": [name for _, name, _ in batch],
+            "alias_ids": [
+                alias_id for _, _, alias_ids in batch for alias_id in alias_ids
+            ],
+            "alias_keep_ids": [
+                keep_id for keep_id, _, alias_ids in batch for _ in alias_ids
+            ],
+        }
+        # Same lock as record_changes, so the versions become visible in order
+        connection.execute(
+            text("SELECT pg_advisory_lock(:key)"), {"key": CHANGE_LOG_LOCK_KEY}
+        )
+        try:
+            connection.execute(_MERGE_CHANGES, params)
+        finally:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": CHANGE_LOG_LOCK_KEY}
+            )
+        connection.execute(_TOUCH_RECIPES, params)
+        connection.execute(_MERGE_LINKS, params)
+        connection.execute(_RENAME_KEPT, params)
+        connection.execute(_REDIRECT_ALIASES, params)
+        merged += len(params["alias_ids"])
+    return merged
@@ -1,34 +1,89 @@
-from typing import List, Optional
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, List, Literal, Optional
 
+from pydantic import field_validator, model_validator
 from sqlmodel import JSON, Column, Field, Relationship, SQLModel
-from sqlalchemy import String
+from sqlalchemy import BigInteger, DateTime, Index, String, func
 
 
-# Image Link
+def url_hash(url: str) -> str:
+    # Matches encode(sha256(convert_to(url, 'UTF8')), 'hex') in Postgres
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def assume_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite (the read snapshot) drops the offset of the UTC timestamps
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+# Image
+# Each distinct url is stored once, and linked to its owners through narrow link tables
 class ImageURLBase(SQLModel):
     width: int
     url: str
 
 
 class ImageURL(ImageURLBase, table=True):
-    __tablename__ = "image_link"
+    __tablename__ = "image"
     id: int | None = Field(default=None, primary_key=True)
-    ingredient: Optional["Ingredient"] = Relationship(back_populates="images")
-    ingredient_id: Optional[int] = Field(default=None, foreign_key="ingredient.id")
-    instruction_step: Optional["InstructionStep"] = Relationship(
-        back_populates="images"
-    )
-    instruction_step_id: Optional[int] = Field(
-        default=None, foreign_key="instruction_step.id"
-    )
-    recipe: Optional["Recipe"] = Relationship(back_populates="images")
-    recipe_id: Optional[int] = Field(default=None, foreign_key="recipe.id")
+    url_hash: str = Field(sa_column=Column(String(64), unique=True, nullable=False))
 
 
 class ImageURLPublic(ImageURLBase):
     id: int
 
 
+class RecipeImageLink(SQLModel, table=True):
+    __tablename__ = "recipe_image"
+    recipe_id: int | None = Field(
+        default=None, foreign_key="recipe.id", primary_key=True, ondelete="CASCADE"
+    )
+    image_id: int | None = Field(
+        default=None,
+        foreign_key="image.id",
+        primary_key=True,
+        ondelete="CASCADE",
+        index=True,
+    )
+
+
+class InstructionStepImageLink(SQLModel, table=True):
+    __tablename__ = "instruction_step_image"
+    instruction_step_id: int | None = Field(
+        default=None,
+        foreign_key="instruction_step.id",
+        primary_key=True,
+        ondelete="CASCADE",
+    )
+    image_id: int | None = Field(
+        default=None,
+        foreign_key="image.id",
+        primary_key=True,
+        ondelete="CASCADE",
+        index=True,
+    )
+
+
+class IngredientImageLink(SQLModel, table=True):
+    __tablename__ = "ingredient_image"
+    ingredient_id: int | None = Field(
+        default=None,
+        foreign_key="ingredient.id",
+        primary_key=True,
+        ondelete="CASCADE",
+    )
+    image_id: int | None = Field(
+        default=None,
+        foreign_key="image.id",
+        primary_key=True,
+        ondelete="CASCADE",
+        index=True,
+    )
+
+
 ## RecipeIngredientLink Models
 
 
@@ -42,7 +97,7 @@ class RecipeIngredientLink(RecipeIngredientLinkBase, table=True):
         default=None, foreign_key="recipe.id", primary_key=True, ondelete="CASCADE"
     )
     ingredient_id: int | None = Field(
-        default=None, foreign_key="ingredient.id", primary_key=True
+        default=None, foreign_key="ingredient.id", primary_key=True, index=True
     )
 
     recipe: "Recipe" = Relationship(back_populates="ingredients")
@@ -62,9 +117,12 @@ class Ingredient(IngredientBase, table=True):
     __tablename__ = "ingredient"
     id: int | None = Field(default=None, primary_key=True)
     name: str = Field(sa_column=Column(String, unique=True))
-    images: List[ImageURL] = Relationship(
-        back_populates="ingredient", cascade_delete=True
+    # Set on rows merged into another ingredient with the same canonical name,
+    # which are kept so their ids still resolve
+    canonical_id: Optional[int] = Field(
+        default=None, foreign_key="ingredient.id", index=True, ondelete="CASCADE"
     )
+    images: List[ImageURL] = Relationship(link_model=IngredientImageLink)
     recipe_links: List[RecipeIngredientLink] = Relationship(back_populates="ingredient")
 
 
@@ -81,7 +139,9 @@ class IngredientSummary(IngredientBase):
 class InstructionStepBase(SQLModel):
     text: str
     order: int
-    recipe_id: int = Field(default=None, foreign_key="recipe.id", ondelete="CASCADE")
+    recipe_id: int = Field(
+        default=None, foreign_key="recipe.id", ondelete="CASCADE", index=True
+    )
 
 
 class InstructionStep(InstructionStepBase, table=True):
@@ -89,9 +149,7 @@ class InstructionStep(InstructionStepBase, table=True):
 
     id: int | None = Field(default=None, primary_key=True)
     recipe: "Recipe" = Relationship(back_populates="instruction_steps")
-    images: List["ImageURL"] = Relationship(
-        back_populates="instruction_step", cascade_delete=True
-    )
+    images: List[ImageURL] = Relationship(link_model=InstructionStepImageLink)
 
 
 class InstructionStepPublic(InstructionStepBase):
@@ -113,35 +171,137 @@ class BaseRecipe(SQLModel):
 class Recipe(BaseRecipe, table=True):
     __tablename__ = "recipe"
     id: int | None = Field(default=None, primary_key=True)
-    slug: str = Field(index=True)
+    slug: str = Field(index=True, unique=True)
 
     basic_ingredients: List[str] = Field(
         default_factory=list,
         sa_column=Column(JSON),  # or sa_column=Column(JSONB) if you prefer
     )
+    updated_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            index=True,
+            server_default=func.now(),
+            onupdate=func.now(),
+        ),
+    )
 
     ingredients: List[RecipeIngredientLink] = Relationship(
-        back_populates="recipe", cascade_delete=True
+        back_populates="recipe", cascade_delete=True, passive_deletes=True
     )
     instruction_steps: List[InstructionStep] = Relationship(
-        back_populates="recipe", cascade_delete=True
+        back_populates="recipe", cascade_delete=True, passive_deletes=True
     )
-    images: List[ImageURL] = Relationship(back_populates="recipe", cascade_delete=True)
+    images: List[ImageURL] = Relationship(link_model=RecipeImageLink)
 
 
 class RecipePublic(BaseRecipe):
     id: int
+    updated_at: Optional[datetime] = None
     basic_ingredients: List[str] = []
     instruction_steps: List[InstructionStepPublic] = []
     images: List[ImageURLPublic] = []
     ingredients: List[RecipeIngredientLinkPublic] = []
 
+    @field_validator("updated_at")
+    @classmethod
+    def assume_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        return assume_utc(value)
+
+
+## Recipe projection models
+# Returned with exclude_unset, so only the fields that were set are sent
+class InstructionStepProjection(InstructionStepPublic):
+    images: Optional[List[ImageURLPublic]] = None
+
+
+class IngredientProjection(IngredientPublic):
+    images: Optional[List[ImageURLPublic]] = None
+
+
+class RecipeIngredientLinkProjection(RecipeIngredientLinkBase):
+    ingredient: IngredientProjection
+
+
+class RecipeProjection(SQLModel):
+    title: Optional[str] = None
+    slug: Optional[str] = None
+    gousto_uid: Optional[str] = None
+    rating: Optional[float] = None
+    prep_time: Optional[int] = None
+    id: int
+    updated_at: Optional[datetime] = None
+    basic_ingredients: Optional[List[str]] = None
+    instruction_steps: Optional[List[InstructionStepProjection]] = None
+    images: Optional[List[ImageURLPublic]] = None
+    ingredients: Optional[List[RecipeIngredientLinkProjection]] = None
+
+    @field_validator("updated_at")
+    @classmethod
+    def assume_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        return assume_utc(value)
+
 
 class BadRecipeSlug(SQLModel, table=True):
     # recipe slugs that were returned by the gousto api but failed to return a recipe
     __tablename__ = "bad_recipe_slug"
     id: int | None = Field(default=None, primary_key=True)
-    slug: str = Field(index=True)
+    slug: str = Field(index=True, unique=True)
+
+
+## Change log
+# One entry per recipe or ingredient, for the latest change to it. Versions only
+# grow, so a client that has seen version v fetches everything after it
+ChangeEntity = Literal["recipe", "ingredient"]
+ChangeOp = Literal["upsert", "delete"]
+
+
+class ChangeLogEntry(SQLModel, table=True):
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_entity", "entity", "entity_id", unique=True),
+    )
+    version: int | None = Field(
+        default=None, sa_column=Column(BigInteger, primary_key=True)
+    )
+    entity: str
+    entity_id: int
+    op: str
+    # The entity's /recipes/list or /ingredients/list item, or its key for a delete
+    data: dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
+    changed_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(
+            DateTime(timezone=True), nullable=False, server_default=func.now()
+        ),
+    )
+
+
+class ChangeLogHorizon(SQLModel, table=True):
+    # Highest version removed by compaction; clients behind it must resync fully
+    __tablename__ = "change_log_horizon"
+    id: int | None = Field(default=None, primary_key=True)
+    version: int = Field(sa_column=Column(BigInteger, nullable=False))
+
+
+class Change(SQLModel):
+    version: int
+    entity: ChangeEntity
+    op: ChangeOp
+    id: int
+    data: dict[str, Any]
+
+
+class ChangeSet(SQLModel):
+    # Pass as ?since= next time
+    version: int
+    # The client is too far behind (or ahead): refetch the full lists, then
+    # continue from version
+    reset: bool = False
+    has_more: bool = False
+    changes: List[Change] = []
 
 
 class RecipeSummary(SQLModel):
@@ -154,6 +314,164 @@ class RecipeCheckResult(SQLModel):
     previously_bad_recipe_slugs: List[str]
 
 
+class PrepTimeFacet(SQLModel):
+    max_prep_time: int
+    count: int
+
+
+class RatingFacet(SQLModel):
+    min_rating: float
+    count: int
+
+
+class IngredientFacet(SQLModel):
+    id: int
+    name: str
+    count: int
+
+
+class IngredientCount(SQLModel):
+    id: int
+    name: str
+    recipe_count: int
+
+
+class IngredientPair(SQLModel):
+    id: int
+    name: str
+    count: int
+
+
+class IngredientPairs(SQLModel):
+    id: int
+    name: str
+    recipe_count: int
+    pairs: List[IngredientPair]
+
+
+class RecipeFacets(SQLModel):
+    total: int
+    prep_time: List[PrepTimeFacet]
+    rating: List[RatingFacet]
+    ingredients: List[IngredientFacet]
+
+
+class StartupPhase(SQLModel):
+    name: str
+    seconds: float
+    error: Optional[str] = None
+
+
+class Readiness(SQLModel):
+    ready: bool
+    status: Literal["warming_up", "ready", "failed"]
+    seconds: Optional[float] = None
+    phases: List[StartupPhase] = []
+
+
+class Health(SQLModel):
+    status: Literal["ok"] = "ok"
+
+
+class AdmissionStats(SQLModel):
+    name: str
+    limit: int
+    active: int
+    queued: int
+    admitted: int
+    rejected: int
+
+
+class ProfileSummary(SQLModel):
+    id: str
+    method: str
+    path: str
+    status: Optional[int]
+    seconds: float
+    samples: int
+    created_at: datetime
+
+
+class LoggingStats(SQLModel):
+    queued: int
+    dropped: int
+
+
+class SingleFlightStats(SQLModel):
+    name: str
+    calls: int
+    coalesced: int
+    in_flight: int
+
+
+class RecipeDeleteResult(SQLModel):
+    deleted_slugs: List[str]
+    missing_slugs: List[str]
+
+
+class RecipeCardsRequest(SQLModel):
+    slugs: List[str] = Field(min_length=1, max_length=50)
+
+
+## Recipe batch models
+# Recipes reference their ingredients and images by id, and each ingredient
+# and image is sent once however many recipes share it
+RECIPE_BATCH_MAX_SIZE = 50
+
+
+class RecipeBatchRequest(SQLModel):
+    slugs: List[str] = []
+    ids: List[int] = []
+
+    @model_validator(mode="after")
+    def check_size(self) -> "RecipeBatchRequest":
+        size = len(self.slugs) + len(self.ids)
+        if not 1 <= size <= RECIPE_BATCH_MAX_SIZE:
+            raise ValueError(
+                f"Between 1 and {RECIPE_BATCH_MAX_SIZE} slugs and ids are required"
+            )
+        return self
+
+
+class NormalizedInstructionStep(SQLModel):
+    id: int
+    text: str
+    order: int
+    image_ids: List[int] = []
+
+
+class NormalizedIngredientLink(SQLModel):
+    ingredient_id: int
+    amount: str
+
+
+class NormalizedRecipe(BaseRecipe):
+    id: int
+    updated_at: Optional[datetime] = None
+    basic_ingredients: List[str] = []
+    image_ids: List[int] = []
+    instruction_steps: List[NormalizedInstructionStep] = []
+    ingredients: List[NormalizedIngredientLink] = []
+
+    @field_validator("updated_at")
+    @classmethod
+    def assume_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        return assume_utc(value)
+
+
+class NormalizedIngredient(IngredientBase):
+    id: int
+    image_ids: List[int] = []
+
+
+class RecipeBatch(SQLModel):
+    recipes: List[NormalizedRecipe]
+    ingredients: List[NormalizedIngredient]
+    images: List[ImageURLPublic]
+    missing_slugs: List[str] = []
+    missing_ids: List[int] = []
+
+
 ## Auth Models
 
 
@@ -174,4 +492,5 @@ class User(SQLModel):
 class UserInDB(User, table=True):
     __tablename__ = "user"
     id: int | None = Field(default=None, primary_key=True)
+    username: str = Field(index=True, unique=True)
     hashed_password: str
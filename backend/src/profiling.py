@@ -0,0 +1,240 @@
+# On-demand sampling profiler for live requests. A background thread samples
+# the event loop's stack while a profiled request runs, and the samples are
+# saved as folded stacks (flamegraph.pl, speedscope and inferno read them)
+
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from types import FrameType
+from typing import Optional
+
+from jwt.exceptions import InvalidTokenError
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .auth import decode_access_token
+from .models import ProfileSummary
+
+# Off unless set, in which case the middleware isn't installed at all
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# Requests from an authenticated client with this header set are profiled
+PROFILE_HEADER = "x-profile"
+# Fraction of all other requests profiled, 0 disables sampling traffic
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".profiles")
+# Oldest profiles are deleted beyond this many
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+# Paths are shortened to the package, or relative to the working directory
+_library_path = re.compile(r".*[/\\]((site|dist)-packages|python3\.\d+)[/\\]")
+_cwd = os.getcwd() + os.sep
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    filename = _library_path.sub("", code.co_filename).removeprefix(_cwd)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def frame_stack(frame: Optional[FrameType]) -> list[str]:
+    """The frame and its callers, outermost first"""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def awaiting_stack(task: asyncio.Task) -> list[str]:
+    """
+    The chain of coroutines a suspended task is awaiting, outermost first,
+    which ends at whatever it's waiting on, e.g. a database query
+    """
+    names = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(
+            awaitable, "gi_frame", None
+        )
+        if frame is None:
+            break
+        names.append(frame_name(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(
+            awaitable, "gi_yieldfrom", None
+        )
+    return names
+
+
+class Profile:
+    def __init__(self, task: asyncio.Task, method: str, path: str):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.method = method
+        self.path = path
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at = time.perf_counter()
+        self.stacks: Counter[str] = Counter()
+
+    def sample(self, loop: asyncio.AbstractEventLoop, frame: Optional[FrameType]):
+        """
+        Attribute a sample of the loop thread to this request: its own stack
+        while it runs, what it's awaiting while the loop is idle, and other
+        tasks' stacks separately, as they hold up the request too
+        """
+        current = asyncio.current_task(loop)
+        if current is self.task:
+            stack = frame_stack(frame)
+        elif current is None:
+            stack = ["[waiting]", *awaiting_stack(self.task)]
+        else:
+            stack = ["[other tasks]", *frame_stack(frame)]
+        if stack:
+            self.stacks[";".join(stack)] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class Sampler:
+    """
+    Samples the event loop thread every interval while any profile is active.
+    The thread only exists while there's something to profile.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._profiles: set[Profile] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id = 0
+
+    def start(self, profile: Profile) -> None:
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="profiler", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                frame = sys._current_frames().get(self._loop_thread_id)
+                for profile in self._profiles:
+                    profile.sample(self._loop, frame)
+
+
+sampler = Sampler(PROFILE_INTERVAL_SECONDS)
+
+
+def profile_path(profile_id: str, suffix: str = ".folded") -> Path:
+    return Path(PROFILE_DIR) / f"{profile_id}{suffix}"
+
+
+def save_profile(profile: Profile, status: Optional[int]) -> None:
+    """
+    Write the folded stacks, and a summary of the request next to them, then
+    delete the oldest profiles beyond PROFILE_MAX_FILES
+    """
+    directory = Path(PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    summary = ProfileSummary(
+        id=profile.id,
+        method=profile.method,
+        path=profile.path,
+        status=status,
+        seconds=round(time.perf_counter() - profile.started_at, 6),
+        samples=sum(profile.stacks.values()),
+        created_at=profile.created_at,
+    )
+    profile_path(profile.id).write_text(profile.folded())
+    profile_path(profile.id, ".json").write_text(summary.model_dump_json())
+
+    paths = sorted(directory.glob("*.json"), key=lambda path: path.stat().st_mtime)
+    for path in paths[: max(0, len(paths) - PROFILE_MAX_FILES)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".folded").unlink(missing_ok=True)
+
+
+def list_profiles() -> list[ProfileSummary]:
+    """Saved profiles, newest first"""
+    summaries = [
+        ProfileSummary.model_validate_json(path.read_text())
+        for path in Path(PROFILE_DIR).glob("*.json")
+    ]
+    return sorted(summaries, key=lambda summary: summary.created_at, reverse=True)
+
+
+def is_authenticated(authorization: str) -> bool:
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        return decode_access_token(token).get("sub") is not None
+    except (InvalidTokenError, ValueError):
+        return False
+
+
+def should_profile(headers: dict[bytes, bytes]) -> bool:
+    if headers.get(PROFILE_HEADER.encode()) and is_authenticated(
+        headers.get(b"authorization", b"").decode("latin-1")
+    ):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests from authenticated clients that send the X-Profile
+    header, and a sampled fraction of the rest. The profile's id is returned in
+    the X-Profile-Id response header, for /profiles/{profile_id}.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not should_profile(dict(scope["headers"])):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(asyncio.current_task(), scope["method"], scope["path"])
+        status = None
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile-id", profile.id.encode()),
+                ]
+            await send(message)
+
+        sampler.start(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop(profile)
+            await asyncio.to_thread(save_profile, profile, status)
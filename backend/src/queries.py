@@ -0,0 +1,441 @@
+# Query helpers shared by the recipe endpoints
+
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Literal, Optional, Sequence
+
+from sqlalchemy import case, func, literal, or_, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import load_only, noload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models import (ImageURL, ImageURLPublic, Ingredient, IngredientImageLink,
+                     IngredientProjection, InstructionStep,
+                     InstructionStepImageLink, InstructionStepProjection,
+                     NormalizedIngredient, NormalizedIngredientLink,
+                     NormalizedInstructionStep, NormalizedRecipe, Recipe,
+                     RecipeBatch, RecipeImageLink, RecipeIngredientLink,
+                     RecipeIngredientLinkProjection, RecipeProjection,
+                     url_hash)
+
+# Recipes loaded (with all their children) per round trip by stream_recipes
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "200"))
+
+ImageProfile = Literal["thumb", "card", "print"]
+
+# Named widths for ?image_profile=, matched against the widths Gousto provides
+IMAGE_PROFILES: dict[ImageProfile, int] = {
+    "thumb": 200,
+    "card": 700,
+    "print": 1500,
+}
+
+
+def recipe_detail_options(include_images: bool = True) -> list:
+    """
+    Eager-load options for a full RecipePublic. Without images, the image
+    collections are left empty so they can be filled by load_best_images
+    """
+    if include_images:
+        return [
+            # Eager-load instruction steps + their images
+            selectinload(Recipe.instruction_steps).selectinload(InstructionStep.images),
+            # Eager-load recipe images
+            selectinload(Recipe.images),
+            # Eager-load ingredient links and their associated ingredient objects & images
+            selectinload(Recipe.ingredients)
+            .selectinload(RecipeIngredientLink.ingredient)
+            .selectinload(Ingredient.images),
+        ]
+
+    return [
+        selectinload(Recipe.instruction_steps).noload(InstructionStep.images),
+        noload(Recipe.images),
+        selectinload(Recipe.ingredients)
+        .selectinload(RecipeIngredientLink.ingredient)
+        .noload(Ingredient.images),
+    ]
+
+
+# Recipe columns for ?fields=, and relationships for ?include= ("steps.images"
+# also includes the steps themselves)
+RECIPE_FIELDS = (
+    "title",
+    "slug",
+    "gousto_uid",
+    "rating",
+    "prep_time",
+    "updated_at",
+    "basic_ingredients",
+)
+RECIPE_INCLUDES = (
+    "images",
+    "steps",
+    "steps.images",
+    "ingredients",
+    "ingredients.images",
+)
+
+
+@dataclass(frozen=True)
+class Projection:
+    fields: tuple[str, ...] = RECIPE_FIELDS
+    include: frozenset[str] = frozenset(RECIPE_INCLUDES)
+
+    @property
+    def is_full(self) -> bool:
+        return self == FULL_PROJECTION
+
+    @property
+    def includes_images(self) -> bool:
+        return any(name.endswith("images") for name in self.include)
+
+
+FULL_PROJECTION = Projection()
+
+
+def parse_projection(fields: Optional[str], include: Optional[str]) -> Projection:
+    """
+    The projection for comma-separated ?fields= and ?include= values. Without
+    either, everything is loaded. Once one is given, fields defaults to every
+    column and include to no relationships, as those are what cost queries.
+    """
+    if fields is None and include is None:
+        return FULL_PROJECTION
+
+    def split(value: Optional[str], allowed: tuple[str, ...], name: str) -> set[str]:
+        names = {part.strip() for part in (value or "").split(",") if part.strip()}
+        unknown = names.difference(allowed)
+        if unknown:
+            raise ValueError(
+                f"Unknown {name} {sorted(unknown)}, expected some of {list(allowed)}"
+            )
+        return names
+
+    field_names = (
+        set(RECIPE_FIELDS) if fields is None else split(fields, RECIPE_FIELDS, "fields")
+    )
+    include_names = split(include, RECIPE_INCLUDES, "include")
+    include_names |= {name.split(".")[0] for name in include_names}
+    return Projection(
+        fields=tuple(field for field in RECIPE_FIELDS if field in field_names),
+        include=frozenset(include_names),
+    )
+
+
+def projection_options(projection: Projection, include_images: bool = True) -> list:
+    """
+    Eager-load options that select only the projection's columns and load only
+    its relationships, leaving the others empty without a query
+    """
+    include = projection.include
+
+    def images(name: str) -> bool:
+        return include_images and name in include
+
+    options = [
+        load_only(Recipe.id, *(getattr(Recipe, field) for field in projection.fields)),
+        selectinload(Recipe.images) if images("images") else noload(Recipe.images),
+    ]
+    if "steps" in include:
+        steps = selectinload(Recipe.instruction_steps)
+        options.append(
+            steps.selectinload(InstructionStep.images)
+            if images("steps.images")
+            else steps.noload(InstructionStep.images)
+        )
+    else:
+        options.append(noload(Recipe.instruction_steps))
+    if "ingredients" in include:
+        ingredients = selectinload(Recipe.ingredients).selectinload(
+            RecipeIngredientLink.ingredient
+        )
+        options.append(
+            ingredients.selectinload(Ingredient.images)
+            if images("ingredients.images")
+            else ingredients.noload(Ingredient.images)
+        )
+    else:
+        options.append(noload(Recipe.ingredients))
+    return options
+
+
+def project_recipe(recipe: Recipe, projection: Projection) -> RecipeProjection:
+    """
+    The response for a recipe loaded with projection_options, with only the
+    projection's fields set
+    """
+    include = projection.include
+    data: dict = {"id": recipe.id}
+    for field in projection.fields:
+        data[field] = getattr(recipe, field)
+    if "images" in include:
+        data["images"] = recipe.images
+    if "steps" in include:
+        data["instruction_steps"] = [
+            InstructionStepProjection(
+                id=step.id,
+                text=step.text,
+                order=step.order,
+                recipe_id=step.recipe_id,
+                **({"images": step.images} if "steps.images" in include else {}),
+            )
+            for step in recipe.instruction_steps
+        ]
+    if "ingredients" in include:
+        data["ingredients"] = [
+            RecipeIngredientLinkProjection(
+                amount=link.amount,
+                ingredient=IngredientProjection(
+                    id=link.ingredient.id,
+                    name=link.ingredient.name,
+                    **(
+                        {"images": link.ingredient.images}
+                        if "ingredients.images" in include
+                        else {}
+                    ),
+                ),
+            )
+            for link in recipe.ingredients
+        ]
+    return RecipeProjection.model_validate(data)
+
+
+def resolve_image_width(
+    image_width: Optional[int], image_profile: Optional[str]
+) -> Optional[int]:
+    if image_width is not None:
+        return image_width
+    if image_profile is not None:
+        return IMAGE_PROFILES[image_profile]
+    return None
+
+
+async def get_or_create_images(
+    session: AsyncSession, image_data_list: Iterable
+) -> dict[str, ImageURL]:
+    """
+    Returns the image rows for the given image data (anything with url and width),
+    keyed by url. New urls are inserted, and urls inserted concurrently by another
+    request are picked up instead of failing on the unique hash.
+    """
+    rows = {
+        url_hash(image_data.url): {
+            "url": image_data.url,
+            "width": image_data.width,
+            "url_hash": url_hash(image_data.url),
+        }
+        for image_data in image_data_list
+    }
+    if not rows:
+        return {}
+
+    images: dict[str, ImageURL] = {}
+    while len(images) < len(rows):
+        insert_statement = (
+            insert(ImageURL)
+            .values([row for row in rows.values() if row["url"] not in images])
+            .on_conflict_do_nothing(index_elements=["url_hash"])
+        )
+        await session.exec(insert_statement)
+
+        # FOR SHARE keeps garbage collection from deleting them until they are
+        # linked, and any it deleted before they were locked are inserted again
+        result = await session.exec(
+            select(ImageURL)
+            .where(col(ImageURL.url_hash).in_(rows.keys()))
+            .with_for_update(read=True)
+        )
+        images = {image.url: image for image in result.all()}
+    return images
+
+
+async def load_best_images(
+    session: AsyncSession, recipes: Sequence[Recipe], width: int
+) -> None:
+    """
+    Fills the image collections of the recipes, their steps and ingredients with
+    only the best image for the given width: the smallest image at least that
+    wide, or the widest available if none are. The choice is made in the query
+    with a window function, so the other widths are never loaded.
+    """
+    steps = [step for recipe in recipes for step in recipe.instruction_steps]
+    ingredients = {
+        link.ingredient.id: link.ingredient
+        for recipe in recipes
+        for link in recipe.ingredients
+    }
+
+    too_narrow = col(ImageURL.width) < width
+    owner_links = (
+        (
+            "recipe",
+            RecipeImageLink.image_id,
+            RecipeImageLink.recipe_id,
+            [recipe.id for recipe in recipes],
+        ),
+        (
+            "step",
+            InstructionStepImageLink.image_id,
+            InstructionStepImageLink.instruction_step_id,
+            [step.id for step in steps],
+        ),
+        (
+            "ingredient",
+            IngredientImageLink.image_id,
+            IngredientImageLink.ingredient_id,
+            list(ingredients),
+        ),
+    )
+    ranked = union_all(
+        *(
+            select(
+                literal(owner).label("owner"),
+                col(owner_id).label("owner_id"),
+                col(ImageURL.id).label("image_id"),
+                func.row_number()
+                .over(
+                    partition_by=owner_id,
+                    order_by=(
+                        too_narrow,
+                        case(
+                            (too_narrow, -col(ImageURL.width)),
+                            else_=col(ImageURL.width),
+                        ),
+                    ),
+                )
+                .label("rank"),
+            )
+            .join(ImageURL, col(ImageURL.id) == image_id)
+            .where(col(owner_id).in_(owner_ids))
+            for owner, image_id, owner_id, owner_ids in owner_links
+        )
+    ).subquery()
+    statement = (
+        select(ImageURL, ranked.c.owner, ranked.c.owner_id)
+        .join(ranked, col(ImageURL.id) == ranked.c.image_id)
+        .where(ranked.c.rank == 1)
+    )
+    result = await session.exec(statement)
+
+    images_by_owner: dict[tuple[str, int], list[ImageURL]] = defaultdict(list)
+    for image, owner, owner_id in result.all():
+        images_by_owner[(owner, owner_id)].append(image)
+
+    # set_committed_value populates the collections without marking them as changed
+    for recipe in recipes:
+        set_committed_value(recipe, "images", images_by_owner[("recipe", recipe.id)])
+    for step in steps:
+        set_committed_value(step, "images", images_by_owner[("step", step.id)])
+    for ingredient_id, ingredient in ingredients.items():
+        set_committed_value(
+            ingredient, "images", images_by_owner[("ingredient", ingredient_id)]
+        )
+
+
+async def load_recipe_batch(
+    session: AsyncSession,
+    slugs: Sequence[str],
+    ids: Sequence[int],
+    width: Optional[int] = None,
+) -> RecipeBatch:
+    """
+    Loads the recipes with any of the slugs or ids with one set of eager-load
+    queries (plus one for the images with a width), in the order requested.
+    Slugs and ids that don't match a recipe are reported as missing.
+    """
+    statement = (
+        select(Recipe)
+        .where(or_(col(Recipe.slug).in_(slugs), col(Recipe.id).in_(ids)))
+        .options(*recipe_detail_options(include_images=width is None))
+    )
+    result = await session.exec(statement)
+    loaded = result.all()
+    if width is not None:
+        await load_best_images(session, loaded, width)
+
+    by_slug = {recipe.slug: recipe for recipe in loaded}
+    by_id = {recipe.id: recipe for recipe in loaded}
+    requested = [by_slug.get(slug) for slug in slugs] + [
+        by_id.get(recipe_id) for recipe_id in ids
+    ]
+    recipes = list({recipe.id: recipe for recipe in requested if recipe}.values())
+
+    images: dict[int, ImageURL] = {}
+    ingredients: dict[int, NormalizedIngredient] = {}
+
+    def image_ids(owner_images: Iterable[ImageURL]) -> list[int]:
+        for image in owner_images:
+            images[image.id] = image
+        return [image.id for image in owner_images]
+
+    normalized_recipes = []
+    for recipe in recipes:
+        for link in recipe.ingredients:
+            ingredient = link.ingredient
+            if ingredient.id not in ingredients:
+                ingredients[ingredient.id] = NormalizedIngredient(
+                    id=ingredient.id,
+                    name=ingredient.name,
+                    image_ids=image_ids(ingredient.images),
+                )
+        normalized_recipes.append(
+            NormalizedRecipe.model_validate(
+                recipe,
+                update={
+                    "image_ids": image_ids(recipe.images),
+                    "instruction_steps": [
+                        NormalizedInstructionStep(
+                            id=step.id,
+                            text=step.text,
+                            order=step.order,
+                            image_ids=image_ids(step.images),
+                        )
+                        for step in recipe.instruction_steps
+                    ],
+                    "ingredients": [
+                        NormalizedIngredientLink(
+                            ingredient_id=link.ingredient.id, amount=link.amount
+                        )
+                        for link in recipe.ingredients
+                    ],
+                },
+            )
+        )
+
+    return RecipeBatch(
+        recipes=normalized_recipes,
+        ingredients=list(ingredients.values()),
+        images=[ImageURLPublic.model_validate(image) for image in images.values()],
+        missing_slugs=[slug for slug in dict.fromkeys(slugs) if slug not in by_slug],
+        missing_ids=[
+            recipe_id for recipe_id in dict.fromkeys(ids) if recipe_id not in by_id
+        ],
+    )
+
+
+async def stream_recipes(
+    session: AsyncSession,
+    since: Optional[datetime] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[Sequence[Recipe]]:
+    """
+    Yields every recipe (updated after since, if given) in chunks of chunk_size,
+    fully loaded. Recipes are read through a server-side cursor and the children
+    of each chunk are eager-loaded together. The session only holds weak
+    references to loaded objects, so a chunk is freed once the caller drops it
+    and memory use doesn't grow with the catalogue.
+    """
+    statement = select(Recipe).options(*recipe_detail_options()).order_by(Recipe.id)
+    if since is not None:
+        statement = statement.where(col(Recipe.updated_at) > since)
+
+    result = await session.stream_scalars(
+        statement.execution_options(yield_per=chunk_size)
+    )
+    async for recipes in result.partitions():
+        yield recipes
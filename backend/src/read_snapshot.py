@@ -0,0 +1,141 @@
+# Builds the SQLite read snapshot (READ_SNAPSHOT_PATH) served by the GET endpoints
+
+import asyncio
+import fcntl
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import Connection, create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import SQLModel
+
+from .database import READ_SNAPSHOT_PATH, engine
+from .models import (ImageURL, Ingredient, IngredientImageLink,
+                     InstructionStep, InstructionStepImageLink, Recipe,
+                     RecipeImageLink, RecipeIngredientLink)
+
+logger = logging.getLogger(__name__)
+
+# Everything the GET endpoints read, parents first
+READ_SNAPSHOT_MODELS = [
+    Recipe,
+    Ingredient,
+    InstructionStep,
+    RecipeIngredientLink,
+    ImageURL,
+    RecipeImageLink,
+    InstructionStepImageLink,
+    IngredientImageLink,
+]
+
+# Rows copied per round trip while building
+READ_SNAPSHOT_CHUNK_SIZE = 5000
+
+
+def _start_build(tmp_path: str, tables: list) -> Connection:
+    """
+    Create the tables in a new SQLite file at tmp_path, and begin the
+    transaction they are filled in
+    """
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    # The connection is used from executor threads, one call at a time
+    sqlite_engine = create_engine(
+        f"sqlite:///{tmp_path}", connect_args={"check_same_thread": False}
+    )
+    SQLModel.metadata.create_all(sqlite_engine, tables=tables)
+    connection = sqlite_engine.connect()
+    connection.begin()
+    return connection
+
+
+def _finish_build(connection: Connection, tmp_path: str, path: str) -> None:
+    connection.exec_driver_sql("ANALYZE")
+    connection.commit()
+    connection.close()
+    connection.engine.dispose()
+    os.replace(tmp_path, path)
+
+
+def _discard_build(connection: Optional[Connection], tmp_path: str) -> None:
+    if connection is not None:
+        connection.close()
+        connection.engine.dispose()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+async def build_read_snapshot(
+    path: str, source_engine: AsyncEngine = engine
+) -> dict[str, int]:
+    """
+    Copy the catalogue from Postgres into a new SQLite file, then atomically
+    replace the file at path with it. Readers that already have the old file
+    open carry on reading it; new sessions open the new one.
+
+    Builds are serialized with a lock file, so when several workers rebuild at
+    once, whichever finishes last has also read last. Returns rows per table.
+    Everything touching SQLite or the filesystem runs in threads.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    tables = [model.__table__ for model in READ_SNAPSHOT_MODELS]
+    lock_file = await asyncio.to_thread(open, f"{path}.lock", "w")
+    with lock_file:
+        await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        sqlite_connection = None
+        try:
+            sqlite_connection = await asyncio.to_thread(
+                _start_build, tmp_path, tables
+            )
+            row_counts = {}
+            async with source_engine.connect() as source_connection:
+                # Every table is read from the same point in time
+                source_connection = await source_connection.execution_options(
+                    isolation_level="REPEATABLE READ"
+                )
+                for table in tables:
+                    result = await source_connection.stream(
+                        select(table).execution_options(
+                            yield_per=READ_SNAPSHOT_CHUNK_SIZE
+                        )
+                    )
+                    row_counts[table.name] = 0
+                    async for rows in result.mappings().partitions():
+                        await asyncio.to_thread(
+                            sqlite_connection.execute, insert(table), rows
+                        )
+                        row_counts[table.name] += len(rows)
+            await asyncio.to_thread(
+                _finish_build, sqlite_connection, tmp_path, path
+            )
+            return row_counts
+        finally:
+            await asyncio.to_thread(_discard_build, sqlite_connection, tmp_path)
+
+
+_rebuild_task: Optional[asyncio.Task] = None
+_rebuild_requested = False
+
+
+async def _rebuild_until_current() -> None:
+    global _rebuild_requested
+    while _rebuild_requested:
+        _rebuild_requested = False
+        try:
+            await build_read_snapshot(READ_SNAPSHOT_PATH)
+        except Exception:
+            logger.exception("Failed to rebuild the read snapshot")
+
+
+def schedule_read_snapshot_rebuild() -> None:
+    """
+    Rebuild the read snapshot in the background after a write, if it is enabled.
+    Writes that land during a rebuild are coalesced into one more rebuild.
+    """
+    global _rebuild_task, _rebuild_requested
+    if READ_SNAPSHOT_PATH is None:
+        return
+    _rebuild_requested = True
+    if _rebuild_task is None or _rebuild_task.done():
+        _rebuild_task = asyncio.create_task(_rebuild_until_current())
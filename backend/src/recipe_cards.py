@@ -0,0 +1,373 @@
+# Server-side rendering of A4 recipe card PDFs
+#
+# Rendering runs in a process pool so the event loop never blocks, and finished
+# cards are cached on disk by a hash of the recipe content
+
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, Sequence
+from xml.sax.saxutils import escape
+
+from pypdf import PdfWriter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.platypus import (Image, Paragraph, SimpleDocTemplate, Spacer,
+                                Table, TableStyle)
+
+from .image_proxy import DiskLRUCache, ImageFetchError, acquire_image
+from .image_proxy import get_cache as get_image_cache
+from .models import RecipePublic
+
+# Bump when the layout changes, so cached cards are regenerated
+CARD_RENDERER_VERSION = "1"
+
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", ".pdf_cache")
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(256 * 1024**2)))
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(os.cpu_count() or 1)))
+
+# Image widths requested from the image proxy, in pixels
+MAIN_IMAGE_WIDTH = 700
+INGREDIENT_IMAGE_WIDTH = 100
+STEP_IMAGE_WIDTH = 200
+
+# Size of each chunk when streaming a PDF response
+PDF_STREAM_CHUNK_SIZE = 64 * 1024
+
+ACCENT_COLOR = colors.HexColor("#d32f2f")
+MUTED_COLOR = colors.HexColor("#666666")
+LIGHT_BACKGROUND = colors.HexColor("#f8f9fa")
+
+TITLE_STYLE = ParagraphStyle(
+    "title",
+    fontName="Helvetica-Bold",
+    fontSize=18,
+    leading=22,
+    alignment=1,
+    textColor=ACCENT_COLOR,
+    spaceAfter=4,
+)
+META_STYLE = ParagraphStyle(
+    "meta", fontName="Helvetica", fontSize=9, alignment=1, textColor=MUTED_COLOR
+)
+SECTION_STYLE = ParagraphStyle(
+    "section",
+    fontName="Helvetica-Bold",
+    fontSize=12,
+    leading=14,
+    textColor=ACCENT_COLOR,
+    spaceBefore=4,
+    spaceAfter=4,
+)
+INGREDIENT_STYLE = ParagraphStyle(
+    "ingredient", fontName="Helvetica", fontSize=8, leading=9.5
+)
+INSTRUCTION_STYLE = ParagraphStyle(
+    "instruction", fontName="Helvetica", fontSize=8, leading=10
+)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_cache: Optional[DiskLRUCache] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Forking a process that already runs threads (the logging listener,
+        # the profiler, bcrypt's) can copy their locks held, so workers are
+        # started from a clean server process instead
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _executor
+
+
+def get_cache() -> DiskLRUCache:
+    global _cache
+    if _cache is None:
+        _cache = DiskLRUCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+    return _cache
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+def recipe_content_hash(recipe: RecipePublic) -> str:
+    content = f"{CARD_RENDERER_VERSION}:{recipe.model_dump_json()}"
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+# ===== Rendering (runs in worker processes) =====
+
+
+def instruction_markup(html: str) -> str:
+    """
+    Converts Gousto's instruction html into the small subset of markup reportlab understands
+    """
+    text = re.sub(r"</p>\s*<p[^>]*>", "<br/>", html)
+    text = re.sub(r"<(/?)strong>", r"<\1b>", text)
+    text = re.sub(r"<(/?)em>", r"<\1i>", text)
+    # Drop every other tag, but keep the ones reportlab supports
+    text = re.sub(r"<(?!/?(b|i|br/?)>)[^>]+>", "", text)
+    # Escape ampersands that aren't already entities
+    return re.sub(r"&(?!#?\w+;)", "&amp;", text).strip()
+
+
+def _image(path: Optional[str], width: float, height: float):
+    if path is None:
+        return ""
+    return Image(path, width=width, height=height, kind="proportional")
+
+
+def _ingredients_table(recipe: dict, image_paths: dict[str, str], width: float):
+    cells = []
+    for link in recipe["ingredients"]:
+        ingredient = link["ingredient"]
+        image_path = image_paths.get(f"ingredient:{ingredient['id']}")
+        image = _image(image_path, 6 * mm, 6 * mm)
+        name = escape(ingredient["name"].capitalize())
+        amount = escape(link["amount"])
+        text = Paragraph(
+            f"{name} <font color='#666666'>({amount})</font>", INGREDIENT_STYLE
+        )
+        cells.append(Table([[image, text]], colWidths=[7 * mm, width / 3 - 9 * mm]))
+
+    rows = [cells[i : i + 3] for i in range(0, len(cells), 3)]
+    if not rows:
+        return Spacer(0, 0)
+    rows[-1] += [""] * (3 - len(rows[-1]))
+
+    table = Table(rows, colWidths=[width / 3] * 3)
+    table.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, -1), LIGHT_BACKGROUND),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("LINEBELOW", (0, 0), (-1, -1), 2, colors.white),
+                ("LINEAFTER", (0, 0), (-1, -1), 2, colors.white),
+            ]
+        )
+    )
+    return table
+
+
+def _instruction_cell(step: dict, image_paths: dict[str, str], width: float):
+    image = _image(image_paths.get(f"step:{step['id']}"), 20 * mm, 30 * mm)
+    text = Paragraph(
+        f"<b>{step['order']}.</b> {instruction_markup(step['text'])}",
+        INSTRUCTION_STYLE,
+    )
+    table = Table([[image, text]], colWidths=[22 * mm, width - 22 * mm])
+    table.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+    return table
+
+
+def render_recipe_card(recipe: dict, image_paths: dict[str, str]) -> bytes:
+    """
+    Renders a recipe card as an A4 PDF
+
+    Args:
+        recipe: A RecipePublic dumped to a dict
+        image_paths: Local image files keyed by "main", "ingredient:<id>" and "step:<id>"
+    """
+    output = io.BytesIO()
+    margin = 15
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=A4,
+        leftMargin=margin,
+        rightMargin=margin,
+        topMargin=margin,
+        bottomMargin=margin,
+        title=recipe["title"],
+    )
+    width = doc.width
+
+    meta = []
+    if recipe.get("prep_time"):
+        meta.append(f"{recipe['prep_time']} mins")
+    if recipe.get("rating"):
+        meta.append(f"{recipe['rating']:.1f} / 5")
+
+    story: list = [Paragraph(escape(recipe["title"]), TITLE_STYLE)]
+    if meta:
+        story.append(Paragraph(" | ".join(meta), META_STYLE))
+    story.append(Spacer(0, 4 * mm))
+
+    right_width = width * 0.65
+    right_column = [
+        Paragraph("Ingredients", SECTION_STYLE),
+        _ingredients_table(recipe, image_paths, right_width),
+    ]
+    if recipe["basic_ingredients"]:
+        right_column += [
+            Spacer(0, 2 * mm),
+            Paragraph(
+                "<b>You'll need:</b> "
+                + escape(", ".join(recipe["basic_ingredients"])),
+                INGREDIENT_STYLE,
+            ),
+        ]
+    header = Table(
+        [
+            [
+                _image(image_paths.get("main"), width * 0.35 - 4 * mm, 60 * mm),
+                right_column,
+            ]
+        ],
+        colWidths=[width * 0.35, right_width],
+    )
+    header.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+    story += [header, Paragraph("Instructions", SECTION_STYLE)]
+
+    # Two columns of steps, filled top to bottom like the client-side card
+    steps = sorted(recipe["instruction_steps"], key=lambda step: step["order"])
+    midpoint = (len(steps) + 1) // 2
+    column_width = width / 2
+    left, right = steps[:midpoint], steps[midpoint:]
+    rows = [
+        [
+            _instruction_cell(left[i], image_paths, column_width),
+            _instruction_cell(right[i], image_paths, column_width)
+            if i < len(right)
+            else "",
+        ]
+        for i in range(len(left))
+    ]
+    if rows:
+        story.append(Table(rows, colWidths=[column_width] * 2))
+
+    doc.build(story)
+    return output.getvalue()
+
+
+# ===== Async API =====
+
+
+def _best_image_url(images, width: int) -> Optional[str]:
+    # Recipes are loaded with a single best image per owner, but fall back gracefully
+    if not images:
+        return None
+    wide_enough = [image for image in images if image.width >= width]
+    if wide_enough:
+        return min(wide_enough, key=lambda image: image.width).url
+    return max(images, key=lambda image: image.width).url
+
+
+async def _fetch_card_images(
+    recipe: RecipePublic, pinned: list[str]
+) -> dict[str, str]:
+    """
+    Local paths of the card's images. Their cache keys are added to pinned as
+    they're fetched, and stay pinned until the caller unpins them.
+    """
+    wanted: dict[str, tuple[str, int]] = {}
+
+    main_url = _best_image_url(recipe.images, MAIN_IMAGE_WIDTH)
+    if main_url:
+        wanted["main"] = (main_url, MAIN_IMAGE_WIDTH)
+    for link in recipe.ingredients:
+        url = _best_image_url(link.ingredient.images, INGREDIENT_IMAGE_WIDTH)
+        if url:
+            wanted[f"ingredient:{link.ingredient.id}"] = (url, INGREDIENT_IMAGE_WIDTH)
+    for step in recipe.instruction_steps:
+        url = _best_image_url(step.images, STEP_IMAGE_WIDTH)
+        if url:
+            wanted[f"step:{step.id}"] = (url, STEP_IMAGE_WIDTH)
+
+    async def fetch(url: str, width: int) -> str:
+        key, path = await acquire_image(url, width, "jpeg")
+        pinned.append(key)
+        return path
+
+    results = await asyncio.gather(
+        *(fetch(url, width) for url, width in wanted.values()),
+        return_exceptions=True,
+    )
+
+    image_paths = {}
+    for key, result in zip(wanted, results):
+        # A missing image shouldn't stop the card from rendering
+        if isinstance(result, ImageFetchError):
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        image_paths[key] = result
+    return image_paths
+
+
+async def get_card_pdf(recipe: RecipePublic) -> bytes:
+    """
+    Returns the rendered card for the recipe, from the cache if its content hasn't changed
+    """
+    key = f"{recipe_content_hash(recipe)}.pdf"
+    path = get_cache().get(key)
+    if path is None:
+        # A long render can otherwise see its images evicted by other puts
+        pinned: list[str] = []
+        try:
+            image_paths = await _fetch_card_images(recipe, pinned)
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(
+                get_executor(), render_recipe_card, recipe.model_dump(), image_paths
+            )
+        finally:
+            for image_key in pinned:
+                get_image_cache().unpin(image_key)
+        await get_cache().put(key, data)
+        return data
+
+    loop = asyncio.get_running_loop()
+    with get_cache().pinned(key):
+        return await loop.run_in_executor(None, _read_file, path)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def merge_card_pdfs(cards: list[bytes]) -> bytes:
+    """Merges rendered cards into one PDF, in order"""
+    writer = PdfWriter()
+    for card in cards:
+        writer.append(io.BytesIO(card))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+async def merged_card_pdf(recipes: Sequence[RecipePublic]) -> bytes:
+    """
+    Renders all cards concurrently and merges them into one PDF, in the
+    process pool as the merge is CPU bound too
+    """
+    tasks = [asyncio.create_task(get_card_pdf(recipe)) for recipe in recipes]
+    try:
+        cards = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), merge_card_pdfs, cards)
+
+
+def pdf_chunks(data: bytes) -> Iterator[bytes]:
+    """
+    The merged document's cross-reference table is only known once every page
+    has been added, so it's built whole and streamed from memory
+    """
+    for start in range(0, len(data), PDF_STREAM_CHUNK_SIZE):
+        yield data[start : start + PDF_STREAM_CHUNK_SIZE]
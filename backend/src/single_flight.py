@@ -0,0 +1,61 @@
+# Concurrent identical calls share one in-flight run instead of each doing the work
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from .models import SingleFlightStats
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Calls of run with a key that's already in flight wait for that run's result
+    (or exception) instead of starting their own. The run is shielded, so one
+    caller being cancelled, e.g. by its client disconnecting, doesn't cancel
+    it for the others, which is also why it shouldn't use a caller's session.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+
+    async def run(
+        self, key: Hashable, coroutine_factory: Callable[[], Awaitable[T]]
+    ) -> T:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            name=self.name,
+            calls=self.calls,
+            coalesced=self.coalesced,
+            in_flight=len(self._in_flight),
+        )
+
+
+_groups: dict[str, SingleFlight] = {}
+
+
+def single_flight(name: str) -> SingleFlight:
+    """
+    The group of calls with this name, created on first use
+    """
+    group = _groups.get(name)
+    if group is None:
+        group = _groups[name] = SingleFlight(name)
+    return group
+
+
+def single_flight_stats() -> list[SingleFlightStats]:
+    return [group.stats() for group in _groups.values()]
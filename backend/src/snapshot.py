@@ -0,0 +1,250 @@
+# Catalogue snapshots: export every recipe table to one compressed file and
+# bulk-load it into an empty database
+
+import json
+import os
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import JSON, DateTime
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .changes import CHANGE_LOG_LOCK_KEY
+from .models import (BadRecipeSlug, ImageURL, Ingredient, IngredientImageLink,
+                     InstructionStep, InstructionStepImageLink, Recipe,
+                     RecipeImageLink, RecipeIngredientLink)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Parents before children, so foreign keys are satisfied while loading.
+# Users are left out on purpose: a snapshot holds no credentials
+SNAPSHOT_MODELS = [
+    Recipe,
+    Ingredient,
+    InstructionStep,
+    RecipeIngredientLink,
+    ImageURL,
+    RecipeImageLink,
+    InstructionStepImageLink,
+    IngredientImageLink,
+    BadRecipeSlug,
+]
+SNAPSHOT_TABLES = [model.__tablename__ for model in SNAPSHOT_MODELS]
+
+# Indexes that don't back a primary key or unique constraint, which can be
+# dropped before a bulk load and rebuilt once at the end
+SECONDARY_INDEXES_SQL = """
+SELECT index_class.relname, pg_get_indexdef(index_class.oid)
+FROM pg_index
+JOIN pg_class AS index_class ON index_class.oid = pg_index.indexrelid
+JOIN pg_class AS table_class ON table_class.oid = pg_index.indrelid
+WHERE table_class.relname = ANY($1::text[])
+    AND table_class.relnamespace = 'public'::regnamespace
+    AND NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE pg_constraint.conindid = pg_index.indexrelid
+            AND pg_constraint.conrelid = pg_index.indrelid
+            AND pg_constraint.contype IN ('p', 'u', 'x')
+    )
+"""
+
+
+# The change log isn't part of a snapshot, it's seeded like the migration that
+# added it seeds an existing catalogue: one upsert per recipe and ingredient.
+# Ingredients merged into another are left out, as they're deleted for clients
+SEED_CHANGE_LOG_SQL = [
+    """
+    INSERT INTO change_log (entity, entity_id, op, data)
+    SELECT 'ingredient', id, 'upsert', json_build_object('name', name)
+    FROM ingredient
+    WHERE canonical_id IS NULL
+    ORDER BY id
+    ON CONFLICT (entity, entity_id) DO NOTHING
+    """,
+    """
+    INSERT INTO change_log (entity, entity_id, op, data)
+    SELECT 'recipe', id, 'upsert', json_build_object('slug', slug, 'title', title)
+    FROM recipe
+    ORDER BY id
+    ON CONFLICT (entity, entity_id) DO NOTHING
+    """,
+]
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _table_columns(table: str) -> list[str]:
+    model = SNAPSHOT_MODELS[SNAPSHOT_TABLES.index(table)]
+    return [column.name for column in model.__table__.columns]
+
+
+def _columns_of_type(table: str, column_type: type) -> set[str]:
+    model = SNAPSHOT_MODELS[SNAPSHOT_TABLES.index(table)]
+    return {
+        column.name
+        for column in model.__table__.columns
+        if isinstance(column.type, column_type)
+    }
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot store {type(value).__name__} in a snapshot")
+
+
+def _column_member(table: str, column: str) -> str:
+    return f"{table}/{column}.json"
+
+
+async def _driver_connection(connection):
+    raw_connection = await connection.get_raw_connection()
+    return raw_connection.driver_connection
+
+
+async def export_snapshot(engine: AsyncEngine, path: Path) -> dict:
+    """
+    Write every catalogue table to a zip file at path, one LZMA-compressed JSON
+    array per column. Storing columns rather than rows keeps similar values
+    together, which compresses far better (ids, widths and urls especially).
+
+    All tables are read in one repeatable read transaction, so the snapshot is
+    consistent even while recipes are being added. Returns the manifest.
+    """
+    async with engine.connect() as connection:
+        pg = await _driver_connection(connection)
+        async with pg.transaction(isolation="repeatable_read", readonly=True):
+            revision = await pg.fetchval("SELECT version_num FROM alembic_version")
+            manifest = {
+                "format": SNAPSHOT_FORMAT_VERSION,
+                "alembic_revision": revision,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "tables": [],
+            }
+
+            # Written next to the destination first, so a failed export never
+            # leaves a truncated snapshot behind
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            with zipfile.ZipFile(
+                tmp_path, "w", compression=zipfile.ZIP_LZMA
+            ) as archive:
+                for table in SNAPSHOT_TABLES:
+                    columns = _table_columns(table)
+                    column_list = ", ".join(f'"{column}"' for column in columns)
+                    # The engine's asyncpg codec decodes json columns to Python values
+                    rows = await pg.fetch(
+                        f"SELECT {column_list} FROM {table} ORDER BY 1"
+                    )
+                    for index, column in enumerate(columns):
+                        archive.writestr(
+                            _column_member(table, column),
+                            json.dumps(
+                                [row[index] for row in rows], default=_encode_value
+                            ),
+                        )
+                    manifest["tables"].append(
+                        {"name": table, "columns": columns, "rows": len(rows)}
+                    )
+
+                archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+            os.replace(tmp_path, path)
+
+    return manifest
+
+
+def read_manifest(archive: zipfile.ZipFile) -> dict:
+    manifest = json.loads(archive.read("manifest.json"))
+    if manifest.get("format") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(
+            f"Unsupported snapshot format {manifest.get('format')!r}, "
+            f"expected {SNAPSHOT_FORMAT_VERSION}"
+        )
+    return manifest
+
+
+async def import_snapshot(engine: AsyncEngine, path: Path) -> dict:
+    """
+    Bulk-load a snapshot written by export_snapshot into an empty database that
+    has been migrated to the same revision.
+
+    Runs in a single transaction: secondary indexes are dropped, every table
+    is loaded with COPY, then the indexes are rebuilt once, the id sequences
+    moved past the loaded ids and the change log seeded. Returns the manifest.
+    """
+    with zipfile.ZipFile(path) as archive:
+        manifest = read_manifest(archive)
+
+        async with engine.connect() as connection:
+            pg = await _driver_connection(connection)
+
+            revision = await pg.fetchval("SELECT version_num FROM alembic_version")
+            if revision != manifest["alembic_revision"]:
+                raise SnapshotError(
+                    f"Snapshot was taken at revision {manifest['alembic_revision']}, "
+                    f"but the database is at {revision}"
+                )
+
+            async with pg.transaction():
+                for table in SNAPSHOT_TABLES:
+                    if await pg.fetchval(f"SELECT EXISTS (SELECT 1 FROM {table})"):
+                        raise SnapshotError(f"Table {table} is not empty")
+
+                indexes = await pg.fetch(SECONDARY_INDEXES_SQL, SNAPSHOT_TABLES)
+                for index_name, _ in indexes:
+                    await pg.execute(f'DROP INDEX "{index_name}"')
+
+                for table_manifest in manifest["tables"]:
+                    table, columns = table_manifest["name"], table_manifest["columns"]
+                    if table_manifest["rows"] == 0:
+                        continue
+                    json_columns = _columns_of_type(table, JSON)
+                    datetime_columns = _columns_of_type(table, DateTime)
+                    values = []
+                    for column in columns:
+                        column_values = json.loads(
+                            archive.read(_column_member(table, column))
+                        )
+                        if column in json_columns:
+                            # COPY takes json columns as text
+                            column_values = [
+                                None if value is None else json.dumps(value)
+                                for value in column_values
+                            ]
+                        elif column in datetime_columns:
+                            column_values = [
+                                None if value is None else datetime.fromisoformat(value)
+                                for value in column_values
+                            ]
+                        values.append(column_values)
+                    await pg.copy_records_to_table(
+                        table, records=zip(*values), columns=columns
+                    )
+
+                for _, index_definition in indexes:
+                    await pg.execute(index_definition)
+
+                for table in SNAPSHOT_TABLES:
+                    if "id" in _table_columns(table):
+                        await pg.execute(
+                            f"""
+                            SELECT setval(
+                                pg_get_serial_sequence('{table}', 'id'),
+                                coalesce(max(id), 0) + 1,
+                                false
+                            )
+                            FROM {table}
+                            """
+                        )
+
+                await pg.execute(
+                    "SELECT pg_advisory_xact_lock($1)", CHANGE_LOG_LOCK_KEY
+                )
+                for statement in SEED_CHANGE_LOG_SQL:
+                    await pg.execute(statement)
+
+            await pg.execute(f"ANALYZE {', '.join(SNAPSHOT_TABLES)}")
+
+    return manifest
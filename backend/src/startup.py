@@ -0,0 +1,119 @@
+# Warm-up run in the background by the app's lifespan, and the readiness it reports
+
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .models import Readiness, StartupPhase
+
+logger = logging.getLogger(__name__)
+
+# A warm-up with a failed phase is run again after this long, until one succeeds
+STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", "5"))
+
+Phase = tuple[str, Callable[[], Awaitable[None]]]
+
+
+class StartupReport:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.phases: list[StartupPhase] = []
+
+    @property
+    def ok(self) -> bool:
+        return self.finished_at is not None and all(
+            phase.error is None for phase in self.phases
+        )
+
+    async def run_phase(self, name: str, function: Callable[[], Awaitable[None]]):
+        started_at = time.monotonic()
+        error = None
+        try:
+            await function()
+        except Exception as e:
+            logger.exception("Startup phase %s failed", name)
+            error = f"{type(e).__name__}: {e}"
+        self.phases.append(
+            StartupPhase(
+                name=name, seconds=round(time.monotonic() - started_at, 3), error=error
+            )
+        )
+
+    def summary(self) -> str:
+        phases = ", ".join(
+            f"{phase.name} {phase.seconds:.3f}s{' (failed)' if phase.error else ''}"
+            for phase in self.phases
+        )
+        total = (self.finished_at or time.monotonic()) - self.started_at
+        outcome = "finished" if self.ok else "failed"
+        return f"Warm-up {outcome} in {total:.3f}s: {phases}"
+
+
+_report: Optional[StartupReport] = None
+_ready = False
+
+
+async def warm_up(phases: list[Phase]) -> None:
+    """
+    Run every phase in order, and mark the worker ready once they've all
+    succeeded in the same run
+    """
+    global _report, _ready
+    attempt = 1
+    while True:
+        report = _report = StartupReport()
+        for name, function in phases:
+            await report.run_phase(name, function)
+        report.finished_at = time.monotonic()
+        logger.info(report.summary())
+        if report.ok:
+            _ready = True
+            return
+        logger.warning(
+            "Warm-up attempt %s failed, retrying in %ss", attempt, STARTUP_RETRY_SECONDS
+        )
+        attempt += 1
+        await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+
+def readiness() -> Readiness:
+    if _ready:
+        status = "ready"
+    elif _report is None or _report.finished_at is None:
+        status = "warming_up"
+    else:
+        status = "failed"
+    return Readiness(
+        ready=_ready,
+        status=status,
+        seconds=(
+            round(_report.finished_at - _report.started_at, 3)
+            if _report is not None and _report.finished_at is not None
+            else None
+        ),
+        phases=_report.phases if _report is not None else [],
+    )
+
+
+async def open_pool(engine: AsyncEngine) -> int:
+    """
+    Check out as many connections as the pool keeps open at once, so they're
+    all connected before the first requests, then return them to the pool
+    """
+    size_of = getattr(engine.sync_engine.pool, "size", None)
+    size = size_of() if size_of is not None else 1
+    results = await asyncio.gather(
+        *(engine.connect() for _ in range(size)), return_exceptions=True
+    )
+    for result in results:
+        if not isinstance(result, BaseException):
+            await result.close()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return size
@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+import pytest
+from starlette.requests import Request
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src.admission import (AdmissionController,  # noqa: E402
+                           AdmissionRejected, ClientRateLimiter, client_key)
+from src.auth import create_access_token  # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_queue_is_bounded_and_slots_are_handed_on():
+    controller = AdmissionController("test", limit=1, queue_size=1, timeout=1)
+    await controller.acquire()
+    waiting = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected):
+        await controller.acquire()
+
+    controller.release()
+    await waiting
+    assert controller.stats().model_dump() == {
+        "name": "test",
+        "limit": 1,
+        "active": 1,
+        "queued": 0,
+        "admitted": 2,
+        "rejected": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_queued_requests_time_out():
+    controller = AdmissionController("test", limit=1, queue_size=10, timeout=0.01)
+    await controller.acquire()
+
+    with pytest.raises(AdmissionRejected):
+        await controller.acquire()
+
+    controller.release()
+    assert (controller.active, controller.rejected) == (0, 1)
+
+
+def test_client_rate_limits_are_separate():
+    limiter = ClientRateLimiter(rate=1, burst=2, max_clients=1)
+
+    assert [limiter.take("a") for _ in range(2)] == [0, 0]
+    assert 0 < limiter.take("a") <= 1
+    # "a" is forgotten to stay under max_clients, so starts over with a full bucket
+    assert limiter.take("b") == 0
+    assert limiter.take("a") == 0
+
+
+def test_client_key_uses_the_verified_token_subject():
+    def request(authorization=None):
+        headers = [(b"authorization", authorization.encode())] if authorization else []
+        return Request(
+            {"type": "http", "headers": headers, "client": ("10.0.0.1", 1234)}
+        )
+
+    token = create_access_token({"sub": "alice"})
+    assert client_key(request(f"Bearer {token}")) == "user:alice"
+    # Tokens that don't verify are counted against the address they came from
+    assert client_key(request("Bearer made-up")) == "ip:10.0.0.1"
+    assert client_key(request(f"Basic {token}")) == "ip:10.0.0.1"
+    assert client_key(request()) == "ip:10.0.0.1"
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src import auth  # noqa: E402
+from src.cache import TTLCache  # noqa: E402
+from src.models import UserInDB  # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_offloaded():
+    hashed_password = await auth.get_password_hash_async("password")
+
+    assert await auth.verify_password_async("password", hashed_password)
+    assert not await auth.verify_password_async("wrong password", hashed_password)
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache: TTLCache[int] = TTLCache(ttl=30, max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    # "b" was least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    disabled_cache: TTLCache[int] = TTLCache(ttl=0)
+    disabled_cache.set("a", 1)
+    assert disabled_cache.get("a") is None
+
+
+def test_principal_cache_invalidated_on_user_change():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine, tables=[UserInDB.__table__])
+
+    with Session(engine) as session:
+        user = UserInDB(username="admin", hashed_password="hash")
+        session.add(user)
+        session.commit()
+
+        auth.principal_cache.set("admin", UserInDB.model_validate(user))
+        assert auth.principal_cache.get("admin") is not None
+
+        user.email = "admin@example.com"
+        session.add(user)
+        session.commit()
+
+    assert auth.principal_cache.get("admin") is None
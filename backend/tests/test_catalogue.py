@@ -0,0 +1,190 @@
+import asyncio
+import random
+from collections import Counter
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import pytest
+
+from src import catalogue as catalogue_module
+from src.catalogue import CatalogueFilter, RecipeCatalogue
+
+CHICKEN, RICE, TOFU = 1, 2, 3
+
+
+def make_catalogue() -> RecipeCatalogue:
+    catalogue = RecipeCatalogue()
+    catalogue.add(1, "quick-chicken", "Quick Chicken", 15, 4.7, [(CHICKEN, "chicken")])
+    catalogue.add(
+        2,
+        "chicken-rice",
+        "Chicken Rice",
+        30,
+        4.2,
+        [(CHICKEN, "chicken"), (RICE, "rice")],
+    )
+    catalogue.add(
+        3, "tofu-rice", "Tofu Rice", 45, None, [(TOFU, "tofu"), (RICE, "rice")]
+    )
+    catalogue.add(4, "slow-stew", "Slow Stew", None, 4.9, [])
+    return catalogue
+
+
+def slugs(recipes) -> set[str]:
+    return {recipe.slug for recipe in recipes}
+
+
+def test_random_respects_filters():
+    catalogue = make_catalogue()
+    rng = random.Random(0)
+
+    assert slugs(catalogue.random(CatalogueFilter(), count=10, rng=rng)) == {
+        "quick-chicken",
+        "chicken-rice",
+        "tofu-rice",
+        "slow-stew",
+    }
+    assert slugs(
+        catalogue.random(CatalogueFilter(max_prep_time=30), count=10, rng=rng)
+    ) == {"quick-chicken", "chicken-rice"}
+    assert slugs(
+        catalogue.random(
+            CatalogueFilter(ingredient_ids=(CHICKEN, RICE)), count=10, rng=rng
+        )
+    ) == {"chicken-rice"}
+    assert catalogue.random(CatalogueFilter(min_rating=5.0), rng=rng) == []
+
+
+def test_random_picks_every_match():
+    catalogue = make_catalogue()
+    rng = random.Random(1)
+
+    picked = Counter(
+        recipe.slug
+        for _ in range(400)
+        for recipe in catalogue.random(CatalogueFilter(min_rating=4.5), rng=rng)
+    )
+
+    assert picked.keys() == {"quick-chicken", "slow-stew"}
+    assert min(picked.values()) > 150
+
+
+def test_facets_follow_adds_and_removes():
+    catalogue = make_catalogue()
+    rice_filter = CatalogueFilter(ingredient_ids=(RICE,))
+
+    facets = catalogue.facets(rice_filter)
+    assert facets.total == 2
+    assert [facet.count for facet in facets.prep_time] == [0, 1, 2, 2]
+    assert [facet.count for facet in facets.rating] == [1, 0]
+    assert [(facet.name, facet.count) for facet in facets.ingredients][0] == (
+        "rice",
+        2,
+    )
+
+    # Cached masks are updated in place
+    catalogue.add(5, "egg-fried-rice", "Egg Fried Rice", 10, 4.6, [(RICE, "rice")])
+    catalogue.remove(2)
+
+    facets = catalogue.facets(rice_filter)
+    assert facets.total == 2
+    assert [facet.count for facet in facets.prep_time] == [1, 1, 2, 2]
+    assert [facet.count for facet in facets.rating] == [1, 1]
+    assert len(catalogue) == 4
+
+
+def test_ingredient_pairs_follow_adds_and_removes():
+    catalogue = make_catalogue()
+
+    assert [
+        (count.name, count.recipe_count) for count in catalogue.counted_ingredients()
+    ] == [
+        ("chicken", 2),
+        ("rice", 2),
+        ("tofu", 1),
+    ]
+    rice = catalogue.ingredient_pairs(RICE)
+    assert rice.recipe_count == 2
+    assert {(pair.name, pair.count) for pair in rice.pairs} == {
+        ("chicken", 1),
+        ("tofu", 1),
+    }
+
+    catalogue.add(5, "egg-fried-rice", "Egg Fried Rice", 10, 4.6, [(RICE, "rice")])
+    catalogue.remove(3)
+
+    rice = catalogue.ingredient_pairs(RICE)
+    assert rice.recipe_count == 2
+    assert [(pair.name, pair.count) for pair in rice.pairs] == [("chicken", 1)]
+    assert catalogue.ingredient_pairs(TOFU) is None
+
+
+def test_suggestions_follow_adds_and_removes():
+    catalogue = make_catalogue()
+
+    def suggest(query: str) -> list[str]:
+        return [count.name for count in catalogue.suggest_ingredients(query)]
+
+    assert suggest("ri") == ["rice"]
+    assert suggest("C") == ["chicken"]
+    assert suggest("x") == suggest("  ") == []
+
+    catalogue.add(
+        5,
+        "brown-rice-bowl",
+        "Brown Rice Bowl",
+        20,
+        None,
+        [(4, "Brown rice"), (5, "Chicken breast fillets")],
+    )
+    catalogue.add(6, "rice-salad", "Rice Salad", 20, None, [(4, "Brown rice")])
+    assert suggest("ri") == ["rice", "Brown rice"]
+    assert suggest("br ri") == ["Brown rice"]
+    assert suggest("chi") == ["chicken", "Chicken breast fillets"]
+
+    catalogue.remove(5)
+    catalogue.remove(6)
+    assert suggest("ri") == ["rice"]
+    assert suggest("breast") == []
+
+
+@pytest.mark.asyncio
+async def test_changes_during_reload_are_kept(monkeypatch):
+    loading = asyncio.Event()
+    loaded = asyncio.Event()
+
+    async def load_catalogue(session):
+        loading.set()
+        await loaded.wait()
+        return make_catalogue()
+
+    monkeypatch.setattr(catalogue_module, "load_catalogue", load_catalogue)
+    monkeypatch.setattr(catalogue_module, "get_engine", lambda read_only: None)
+    monkeypatch.setattr(catalogue_module, "AsyncSession", lambda engine: nullcontext())
+    monkeypatch.setattr(catalogue_module, "_catalogue", make_catalogue())
+
+    refresh = asyncio.create_task(catalogue_module._refresh_catalogue())
+    await loading.wait()
+    rice = SimpleNamespace(ingredient=SimpleNamespace(id=RICE, name="rice"))
+    catalogue_module.add_to_catalogue(
+        SimpleNamespace(
+            id=5,
+            slug="egg-fried-rice",
+            title="Egg Fried Rice",
+            prep_time=10,
+            rating=4.6,
+            ingredients=[rice],
+        )
+    )
+    catalogue_module.remove_from_catalogue([1])
+    loaded.set()
+    await refresh
+
+    catalogue = catalogue_module._catalogue
+    assert slugs(catalogue.random(CatalogueFilter(), count=10)) == {
+        "chicken-rice",
+        "tofu-rice",
+        "slow-stew",
+        "egg-fried-rice",
+    }
+    assert catalogue_module._pending_changes is None
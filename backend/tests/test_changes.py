@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src import main  # noqa: E402
+from src.changes import (compact_change_log, get_changes,  # noqa: E402
+                         recipe_upsert, record_changes)
+from src.maintenance import collect_garbage  # noqa: E402
+
+# The change log relies on Postgres advisory locks, see conftest.py
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    TEST_DATABASE_URL is None, reason="TEST_DATABASE_URL is not set"
+)
+
+
+def summarize(change_set):
+    return [(change.entity, change.op, change.data) for change in change_set.changes]
+
+
+@pytest.mark.asyncio
+async def test_deletes_are_logged_in_order(catalogue_session):
+    await main.delete_recipes(slugs=["curry"], session=catalogue_session)
+    first = await get_changes(catalogue_session, since=0, limit=100)
+    assert summarize(first) == [("recipe", "delete", {"slug": "curry"})]
+
+    await collect_garbage(catalogue_session)
+    second = await get_changes(catalogue_session, since=first.version, limit=100)
+    assert summarize(second) == [("ingredient", "delete", {"name": "curry paste"})]
+    assert second.version > first.version
+
+    caught_up = await get_changes(catalogue_session, since=second.version, limit=100)
+    assert (caught_up.version, caught_up.changes) == (second.version, [])
+
+
+@pytest.mark.asyncio
+async def test_later_changes_replace_earlier_ones(catalogue_session):
+    recipe = (await main.list_recipes(session=catalogue_session))[0]
+    recipe = await main.get_recipe_by_slug(
+        recipe.slug, None, None, session=catalogue_session
+    )
+    slug = recipe.slug
+    await record_changes(catalogue_session, [recipe_upsert(recipe)])
+    await catalogue_session.commit()
+    await main.delete_recipe_by_slug(slug, session=catalogue_session)
+
+    changes = await get_changes(catalogue_session, since=0, limit=100)
+    assert summarize(changes) == [("recipe", "delete", {"slug": slug})]
+
+
+@pytest.mark.asyncio
+async def test_compaction_resets_clients_behind_it(catalogue_session):
+    await main.delete_recipes(slugs=["curry", "stew"], session=catalogue_session)
+    await main.delete_recipes(slugs=["soup"], session=catalogue_session)
+    changes = await get_changes(catalogue_session, since=0, limit=1)
+    assert changes.has_more
+
+    assert await compact_change_log(catalogue_session, retention_days=-1) == 3
+
+    behind = await get_changes(catalogue_session, since=changes.version, limit=100)
+    assert behind.reset
+    current = await get_changes(catalogue_session, since=behind.version, limit=100)
+    assert (current.reset, current.changes) == (False, [])
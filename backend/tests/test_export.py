@@ -0,0 +1,17 @@
+import os
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src.main import accepts_gzip  # noqa: E402
+
+
+def test_accepts_gzip_reads_q_values():
+    assert accepts_gzip("gzip, deflate, br")
+    assert accepts_gzip("br;q=1.0, GZIP;q=0.5")
+    assert accepts_gzip("*")
+    assert not accepts_gzip("")
+    assert not accepts_gzip("identity")
+    assert not accepts_gzip("gzip;q=0")
+    assert not accepts_gzip("gzip;q=0.000, *")
+    assert not accepts_gzip("*;q=0")
+    assert not accepts_gzip("gzip;q=oops")
@@ -0,0 +1,65 @@
+from src.gousto_fetcher.canonical import ALIASES, canonical_ingredient_name
+from src.gousto_fetcher.parser import parse_all_ingredients
+from src.gousto_fetcher.synthetic import SyntheticCatalogue
+
+
+def ingredient_data(name: str, label: str) -> dict:
+    return {"name": name, "label": label, "media": {"images": []}}
+
+
+def test_names_are_canonicalized_once():
+    assert canonical_ingredient_name("Fresh Coriander") == "coriander"
+    assert canonical_ingredient_name("coriander leaves") == "coriander"
+    assert canonical_ingredient_name("Free-Range Eggs") == "egg"
+    assert canonical_ingredient_name("Chopped Tomatoes") == "chopped tomato"
+    assert canonical_ingredient_name("Crème Fraîche") == "creme fraiche"
+    assert canonical_ingredient_name("couscous") == "couscous"
+
+    catalogue = SyntheticCatalogue(100, seed=1)
+    names = [
+        ingredient["name"]
+        for slug in catalogue.slugs
+        for ingredient in catalogue.recipe_payload(slug, "http://mock")["data"][
+            "entry"
+        ]["ingredients"]
+        if "name" in ingredient
+    ]
+    for name in [*names, *ALIASES, *ALIASES.values()]:
+        canonical = canonical_ingredient_name(name)
+        assert canonical_ingredient_name(canonical) == canonical
+
+
+def test_names_for_the_same_ingredient_are_merged():
+    ingredients = parse_all_ingredients(
+        [
+            ingredient_data("Garlic Cloves", "2 Garlic Cloves"),
+            ingredient_data("Garlic", "Garlic"),
+            ingredient_data("Soy Sauce", "Soy Sauce (15ml)"),
+            ingredient_data("soy sauce", "soy sauce 8ml"),
+        ]
+    )
+
+    assert {(ingredient.name, ingredient.amount) for ingredient in ingredients} == {
+        ("garlic clove", "3"),
+        ("soy sauce", "15ml + 8ml"),
+    }
+
+
+def test_only_exact_repeats_are_dropped():
+    ingredients = parse_all_ingredients(
+        [
+            ingredient_data("Garlic clove", "Garlic clove x2"),
+            ingredient_data("Garlic cloves", "Garlic cloves x2"),
+            # The same entry twice
+            ingredient_data("Lime", "Lime x1"),
+            ingredient_data("Lime", "Lime x1"),
+            ingredient_data("Soy Sauce", "Soy Sauce (15ml)"),
+            ingredient_data("Soy Sauces", "Soy Sauces (15ml)"),
+        ]
+    )
+
+    assert {(ingredient.name, ingredient.amount) for ingredient in ingredients} == {
+        ("garlic clove", "x4"),
+        ("lime", "x1"),
+        ("soy sauce", "15ml + 15ml"),
+    }
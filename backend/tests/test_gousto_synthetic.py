@@ -0,0 +1,54 @@
+import pytest
+from aiohttp.test_utils import TestServer
+
+from src.gousto_fetcher import fetcher
+from src.gousto_fetcher.parser import parse_recipe
+from src.gousto_fetcher.synthetic import (MockFaults, SyntheticCatalogue,
+                                          create_mock_app)
+from src.gousto_fetcher.throttle import AdaptiveLimiter, CircuitBreaker
+
+
+def test_every_synthetic_recipe_parses():
+    catalogue = SyntheticCatalogue(300, seed=1)
+
+    recipes = [
+        parse_recipe(catalogue.recipe_payload(slug, "http://mock"))
+        for slug in catalogue.slugs
+    ]
+
+    assert any(recipe.rating is None for recipe in recipes)
+    # Merged duplicates, and nothing with a zero quantity left in
+    assert any(
+        " + " in ingredient.amount
+        for recipe in recipes
+        for ingredient in recipe.ingredients
+    )
+    assert all(
+        not ingredient.amount.endswith("x0")
+        for recipe in recipes
+        for ingredient in recipe.ingredients
+    )
+    assert catalogue.recipe_payload("not-a-slug", "http://mock") is None
+
+
+@pytest.mark.asyncio
+async def test_crawl_gets_every_slug_from_a_flaky_mock(monkeypatch):
+    catalogue = SyntheticCatalogue(500)
+    faults = MockFaults(error_rate=0.1, throttle_rate=0.1, retry_after_seconds=0)
+    server = TestServer(create_mock_app(catalogue, faults, seed=0))
+    await server.start_server()
+    monkeypatch.setattr(
+        fetcher,
+        "GET_RECIPES_ENDPOINT",
+        str(server.make_url("/cmsreadbroker/v1/recipes?category=recipes")),
+    )
+    monkeypatch.setattr(fetcher, "limiter", AdaptiveLimiter(4))
+    monkeypatch.setattr(fetcher, "breaker", CircuitBreaker(20, reset_seconds=1))
+    monkeypatch.setattr(fetcher, "GOUSTO_BACKOFF_SECONDS", 0.01)
+
+    try:
+        slugs = await fetcher.get_all_recipe_slugs(max_concurrent_requests=8)
+    finally:
+        await server.close()
+
+    assert slugs == catalogue.slugs
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.gousto_fetcher import fetcher
+from src.gousto_fetcher.errors import UpstreamUnavailableError
+from src.gousto_fetcher.throttle import (AdaptiveLimiter, CircuitBreaker,
+                                         parse_retry_after)
+
+
+@pytest.fixture
+def fresh_flow_control(monkeypatch):
+    monkeypatch.setattr(fetcher, "limiter", AdaptiveLimiter(4))
+    monkeypatch.setattr(fetcher, "breaker", CircuitBreaker(3, reset_seconds=60))
+    monkeypatch.setattr(fetcher, "GOUSTO_BACKOFF_SECONDS", 0.01)
+
+
+async def serve(responses: list[web.Response]) -> TestServer:
+    async def handler(request):
+        return responses.pop(0)
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+@pytest.mark.asyncio
+async def test_retries_throttled_and_failed_responses(fresh_flow_control):
+    server = await serve(
+        [
+            web.Response(status=429, headers={"Retry-After": "0"}),
+            web.Response(status=503),
+            web.json_response({"ok": True}),
+            web.Response(status=404),
+        ]
+    )
+    async with aiohttp.ClientSession() as session:
+        url = str(server.make_url("/"))
+        assert await fetcher.get_json(session, url) == {"ok": True}
+        # Not retried, the slug really is bad
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            await fetcher.get_json(session, url)
+    await server.close()
+
+    assert error.value.status == 404
+    assert fetcher.limiter.limit < 4
+    assert not fetcher.breaker.is_open
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_repeated_failures(fresh_flow_control, monkeypatch):
+    monkeypatch.setattr(fetcher, "GOUSTO_MAX_ATTEMPTS", 3)
+    server = await serve([web.Response(status=500) for _ in range(3)])
+    async with aiohttp.ClientSession() as session:
+        with pytest.raises(UpstreamUnavailableError):
+            await fetcher.get_json(session, str(server.make_url("/")))
+    await server.close()
+
+    assert fetcher.breaker.is_open
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_lets_another_caller_probe(fresh_flow_control):
+    fetcher.breaker.opened_at = time.monotonic() - 60
+    # The probe is cancelled while waiting for a concurrency slot
+    fetcher.limiter.in_flight = 4
+    probe = asyncio.create_task(fetcher.get_json(None, "http://unused"))
+    await asyncio.sleep(0.01)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert fetcher.limiter.in_flight == 4
+    assert await asyncio.wait_for(fetcher.breaker.wait(), 1) is True
+
+
+def test_limiter_is_additive_increase_multiplicative_decrease():
+    limiter = AdaptiveLimiter(8)
+    limiter.in_flight = 10
+    for _ in range(8):
+        limiter.release(time.monotonic())
+    assert 8.9 < limiter.limit < 9
+
+    # Both requests were sent before the first decrease, so only it counts
+    started_at = time.monotonic()
+    limiter.release(started_at, overloaded=True)
+    limiter.release(started_at, overloaded=True)
+    assert 4.45 < limiter.limit < 4.5
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
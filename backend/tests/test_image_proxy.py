@@ -0,0 +1,125 @@
+import asyncio
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from src import image_proxy
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), color=(200, 80, 40)).save(output, "JPEG")
+    return output.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = image_proxy.DiskLRUCache(str(tmp_path), max_bytes=25)
+
+    await cache.put("a", b"x" * 10)
+    await cache.put("b", b"x" * 10)
+    assert cache.get("a") is not None
+    await cache.put("c", b"x" * 10)
+
+    assert cache.get("b") is None
+    assert not os.path.exists(cache.path("b"))
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.total_bytes == 20
+
+    # The index is rebuilt from disk
+    cache.close()
+    assert image_proxy.DiskLRUCache(str(tmp_path), max_bytes=25).total_bytes == 20
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_keeps_pinned_and_forgets_missing_files(tmp_path):
+    cache = image_proxy.DiskLRUCache(str(tmp_path), max_bytes=25)
+    await cache.put("a", b"x" * 10)
+    await cache.put("b", b"x" * 10)
+    with cache.pinned("a"):
+        await cache.put("c", b"x" * 10)
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+
+    os.remove(cache.path("c"))
+    assert cache.get("c") is None
+    assert cache.total_bytes == 10
+
+
+def test_each_disk_cache_holds_its_own_directory(tmp_path):
+    first = image_proxy.DiskLRUCache(str(tmp_path), max_bytes=25)
+    second = image_proxy.DiskLRUCache(str(tmp_path), max_bytes=25)
+    assert first.directory != second.directory
+
+    (tmp_path / "0" / "a").write_bytes(b"x" * 10)
+    first.close()
+    # The next one to start carries on with the files of the one that closed
+    third = image_proxy.DiskLRUCache(str(tmp_path), max_bytes=25)
+    assert third.directory == first.directory
+    assert third.get("a") is not None
+    second.close()
+    third.close()
+
+
+def test_normalize_width():
+    assert image_proxy.normalize_width(1) == 50
+    assert image_proxy.normalize_width(200) == 200
+    assert image_proxy.normalize_width(201) == 250
+    assert image_proxy.normalize_width(10_000) == image_proxy.MAX_IMAGE_WIDTH
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_fetch_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        image_proxy, "_cache", image_proxy.DiskLRUCache(str(tmp_path), 10**6)
+    )
+    fetches = 0
+
+    async def fake_fetch_original(url: str, key: str) -> str:
+        nonlocal fetches
+        fetches += 1
+        await asyncio.sleep(0.01)
+        return await image_proxy.get_cache().put(key, make_jpeg(400, 200))
+
+    monkeypatch.setattr(image_proxy, "_fetch_original", fake_fetch_original)
+
+    url = "https://example.com/image.jpg"
+    paths = await asyncio.gather(
+        *(image_proxy.get_variant_path(url, 100, "webp") for _ in range(10))
+    )
+
+    assert fetches == 1
+    assert len(set(paths)) == 1
+    with Image.open(paths[0]) as image:
+        assert image.format == "WEBP"
+        assert image.size == (100, 50)
+
+
+@pytest.mark.asyncio
+async def test_served_images_are_pinned_until_sent(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        image_proxy, "_cache", image_proxy.DiskLRUCache(str(tmp_path), 1)
+    )
+
+    async def fake_fetch_original(url: str, key: str) -> str:
+        return await image_proxy.get_cache().put(key, make_jpeg(40, 20))
+
+    monkeypatch.setattr(image_proxy, "_fetch_original", fake_fetch_original)
+
+    key, path = await image_proxy.acquire_image("https://example.com/a.jpg")
+    response = image_proxy.CachedFileResponse(key)
+    # Over budget, but a and b are in use
+    await image_proxy.acquire_image("https://example.com/b.jpg")
+    assert os.path.exists(path)
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await response({"type": "http", "method": "GET", "headers": []}, None, send)
+    assert sent[-1]["type"] == "http.response.body"
+    assert key not in image_proxy.get_cache()._pinned
@@ -0,0 +1,87 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.logs import (DroppingQueueHandler, JsonFormatter, configure_logging,
+                      log_slow_statements, logging_stats, parse_levels,
+                      stop_logging)
+
+
+def test_json_lines_carry_extra_fields_and_exceptions():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger("test_logs.json")
+    logger.addHandler(handler)
+    try:
+        logger.warning("took %s", "long", extra={"seconds": 1.5})
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            logger.exception("failed")
+    finally:
+        logger.removeHandler(handler)
+
+    first, second = (json.loads(line) for line in stream.getvalue().splitlines())
+    assert (first["level"], first["logger"]) == ("WARNING", "test_logs.json")
+    assert (first["message"], first["seconds"]) == ("took long", 1.5)
+    assert "ValueError: broken" in second["exception"]
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    record = logging.makeLogRecord({"msg": "%s items", "args": ([1, 2],)})
+
+    handler.handle(record)
+    handler.handle(record)
+
+    assert handler.dropped == 1
+    assert handler.queue.get_nowait().msg == "[1, 2] items"
+
+
+def test_dropped_records_are_reported():
+    stop_logging()
+    stream = io.StringIO()
+    handler = configure_logging(stream)
+    try:
+        handler.dropped = 3
+        assert logging_stats().dropped == 3
+    finally:
+        stop_logging()
+
+    warning = json.loads(stream.getvalue().splitlines()[-1])
+    assert warning["level"] == "WARNING"
+    assert warning["message"].startswith("3 log records were dropped")
+
+
+def test_parse_levels():
+    assert parse_levels("src.sql=warning, src.gousto_fetcher=DEBUG,") == {
+        "src.sql": logging.WARNING,
+        "src.gousto_fetcher": logging.DEBUG,
+    }
+    with pytest.raises(ValueError):
+        parse_levels("src.sql=LOUD")
+
+
+@pytest.mark.asyncio
+async def test_only_slow_statements_are_logged(caplog):
+    fast = create_async_engine("sqlite+aiosqlite://")
+    every = create_async_engine("sqlite+aiosqlite://")
+    log_slow_statements(fast, threshold_seconds=60)
+    log_slow_statements(every, threshold_seconds=0)
+
+    with caplog.at_level(logging.INFO, logger="src.sql"):
+        for engine in [fast, every]:
+            async with engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+            await engine.dispose()
+
+    records = [record for record in caplog.records if record.name == "src.sql"]
+    assert len(records) == 1
+    assert records[0].getMessage().endswith("ms SELECT 1")
+    assert records[0].seconds >= 0
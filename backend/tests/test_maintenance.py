@@ -0,0 +1,129 @@
+import os
+
+import pytest
+from sqlalchemy import func, pool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src import main  # noqa: E402
+from src.maintenance import (collect_garbage,  # noqa: E402
+                             merge_duplicate_ingredients)
+from src.models import (ImageURL, Ingredient, InstructionStep,  # noqa: E402
+                        Recipe, RecipeIngredientLink)
+
+# Cascades are enforced by Postgres, so these need TEST_DATABASE_URL (see conftest.py)
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    TEST_DATABASE_URL is None, reason="TEST_DATABASE_URL is not set"
+)
+
+
+async def count(session: AsyncSession, model) -> int:
+    return (await session.exec(select(func.count()).select_from(model))).one()
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_cascades(catalogue_session):
+    result = await main.delete_recipes(
+        slugs=["curry", "stew", "curry", "missing"], session=catalogue_session
+    )
+
+    assert result.deleted_slugs == ["curry", "stew"]
+    assert result.missing_slugs == ["missing"]
+    assert await count(catalogue_session, Recipe) == 1
+    assert await count(catalogue_session, InstructionStep) == 1
+    assert await count(catalogue_session, RecipeIngredientLink) == 2
+
+
+@pytest.mark.asyncio
+async def test_collect_garbage_removes_orphans(catalogue_session):
+    await main.delete_recipes(slugs=["curry", "stew"], session=catalogue_session)
+    # Recipe and step images lost their owners through the cascade already
+    assert await count(catalogue_session, ImageURL) == 10
+
+    result = await collect_garbage(catalogue_session, batch_size=1)
+
+    assert (result.ingredients, result.images) == (2, 6)
+    names = (await catalogue_session.exec(select(Ingredient.name))).all()
+    assert sorted(names) == ["onion", "soup paste"]
+    assert await count(catalogue_session, ImageURL) == 4
+
+    result = await collect_garbage(catalogue_session, batch_size=1)
+    assert (result.ingredients, result.images) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_merge_duplicate_ingredients(catalogue_session):
+    curry = (
+        await catalogue_session.exec(select(Recipe).where(Recipe.slug == "curry"))
+    ).one()
+    curry_id, curry_updated_at = curry.id, curry.updated_at
+    onions = Ingredient(name="Onions")
+    catalogue_session.add_all(
+        [
+            RecipeIngredientLink(recipe=curry, ingredient=onions, amount="100g"),
+            Ingredient(name="Curry Pastes"),
+        ]
+    )
+    await catalogue_session.flush()
+    onions_id = onions.id
+    await catalogue_session.commit()
+
+    engine = create_async_engine(
+        TEST_DATABASE_URL, poolclass=pool.NullPool, isolation_level="AUTOCOMMIT"
+    )
+    async with engine.connect() as connection:
+        assert await connection.run_sync(merge_duplicate_ingredients, 1) == 2
+        assert await connection.run_sync(merge_duplicate_ingredients, 1) == 0
+    await engine.dispose()
+
+    names = (
+        await catalogue_session.exec(
+            select(Ingredient.name).where(col(Ingredient.canonical_id).is_(None))
+        )
+    ).all()
+    assert sorted(names) == ["curry paste", "onion", "soup paste", "stew paste"]
+    amounts = (
+        await catalogue_session.exec(
+            select(RecipeIngredientLink.amount)
+            .join(Ingredient)
+            .where(
+                Ingredient.name == "onion", RecipeIngredientLink.recipe_id == curry_id
+            )
+        )
+    ).all()
+    assert amounts == ["1 + 100g"]
+    updated_at = (
+        await catalogue_session.exec(
+            select(Recipe.updated_at).where(Recipe.id == curry_id)
+        )
+    ).one()
+    assert updated_at > curry_updated_at
+    recipes = await main.get_recipes_by_ingredient_id(onions_id, catalogue_session)
+    assert sorted(recipe.slug for recipe in recipes) == ["curry", "soup", "stew"]
+
+    # Merged ingredients are kept until the one they were merged into goes
+    assert (await collect_garbage(catalogue_session)).ingredients == 0
+
+
+@pytest.mark.asyncio
+async def test_collect_garbage_skips_ingredients_being_reused(catalogue_session):
+    await main.delete_recipes(slugs=["curry"], session=catalogue_session)
+
+    # As add_recipe does for an ingredient it is about to link to
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=pool.NullPool)
+    async with AsyncSession(engine) as other_session:
+        await other_session.exec(
+            select(Ingredient)
+            .where(Ingredient.name == "curry paste")
+            .with_for_update(read=True)
+        )
+        assert (await collect_garbage(catalogue_session)).ingredients == 0
+        await other_session.commit()
+    await engine.dispose()
+
+    assert (await collect_garbage(catalogue_session)).ingredients == 1
@@ -0,0 +1,63 @@
+import asyncio
+import os
+
+import pytest
+from alembic.config import Config
+from sqlalchemy import inspect, pool, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+
+from alembic import command
+from src import models  # noqa: F401
+
+# The other tests create the schema from the models, this checks the
+# migrations create the same indexes. The database is wiped, see conftest.py
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    TEST_DATABASE_URL is None, reason="TEST_DATABASE_URL is not set"
+)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def indexes(connection) -> dict:
+    """Name and uniqueness of every index and unique constraint, by table and columns"""
+    inspector = inspect(connection)
+    found = {}
+    for table in inspector.get_table_names():
+        for index in inspector.get_indexes(table):
+            found[table, tuple(index["column_names"])] = (
+                index["name"],
+                bool(index["unique"]),
+            )
+        for constraint in inspector.get_unique_constraints(table):
+            found[table, tuple(constraint["column_names"])] = (constraint["name"], True)
+    return found
+
+
+@pytest.mark.asyncio
+async def test_migrations_create_the_model_indexes():
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=pool.NullPool)
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.drop_all)
+        await connection.run_sync(SQLModel.metadata.create_all)
+        expected = await connection.run_sync(indexes)
+        await connection.run_sync(SQLModel.metadata.drop_all)
+        await connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+
+    # Without a config file, so alembic leaves logging alone
+    config = Config()
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    config.attributes["url"] = TEST_DATABASE_URL
+    # env.py runs its own event loop
+    await asyncio.to_thread(command.upgrade, config, "head")
+
+    try:
+        async with engine.connect() as connection:
+            migrated = await connection.run_sync(indexes)
+        assert migrated == expected
+    finally:
+        async with engine.begin() as connection:
+            await connection.execute(text("DROP TABLE alembic_version"))
+        await engine.dispose()
@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from src import profiling
+
+
+def spin(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def slow_app(scope, receive, send):
+    spin(0.05)
+    await asyncio.sleep(0.05)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"done"})
+
+
+@pytest.mark.asyncio
+async def test_sampled_request_profile_is_saved(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(profiling, "sampler", profiling.Sampler(0.002))
+
+    transport = httpx.ASGITransport(app=profiling.ProfilingMiddleware(slow_app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/slow")
+
+    [summary] = profiling.list_profiles()
+    assert response.headers["x-profile-id"] == summary.id
+    assert (summary.method, summary.path, summary.status) == ("GET", "/slow", 200)
+    assert summary.samples > 10
+
+    folded = profiling.profile_path(summary.id).read_text()
+    stacks = dict(line.rsplit(" ", 1) for line in folded.splitlines())
+    assert any(stack.endswith("spin (tests/test_profiling.py:10)") for stack in stacks)
+    assert any(
+        stack.startswith("[waiting]") and "slow_app" in stack for stack in stacks
+    )
+
+
+def test_header_needs_a_valid_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0)
+    monkeypatch.setattr(profiling, "decode_access_token", lambda token: {"sub": "me"})
+    assert profiling.should_profile({b"x-profile": b"1", b"authorization": b"Bearer t"})
+    assert not profiling.should_profile({b"x-profile": b"1"})
+    assert not profiling.should_profile({b"authorization": b"Bearer t"})
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+from sqlalchemy import pool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src import main  # noqa: E402
+from src.models import RecipePublic  # noqa: E402
+from src.read_snapshot import build_read_snapshot  # noqa: E402
+
+# The snapshot is built from Postgres, see conftest.py
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    TEST_DATABASE_URL is None, reason="TEST_DATABASE_URL is not set"
+)
+
+
+@pytest.mark.asyncio
+async def test_snapshot_serves_same_recipes(catalogue_session, tmp_path):
+    path = str(tmp_path / "catalogue.sqlite")
+    row_counts = await build_read_snapshot(path, catalogue_session.bind)
+    assert row_counts["recipe"] == 3
+
+    snapshot_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{path}", poolclass=pool.NullPool
+    )
+    async with AsyncSession(snapshot_engine) as snapshot_session:
+        for image_width in [None, 100]:
+            expected = await main.get_recipe_by_slug(
+                "curry", image_width, None, session=catalogue_session
+            )
+            actual = await main.get_recipe_by_slug(
+                "curry", image_width, None, session=snapshot_session
+            )
+            assert RecipePublic.model_validate(actual) == RecipePublic.model_validate(
+                expected
+            )
+
+        ingredients = await main.list_ingredients(session=snapshot_session)
+        assert len(ingredients) == 4
+
+    # A rebuild replaces the file; new sessions see the deletion
+    await main.delete_recipes(slugs=["curry"], session=catalogue_session)
+    await build_read_snapshot(path, catalogue_session.bind)
+    async with AsyncSession(snapshot_engine) as snapshot_session:
+        recipes = await main.list_recipes(session=snapshot_session)
+        assert sorted(recipe.slug for recipe in recipes) == ["soup", "stew"]
+
+    await snapshot_engine.dispose()
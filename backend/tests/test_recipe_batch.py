@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src import main  # noqa: E402
+from src.models import RecipeBatchRequest  # noqa: E402
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    TEST_DATABASE_URL is None, reason="TEST_DATABASE_URL is not set"
+)
+
+
+@pytest.mark.asyncio
+async def test_shared_ingredients_and_images_are_sent_once(catalogue_session):
+    soup = await main.get_recipe_by_slug("soup", None, None, session=catalogue_session)
+
+    batch = await main.get_recipe_batch(
+        RecipeBatchRequest(slugs=["stew", "curry", "nope"], ids=[soup.id, -1]),
+        image_width=None,
+        image_profile=None,
+        session=catalogue_session,
+    )
+
+    assert [recipe.slug for recipe in batch.recipes] == ["stew", "curry", "soup"]
+    assert (batch.missing_slugs, batch.missing_ids) == (["nope"], [-1])
+    assert sorted(ingredient.name for ingredient in batch.ingredients) == [
+        "curry paste",
+        "onion",
+        "soup paste",
+        "stew paste",
+    ]
+    # Each recipe's own image, step image and paste image, plus the onion's
+    assert len(batch.images) == 10
+
+    image_ids = {image.id for image in batch.images}
+    ingredient_ids = {ingredient.id for ingredient in batch.ingredients}
+    for recipe in batch.recipes:
+        assert set(recipe.image_ids) <= image_ids
+        assert {link.ingredient_id for link in recipe.ingredients} <= ingredient_ids
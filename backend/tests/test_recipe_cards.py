@@ -0,0 +1,115 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+
+from PIL import Image
+
+from src import image_proxy, recipe_cards
+from src.image_proxy import DiskLRUCache
+from src.models import RecipePublic
+from src.recipe_cards import (get_card_pdf, instruction_markup,
+                              merged_card_pdf, recipe_content_hash,
+                              render_recipe_card, shutdown_executor)
+
+RECIPE = RecipePublic.model_validate(
+    {
+        "id": 1,
+        "title": "Chicken & Rice",
+        "slug": "chicken-and-rice",
+        "rating": 4.6,
+        "prep_time": 30,
+        "basic_ingredients": ["salt", "pepper"],
+        "ingredients": [
+            {"amount": "250g", "ingredient": {"id": 1, "name": "chicken breast"}},
+            {"amount": "130g", "ingredient": {"id": 2, "name": "basmati rice"}},
+        ],
+        "instruction_steps": [
+            {
+                "id": 1,
+                "order": 1,
+                "recipe_id": 1,
+                "text": "<p>Boil the <strong>rice</strong> & drain.</p>",
+            },
+            {
+                "id": 2,
+                "order": 2,
+                "recipe_id": 1,
+                "text": "<p>Fry the <span class='text-danger'>chicken</span>.</p>",
+            },
+        ],
+    }
+)
+
+
+def test_instruction_markup():
+    assert (
+        instruction_markup("<p>Boil <strong>rice</strong> & drain.</p><p>Serve</p>")
+        == "Boil <b>rice</b> &amp; drain.<br/>Serve"
+    )
+    assert instruction_markup("<span class='x'>Heat</span> &amp; stir") == (
+        "Heat &amp; stir"
+    )
+
+
+def test_render_recipe_card():
+    pdf = render_recipe_card(RECIPE.model_dump(), image_paths={})
+
+    reader = PdfReader(io.BytesIO(pdf))
+    assert len(reader.pages) == 1
+    assert "Chicken & Rice" in reader.pages[0].extract_text()
+
+
+def test_content_hash_changes_with_recipe():
+    changed = RECIPE.model_copy(update={"title": "Chicken & Noodles"})
+
+    assert recipe_content_hash(RECIPE) == recipe_content_hash(RECIPE.model_copy())
+    assert recipe_content_hash(RECIPE) != recipe_content_hash(changed)
+
+
+@pytest.mark.asyncio
+async def test_merged_cards_are_rendered_and_merged_in_the_pool(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setattr(recipe_cards, "_cache", DiskLRUCache(str(tmp_path), 10**7))
+    changed = RECIPE.model_copy(update={"title": "Chicken & Noodles"})
+    try:
+        data = await merged_card_pdf([RECIPE, changed])
+    finally:
+        shutdown_executor()
+
+    reader = PdfReader(io.BytesIO(data))
+    assert [page.extract_text().split("\n")[0] for page in reader.pages] == [
+        "Chicken & Rice",
+        "Chicken & Noodles",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_card_images_stay_pinned_while_rendering(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        recipe_cards, "_cache", DiskLRUCache(str(tmp_path / "pdf"), 1)
+    )
+    images = DiskLRUCache(str(tmp_path / "images"), 1)
+    monkeypatch.setattr(image_proxy, "_cache", images)
+
+    async def fake_fetch_original(url: str, key: str) -> str:
+        output = io.BytesIO()
+        Image.new("RGB", (800, 400)).save(output, "JPEG")
+        return await images.put(key, output.getvalue())
+
+    def fake_render(recipe: dict, image_paths: dict[str, str]) -> bytes:
+        # The cache is over budget, only the pin keeps the image
+        assert list(images._pinned) == [image_proxy.cache_key(url, 700, "jpeg")]
+        return b"%PDF"
+
+    monkeypatch.setattr(image_proxy, "_fetch_original", fake_fetch_original)
+    monkeypatch.setattr(recipe_cards, "render_recipe_card", fake_render)
+    monkeypatch.setattr(recipe_cards, "get_executor", lambda: None)
+
+    url = "https://example.com/main.jpg"
+    recipe = RecipePublic.model_validate(
+        {**RECIPE.model_dump(), "images": [{"id": 1, "url": url, "width": 800}]}
+    )
+    assert await get_card_pdf(recipe) == b"%PDF"
+    assert not images._pinned
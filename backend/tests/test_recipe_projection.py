@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src import main  # noqa: E402
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    TEST_DATABASE_URL is None, reason="TEST_DATABASE_URL is not set"
+)
+
+
+async def get_counting_queries(session, **projection):
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    engine = session.bind.sync_engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        recipe = await main.get_recipe_by_slug(
+            "curry", None, None, session=session, **projection
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return recipe, statements
+
+
+@pytest.mark.asyncio
+async def test_projection_loads_only_what_it_returns(catalogue_session):
+    full, full_statements = await get_counting_queries(catalogue_session)
+    tile, tile_statements = await get_counting_queries(
+        catalogue_session, fields="title,rating", include="images"
+    )
+    steps, _ = await get_counting_queries(catalogue_session, include="steps")
+
+    assert len(full.instruction_steps[0].images) == 1
+    assert tile.model_dump(exclude_unset=True).keys() == {
+        "id",
+        "title",
+        "rating",
+        "images",
+    }
+    assert tile.title == full.title and len(tile.images) == 1
+    # The recipe and its images, against one query per relationship
+    assert (len(tile_statements), len(full_statements)) == (2, 7)
+    assert "basic_ingredients" not in tile_statements[0]
+    assert steps.instruction_steps[0].model_dump(exclude_unset=True).keys() == {
+        "id",
+        "text",
+        "order",
+        "recipe_id",
+    }
+
+    with pytest.raises(HTTPException) as error:
+        await main.get_recipe_by_slug(
+            "curry", None, None, fields="title,calories", session=catalogue_session
+        )
+    assert error.value.status_code == 422
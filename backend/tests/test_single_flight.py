@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src import main  # noqa: E402
+from src.single_flight import SingleFlight  # noqa: E402
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_others():
+    group = SingleFlight("test")
+    runs = 0
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        return "done"
+
+    first = asyncio.create_task(group.run("key", work))
+    second = asyncio.create_task(group.run("key", work))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "done"
+    assert runs == 1
+    assert (group.calls, group.coalesced, group.stats().in_flight) == (2, 1, 0)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(TEST_DATABASE_URL is None, reason="TEST_DATABASE_URL is not set")
+async def test_concurrent_reads_share_one_load(catalogue_session):
+    coalesced = main._recipe_reads.coalesced
+
+    recipes = await asyncio.gather(
+        *(
+            main.get_recipe_by_slug("curry", 100, None, session=catalogue_session)
+            for _ in range(5)
+        )
+    )
+
+    assert main._recipe_reads.coalesced - coalesced == 4
+    assert all(recipe == recipes[0] for recipe in recipes)
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+from sqlalchemy import text
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from src import main  # noqa: E402
+from src.snapshot import (SNAPSHOT_TABLES, export_snapshot,  # noqa: E402
+                          import_snapshot)
+
+# Snapshots are loaded with COPY, see conftest.py
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    TEST_DATABASE_URL is None, reason="TEST_DATABASE_URL is not set"
+)
+
+
+@pytest.mark.asyncio
+async def test_imported_catalogue_is_in_the_change_log(catalogue_session, tmp_path):
+    engine = catalogue_session.bind
+    path = tmp_path / "catalogue.snapshot"
+    async with engine.begin() as connection:
+        await connection.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS alembic_version (version_num VARCHAR(32))"
+            )
+        )
+        await connection.execute(text("DELETE FROM alembic_version"))
+        await connection.execute(text("INSERT INTO alembic_version VALUES ('test')"))
+    try:
+        await export_snapshot(engine, path)
+        async with engine.begin() as connection:
+            await connection.execute(
+                text(f"TRUNCATE change_log, {', '.join(SNAPSHOT_TABLES)} CASCADE")
+            )
+
+        await import_snapshot(engine, path)
+        changes = await main.list_changes(
+            since=0, limit=100, session=catalogue_session
+        )
+    finally:
+        async with engine.begin() as connection:
+            await connection.execute(text("DROP TABLE alembic_version"))
+
+    assert sorted((change.entity, change.op) for change in changes.changes) == [
+        *[("ingredient", "upsert")] * 4,
+        *[("recipe", "upsert")] * 3,
+    ]
+    slugs = {change.data.get("slug") for change in changes.changes}
+    assert slugs == {None, "curry", "stew", "soup"}
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from src import startup
+
+
+@pytest.mark.asyncio
+async def test_ready_only_once_every_phase_succeeds(monkeypatch):
+    monkeypatch.setattr(startup, "STARTUP_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(startup, "_ready", False)
+    monkeypatch.setattr(startup, "_report", None)
+    attempts = 0
+
+    async def flaky():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise ConnectionError("database is starting up")
+
+    async def fine():
+        pass
+
+    assert startup.readiness().status == "warming_up"
+    task = asyncio.create_task(startup.warm_up([("flaky", flaky), ("fine", fine)]))
+    await asyncio.sleep(0)
+
+    report = startup.readiness()
+    assert (report.ready, report.status) == (False, "failed")
+    assert [phase.error for phase in report.phases] == [
+        "ConnectionError: database is starting up",
+        None,
+    ]
+
+    await asyncio.wait_for(task, 1)
+    report = startup.readiness()
+    assert (report.ready, report.status) == (True, "ready")
+    assert [phase.name for phase in report.phases] == ["flaky", "fine"]
@@ -2,7 +2,7 @@ import { useState, useEffect } from 'react';
 import './App.css';
 import './components/Search.css';
 import { Recipe, SearchType } from './types';
-import { getRecipeBySlug, getRecipesList, RecipeListItem, getIngredientsList, getRecipesByIngredient, Ingredient } from './services/api';
+import { getRecipeBySlug, getRecipesList, RecipeListItem, getIngredientSuggestions, getRecipesByIngredient, Ingredient } from './services/api';
 import { RecipeCard } from './components/RecipeCard';
 import { LoadingSpinner } from './components/LoadingSpinner';
 import { SearchDropdown } from './components/SearchDropdown';
@@ -11,6 +11,8 @@ import { GA_MEASUREMENT_ID } from './config';
 
 ReactGA.initialize(GA_MEASUREMENT_ID);
 
+const SUGGESTION_DEBOUNCE_MS = 150;
+
 export default function App() {
   const [searchType, setSearchType] = useState<SearchType>('url');
   const [searchQuery, setSearchQuery] = useState('');
@@ -42,17 +44,33 @@ export default function App() {
   }, []);
 
   useEffect(() => {
-    const loadIngredients = async () => {
+    const query = searchQuery.trim();
+    if (searchType !== 'ingredient' || !query) {
+      setIngredientsList([]);
+      return;
+    }
+
+    let cancelled = false;
+    const loadSuggestions = async () => {
       try {
-        const ingredients = await getIngredientsList();
-        setIngredientsList(ingredients);
+        const ingredients = await getIngredientSuggestions(query);
+        if (!cancelled) {
+          setIngredientsList(ingredients);
+        }
       } catch (err) {
-        setError(err instanceof Error ? err.message : 'Failed to load ingredients');
+        if (!cancelled) {
+          setError(err instanceof Error ? err.message : 'Failed to load ingredients');
+        }
       }
     };
 
-    loadIngredients();
-  }, []);
+    // Wait for a pause in typing, so each keystroke doesn't send a request
+    const timer = setTimeout(loadSuggestions, SUGGESTION_DEBOUNCE_MS);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchType, searchQuery]);
 
   const handleRecipeSelect = async (selectedRecipe: RecipeListItem) => {
     await handleSearch(selectedRecipe.slug);
@@ -19,9 +19,12 @@ export function SearchDropdown({ items, searchQuery, onSelect, onClose, type }:
         threshold: 0.3,
     });
 
-    const results = searchQuery
-        ? fuse.search(searchQuery).slice(0, 5)
-        : [];
+    // Ingredients come already matched and ranked by the backend
+    const results = !searchQuery
+        ? []
+        : type === 'ingredient'
+            ? items.slice(0, 5).map((item) => ({ item }))
+            : fuse.search(searchQuery).slice(0, 5);
 
     useEffect(() => {
         const handleClickOutside = (event: MouseEvent) => {
@@ -1,3 +1,2 @@
 export const BACKEND_URL = import.meta.env.VITE_BACKEND_URL;
-export const CORS_PROXY_URL = import.meta.env.VITE_CORS_PROXY_URL;
 export const GA_MEASUREMENT_ID = import.meta.env.VITE_GA_MEASUREMENT_ID;
\ No newline at end of file
@@ -50,6 +50,25 @@ export interface Ingredient {
     id: number;
 }
 
+export async function getIngredientSuggestions(query: string, limit = 5): Promise<Ingredient[]> {
+    const baseUrl = BACKEND_URL.replace(/\/+$/, '');
+    const params = new URLSearchParams({ q: query, limit: String(limit) });
+
+    const response = await fetch(`${baseUrl}/ingredients/suggest?${params}`, {
+        method: 'GET',
+        headers: {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+        },
+    });
+
+    if (!response.ok) {
+        throw new Error(`Failed to fetch ingredients: ${response.statusText}`);
+    }
+
+    return response.json();
+}
+
 export async function getIngredientsList(): Promise<Ingredient[]> {
     const baseUrl = BACKEND_URL.replace(/\/+$/, '');
 
@@ -1,4 +1,4 @@
-import { CORS_PROXY_URL } from '../config';
+import { BACKEND_URL } from '../config';
 import { RecipeImage } from '../types';
 
 export async function getProxiedImageUrl(images: RecipeImage[] | undefined, targetWidth: number = 700): Promise<string> {
@@ -11,16 +11,9 @@ export async function getProxiedImageUrl(images: RecipeImage[] | undefined, targ
         return Math.abs(curr.width - targetWidth) < Math.abs(prev.width - targetWidth) ? curr : prev;
     });
 
-    const strippedImageUrl = bestImage.url
-        .replace(/^https:\/\//, '')
-        .replace(/(\.[a-z]+)(\/|$)/, '$1:443$2');
-
-    const response = await fetch(CORS_PROXY_URL + strippedImageUrl, {
-        headers: {
-            'origin': window.location.origin,
-            'x-requested-with': 'XMLHttpRequest'
-        }
-    });
+    // The backend caches the image and resizes it to the requested width
+    const baseUrl = BACKEND_URL.replace(/\/+$/, '');
+    const response = await fetch(`${baseUrl}/images/${bestImage.id}?width=${targetWidth}`);
 
     if (!response.ok) {
         return ''; // or return a default image URL
@@ -28,4 +21,4 @@ export async function getProxiedImageUrl(images: RecipeImage[] | undefined, targ
 
     const blob = await response.blob();
     return URL.createObjectURL(blob);
-} 
\ No newline at end of file
+}
\ No newline at end of file